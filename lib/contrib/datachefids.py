@@ -84,13 +84,28 @@ def slugify(value, hyphenate=True, lower=True):
 
 FROM_EMPTY_64BIT_HASH = 'AAAAAAAAAAA'
 
+
+class idseed(str):
+    '''
+    String which, sent to idgen, restarts its made up ID sequence based on the seed.
+    Use e.g. to make IDs independent of the position of a record in the stream
+    '''
+    pass
+
+
+#Sent to idgen, gets its state, as (tint, counter), without affecting it
+IDGEN_STATE = object()
+
+
 #from datachef.ids import simple_hashstring
 @coroutine
-def idgen(idbase, tint=None, bits=64):
+def idgen(idbase, tint=None, bits=64, state=None):
     '''
     Generate an IRI as a hash of given information, or just make one up if None given
     idbase -- Base URI for generating links
     tint -- String that affects the sequence of IDs generated if sent None
+    state -- State of another generator, got by sending it IDGEN_STATE. This one carries on
+             its sequence of made up IDs, e.g. when resuming an interrupted run
 
     >>> from bibframe.contrib.datachefids import idgen
     >>> g = idgen(None)
@@ -108,10 +123,28 @@ def idgen(idbase, tint=None, bits=64):
     'xQAd4Guk040'
     >>> g.send('')
     'AAAAAAAAAAA'
+    >>> g.send(idseed('rec1'))
+    >>> next(g)
+    '87sCsP4knNc'
+    >>> g.send(idseed('rec1'))
+    >>> next(g)
+    '87sCsP4knNc'
+    >>> next(idgen(None, state=g.send(IDGEN_STATE))) == next(g)
+    True
     '''
-    counter = -1
+    #The counter goes up before each ID but the first, made up on priming the coroutine
+    counter = -1 if state is None else state[1] - 1
+    if state is not None: tint = state[0]
     to_hash = None
     while True:
+        if to_hash is IDGEN_STATE:
+            to_hash = yield (tint, counter)
+            continue
+        if isinstance(to_hash, idseed):
+            #Start the sequence of made up IDs afresh
+            tint, counter = to_hash, 0
+            to_hash = yield None
+            continue
         if to_hash is None:
             to_hash = str(counter)
             if tint: to_hash += tint
@@ -0,0 +1,242 @@
+'''
+Compact stores for the set of resource IDs already generated in a conversion run (existing_ids),
+which decides what gets folded. Plugged in with the existing-ids-cls config option
+
+A plain Python set of ID strings costs over 100 bytes per resource, which adds up to several GB
+on a full catalog. packed_id_set keeps just the 64-bit hash each ID was made from (see
+bibframe.contrib.datachefids.simple_hashstring), in an open addressing table of 8 byte slots,
+which can spill to a memory mapped temporary file once it gets big. An optional Bloom filter in
+front answers most checks for IDs not yet seen without touching the table.
+
+The IDs themselves can't be recovered, so these stores can only be added to & checked.
+'''
+
+import re
+import mmap
+import math
+import binascii
+import tempfile
+from array import array
+
+from versa.contrib.datachefids import mmh3
+
+#Number of IDs a store is sized for to start with. It grows as needed
+DEFAULT_CAPACITY = 1 << 16
+#Fraction of the table slots used before it's doubled in size
+MAX_LOAD = 0.6
+#Bloom filter false positive rate at the expected number of IDs
+DEFAULT_BLOOM_ERROR = 0.01
+
+#Last part of an ID from idgen: 64 bits of URL-safe base64 without padding, the last character's
+#spare bits zero. Anything else (e.g. other encodings of the same bits) is hashed as a whole
+HASH_TAIL_LEN = 11
+HASH_TAIL_PAT = re.compile('[A-Za-z0-9_-]{10}[AEIMQUYcgkosw048]\\Z')
+
+
+def decode_hash_tail(tail):
+    '''
+    Return the signed 64-bit integer encoded in the last part of an ID from idgen
+
+    >>> from bibframe.contrib.datachefids import simple_hashstring
+    >>> decode_hash_tail(simple_hashstring('spam')) == mmh3.hash64('spam')[0]
+    True
+    '''
+    #Rather quicker than base64.urlsafe_b64decode
+    return int.from_bytes(binascii.a2b_base64(tail.replace('-', '+').replace('_', '/') + '='), 'big', signed=True)
+
+
+class bloom_filter(object):
+    '''
+    Bloom filter of 64-bit integer keys, which are assumed to be hash values already
+
+    >>> b = bloom_filter(1000)
+    >>> b.add(12345)
+    >>> 12345 in b, 54321 in b
+    (True, False)
+    '''
+    def __init__(self, capacity, error_rate=DEFAULT_BLOOM_ERROR):
+        '''
+        capacity - expected number of keys
+        error_rate - false positive rate at that number of keys
+        '''
+        nbits = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 64)
+        self._nbits = nbits
+        self._nhashes = max(int(round(nbits / capacity * math.log(2))), 1)
+        self._bits = bytearray((nbits + 7) // 8)
+        return
+
+    #Bit positions come from double hashing, using the two halves of the key
+
+    def add(self, key):
+        bits, nbits = self._bits, self._nbits
+        pos, step = (key & 0xffffffff) % nbits, ((key >> 32) & 0xffffffff) | 1
+        for i in range(self._nhashes):
+            bits[pos >> 3] |= 1 << (pos & 7)
+            pos = (pos + step) % nbits
+        return
+
+    def __contains__(self, key):
+        bits, nbits = self._bits, self._nbits
+        pos, step = (key & 0xffffffff) % nbits, ((key >> 32) & 0xffffffff) | 1
+        for i in range(self._nhashes):
+            if not bits[pos >> 3] & (1 << (pos & 7)): return False
+            pos = (pos + step) % nbits
+        return True
+
+
+class packed_id_set(object):
+    '''
+    Set of resource IDs kept as packed 64-bit hashes, for use as existing_ids
+
+    >>> from bibframe.contrib.datachefids import idgen
+    >>> ids = idgen('http://example.org/')
+    >>> s = packed_id_set(capacity=2, bloom=True, spill_bytes=0)
+    >>> for text in ('spam', 'eggs', 'ham', 'toast'): s.add(ids.send(text))
+    >>> ids.send('eggs') in s, ids.send('bacon') in s, 'http://example.org/not-a-hash' in s
+    (True, False, False)
+    >>> len(s)
+    4
+    >>> import pickle
+    >>> copy = pickle.loads(pickle.dumps(s))
+    >>> ids.send('ham') in copy, ids.send('bacon') in copy, len(copy)
+    (True, False, 4)
+    >>> copy.close()
+    >>> s.close()
+    '''
+    def __init__(self, capacity=DEFAULT_CAPACITY, bloom=False, bloom_error=DEFAULT_BLOOM_ERROR,
+                    spill_bytes=None, directory=None):
+        '''
+        capacity - number of IDs expected. The store grows beyond this as needed, but that's costly
+                (and it's all the Bloom filter is sized for)
+        bloom - if True check a Bloom filter before the table
+        bloom_error - false positive rate of the Bloom filter at capacity
+        spill_bytes - size in bytes from which the table is kept in a memory mapped temporary file
+                rather than in memory. If None it's always in memory
+        directory - where to put the temporary file, if not the system default
+        '''
+        self._spill_bytes = spill_bytes
+        self._directory = directory
+        self._file = self._mmap = None
+        size = 1
+        while size * MAX_LOAD < capacity: size <<= 1
+        self._table = self._new_table(size)
+        self._mask = size - 1
+        self._limit = int(size * MAX_LOAD)
+        self._count = 0
+        #0 marks empty slots, so that key is tracked separately
+        self._has_zero = False
+        self._bloom = bloom_filter(capacity, bloom_error) if bloom else None
+        #Base of the IDs, prefixed to their hashes (i.e. entbase)
+        self._prefix = None
+        return
+
+    def _new_table(self, size):
+        '''
+        Return a table of size zeroed 64-bit slots, in memory or memory mapped
+        '''
+        nbytes = size * 8
+        if self._spill_bytes is None or nbytes < self._spill_bytes:
+            return array('q', bytes(nbytes))
+        f = tempfile.TemporaryFile(dir=self._directory)
+        f.truncate(nbytes)
+        mm = mmap.mmap(f.fileno(), nbytes)
+        self._file, self._mmap = f, mm
+        return memoryview(mm).cast('q')
+
+    def key(self, eid):
+        '''
+        Return the 64-bit integer for an ID: the hash it was made from, if it's from the ID generator,
+        otherwise a hash of the whole thing
+        '''
+        tail = eid[-HASH_TAIL_LEN:]
+        if HASH_TAIL_PAT.match(tail):
+            prefix = eid[:-HASH_TAIL_LEN]
+            if self._prefix is None: self._prefix = prefix
+            if prefix == self._prefix: return decode_hash_tail(tail)
+        return mmh3.hash64(eid)[0]
+
+    def _slot(self, key):
+        #Linear probing. The keys are hashes already, so the low bits will do as the start
+        table, mask = self._table, self._mask
+        i = key & mask
+        while True:
+            k = table[i]
+            if k == key or k == 0: return i
+            i = (i + 1) & mask
+
+    def __contains__(self, eid):
+        key = self.key(eid)
+        if key == 0: return self._has_zero
+        if self._bloom is not None and key not in self._bloom: return False
+        return self._table[self._slot(key)] == key
+
+    def add(self, eid):
+        key = self.key(eid)
+        if key == 0:
+            if not self._has_zero:
+                self._has_zero = True
+                self._count += 1
+            return
+        if self._bloom is not None: self._bloom.add(key)
+        i = self._slot(key)
+        if self._table[i] == 0:
+            self._table[i] = key
+            self._count += 1
+            if self._count > self._limit: self._grow()
+        return
+
+    def update(self, eids):
+        for eid in eids: self.add(eid)
+        return
+
+    def _grow(self):
+        old = self._table
+        old_mmap, old_file = self._mmap, self._file
+        #Keep the old mapping open while copying over
+        self._mmap = self._file = None
+        size = (self._mask + 1) * 2
+        self._table = self._new_table(size)
+        self._mask = size - 1
+        self._limit = int(size * MAX_LOAD)
+        for k in old:
+            if k: self._table[self._slot(k)] = k
+        release(old, old_mmap, old_file)
+        return
+
+    def __len__(self):
+        return self._count
+
+    #Pickled (e.g. in a checkpoint) with the table as plain bytes, since a memory mapped one can't be
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_table'] = self._table.tobytes()
+        state['_file'] = state['_mmap'] = None
+        return state
+
+    def __setstate__(self, state):
+        data = state.pop('_table')
+        self.__dict__.update(state)
+        self._table = self._new_table(len(data) // 8)
+        self._table[:] = memoryview(data).cast('q') if isinstance(self._table, memoryview) else array('q', data)
+        return
+
+    def close(self):
+        '''
+        Free up the table, including any temporary file. The store can't be used afterwards
+        '''
+        release(self._table, self._mmap, self._file)
+        self._table = self._mmap = self._file = None
+        return
+
+
+def release(table, mm, f):
+    '''
+    Free up a table, and the memory mapped file behind it if any
+    '''
+    #The view on a memory map has to go before the map can be closed
+    if isinstance(table, memoryview): table.release()
+    if mm is not None:
+        mm.close()
+        f.close()
+    return
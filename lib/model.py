@@ -0,0 +1,133 @@
+'''
+Versa in-memory model with indexes, for the match-heavy parts of the processing
+
+versa.driver.memory.connection.match is a linear scan of all links, so anything
+which looks up each resource in turn (writers, labelizer, MARC field lookup) is
+quadratic in the size of the model. indexed_connection keeps the links in the
+same list, plus indexes by origin, by relationship and by (origin, relationship)
+which are maintained on add & remove. Results, including order, are the same.
+'''
+
+from versa.driver import memory
+from versa import ORIGIN, RELATIONSHIP, TARGET, ATTRIBUTES
+
+#Full name of the Versa model class used by default for conversion (see the versa-model-cls config option)
+DEFAULT_MODEL_CLS = 'bibframe.model.indexed_connection'
+
+
+class indexed_connection(memory.connection):
+    '''
+    Drop-in replacement for versa.driver.memory.connection with indexed match
+
+    >>> from versa import I
+    >>> m = indexed_connection()
+    >>> m.add_many([('a', I('http://example.org/r'), 'x', {}), ('b', I('http://example.org/r'), 'y', {}),
+    ...     ('a', I('http://example.org/s'), 'z', {})])
+    >>> list(m.match('a'))
+    [('a', I(http://example.org/r), 'x', {}), ('a', I(http://example.org/s), 'z', {})]
+    >>> list(m.match(None, I('http://example.org/r'), 'y'))
+    [('b', I(http://example.org/r), 'y', {})]
+    '''
+    def copy(self, contents=True):
+        '''Create a copy of this model, optionally without contents (i.e. just configuration)'''
+        cp = indexed_connection(self._baseiri, self._attr_cls, self._logger)
+        if contents: cp.add_many(self._relationships)
+        return cp
+
+    def create_space(self):
+        '''Set up a new table space for the first time'''
+        super().create_space()
+        self._reindex()
+        return
+
+    def _reindex(self):
+        #Index lists are only ever appended to or replaced wholesale, never changed otherwise,
+        #so a match in progress carries on with a consistent view, as with a scan of the old list
+        self._by_origin = {}
+        self._by_rel = {}
+        self._by_origin_rel = {}
+        for ix, link in enumerate(self._relationships):
+            self._index(ix, link)
+        return
+
+    def _index(self, ix, link):
+        o, r = link[ORIGIN], link[RELATIONSHIP]
+        self._by_origin.setdefault(o, []).append(ix)
+        self._by_rel.setdefault(r, []).append(ix)
+        self._by_origin_rel.setdefault((o, r), []).append(ix)
+        return
+
+    def _candidates(self, origin, rel):
+        '''
+        Return list of positions of links to be checked against the pattern, or None to scan all of them
+        '''
+        #Same as the linear scan, a false value for a component matches anything
+        if origin and rel:
+            return self._by_origin_rel.get((origin, rel), [])
+        elif origin:
+            return self._by_origin.get(origin, [])
+        elif rel:
+            return self._by_rel.get(rel, [])
+        return None
+
+    def match(self, origin=None, rel=None, target=None, attrs=None, include_ids=False):
+        '''
+        Retrieve an iterator of relationship IDs that match a pattern of components
+
+        origin - (optional) origin of the relationship (similar to an RDF subject). If omitted any origin will be matched.
+        rel - (optional) type IRI of the relationship (similar to an RDF predicate). If omitted any relationship will be matched.
+        target - (optional) target of the relationship (similar to an RDF object), a boolean, floating point or unicode object. If omitted any target will be matched.
+        attrs - (optional) attribute mapping of relationship metadata, i.e. {attrname1: attrval1, attrname2: attrval2}. If any attribute is specified, an exact match is made (i.e. the attribute name and value must match).
+        include_ids - If true include statement IDs with yield values
+        '''
+        candidates = self._candidates(origin, rel)
+        if candidates is None:
+            yield from super().match(origin, rel, target, attrs, include_ids)
+            return
+
+        relationships = self._relationships
+        for index in candidates:
+            curr_rel = relationships[index]
+            if target and target != curr_rel[TARGET]:
+                continue
+            if attrs and any(( k not in curr_rel[ATTRIBUTES] or curr_rel[ATTRIBUTES].get(k) != v
+                                for k, v in attrs.items() )):
+                continue
+            if include_ids:
+                yield index, (curr_rel[0], curr_rel[1], curr_rel[2], curr_rel[3].copy())
+            else:
+                yield (curr_rel[0], curr_rel[1], curr_rel[2], curr_rel[3].copy())
+        return
+
+    def add(self, origin, rel, target, attrs=None, index=None):
+        '''
+        Add one relationship to the extent
+
+        origin - origin of the relationship (similar to an RDF subject)
+        rel - type IRI of the relationship (similar to an RDF predicate)
+        target - target of the relationship (similar to an RDF object), a boolean, floating point or unicode object
+        attrs - optional attribute mapping of relationship metadata, i.e. {attrname1: attrval1, attrname2: attrval2}
+        index - optional position for the relationship to be inserted
+        '''
+        rid = super().add(origin, rel, target, attrs, index)
+        if index is not None:
+            #Positions after the insertion have all shifted
+            self._reindex()
+        else:
+            self._index(rid, self._relationships[rid])
+        return rid
+
+    def remove(self, index):
+        '''
+        Delete one or more relationship, by index, from the extent
+
+        index - either a single index or a list of indices
+        '''
+        super().remove(index)
+        self._reindex()
+        return
+
+    def close(self):
+        super().close()
+        self._reindex()
+        return
@@ -0,0 +1,152 @@
+'''
+Opt-in instrumentation of MARC conversion: call counts & cumulative time for each transform
+(by match key), special transform, plug-in task, resource materialization & ID hash,
+and for the phases of processing each record
+
+A profiler is threaded through the per-record processing parameters (params['profiler']).
+When there's none, the instrumented code just checks for it and goes on as usual.
+
+Times are inclusive, e.g. a transform's time includes that of the resources it materializes,
+and a phase's time includes that of all its transforms.
+'''
+
+import json
+from time import perf_counter
+from collections import OrderedDict
+
+from bibframe import BF_INPUT_TASK, BF_INPUT_XREF_TASK, BF_MARCREC_TASK, BF_MATRES_TASK, BF_FINAL_TASK
+
+#Short names for plug-in tasks, as used in the report
+TASK_NAMES = {
+    BF_INPUT_TASK: 'input-model',
+    BF_INPUT_XREF_TASK: 'input-xref-model',
+    BF_MARCREC_TASK: 'marcrec',
+    BF_MATRES_TASK: 'materialize-resource',
+    BF_FINAL_TASK: 'final',
+}
+
+
+class profiler(object):
+    '''
+    Accumulates call counts & cumulative time, by category & key
+
+    >>> p = profiler()
+    >>> p.add('transforms', '245$a', 0.5)
+    >>> p.add('transforms', '245$a', 0.25)
+    >>> p.add('transforms', '100$a', 1.0)
+    >>> print(json.dumps(p.report()))
+    {"transforms": {"100$a": {"calls": 1, "seconds": 1.0}, "245$a": {"calls": 2, "seconds": 0.75}}}
+    '''
+    def __init__(self):
+        #category -> key -> [calls, seconds]
+        self._stats = {}
+        return
+
+    def add(self, category, key, elapsed):
+        '''
+        Record a call
+
+        category - kind of thing called, e.g. 'transforms'
+        key - what in particular was called, e.g. a transform's match key
+        elapsed - time taken in seconds
+        '''
+        stats = self._stats.setdefault(category, {})
+        entry = stats.get(key)
+        if entry is None:
+            stats[key] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+        return
+
+    def lap(self, category, key, start):
+        '''
+        Record a call which began at the given perf_counter() time and ended just now.
+        Returns the time now, so that successive steps can be timed in turn
+        '''
+        now = perf_counter()
+        self.add(category, key, now - start)
+        return now
+
+    def timer(self, category, key):
+        '''
+        Return a context manager which records a call taking the time spent within it
+        '''
+        return _timer(self, category, key)
+
+    def consume(self, category, key, items):
+        '''
+        Iterate through items (e.g. from a generator) right away, recording a call taking the time spent.
+        Returns the list of items
+        '''
+        start = perf_counter()
+        items = list(items)
+        self.add(category, key, perf_counter() - start)
+        return items
+
+    def pop_stats(self):
+        '''
+        Return the stats collected so far as plain data (e.g. to send from a worker process), and start afresh
+        '''
+        stats = { category: { key: tuple(entry) for (key, entry) in entries.items() }
+                    for (category, entries) in self._stats.items() }
+        self._stats = {}
+        return stats
+
+    def merge(self, stats):
+        '''
+        Add in stats from another profiler, as returned by its pop_stats
+        '''
+        for category, entries in stats.items():
+            ours = self._stats.setdefault(category, {})
+            for key, (calls, seconds) in entries.items():
+                entry = ours.setdefault(key, [0, 0.0])
+                entry[0] += calls
+                entry[1] += seconds
+        return
+
+    def report(self):
+        '''
+        Return the stats as a mapping from category to key to {'calls': ..., 'seconds': ...},
+        with categories in name order and their keys in descending order of time
+        '''
+        report = OrderedDict()
+        for category in sorted(self._stats):
+            entries = sorted(self._stats[category].items(), key=lambda item: (-item[1][1], str(item[0])))
+            report[category] = OrderedDict(
+                ( (str(key), OrderedDict([('calls', calls), ('seconds', round(seconds, 6))]))
+                    for (key, (calls, seconds)) in entries ))
+        return report
+
+    def write(self, out):
+        '''
+        Write out the report as JSON
+
+        out - output text stream
+        '''
+        json.dump(self.report(), out, indent=2)
+        out.write('\n')
+        return
+
+
+class _timer(object):
+    def __init__(self, profiler, category, key):
+        self._profiler = profiler
+        self._category = category
+        self._key = key
+        return
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler.add(self._category, self._key, perf_counter() - self._start)
+        return False
+
+
+def task_key(task, func):
+    '''
+    Report key for a plug-in task, e.g. 'marcrec linkreport.handle_record_links'
+    '''
+    return '{0} {1}'.format(TASK_NAMES.get(task, task), getattr(func, '__qualname__', repr(func)))
@@ -1,5 +1,6 @@
 # bibframe.reader
 
+import re
 import warnings
 
 from amara3 import iri
@@ -25,6 +26,70 @@ PHASE_NICKNAMES = {
 PYBF_BOOTSTRAP_TARGET_REL = 'http://bibfra.me/tool/pybibframe/vocab#bootstrap-target'
 
 
+#Forms of transform lookup keys, e.g. '100', '100-1#', '245$a', '100-1?$a' (? being a single char wildcard for indicators)
+TRANSFORM_KEY_PAT = re.compile(r'^([^-$]+)(?:-(..))?(?:\$(.+))?$')
+
+
+class transform_dispatch(object):
+    '''
+    Transform lookup keys compiled into a nested structure keyed by tag, then indicators, then subfield code.
+    The wildcard patterns are resolved once for each combination of tag & indicators encountered,
+    after which finding the transforms for a field is a couple of dict lookups
+
+    transforms - dict from lookup key to transform (Versa action function or tuple thereof)
+    '''
+    def __init__(self, transforms):
+        self.transforms = transforms
+        #tag -> indicator pattern (or None) -> subfield code (or None) -> (transform, lookup key)
+        self._bytag = {}
+        for key, funcinfo in transforms.items():
+            matched = TRANSFORM_KEY_PAT.match(key)
+            #Keys in any other form never match
+            if not matched: continue
+            tag, inds, code = matched.groups()
+            self._bytag.setdefault(tag, {}).setdefault(inds, {})[code] = (funcinfo, key)
+        #Tags for which there are any transforms
+        self.tags = frozenset(self._bytag)
+        self._resolved = {}
+        self._dropped = {}
+        return
+
+    def resolve(self, tag, ind1, ind2):
+        '''
+        Transforms for a field with the given tag and indicators ('#' for blank)
+
+        Returns a tuple of a dict from subfield code to the list of matching (transform, lookup key)
+        for that subfield, the list of matching (transform, lookup key) for the field as a whole,
+        and whether there are any transforms for the plain tag. Most specific matches come first
+        '''
+        try:
+            return self._resolved[tag, ind1, ind2]
+        except KeyError:
+            pass
+        bypattern = self._bytag.get(tag, {})
+        patterns = [ bypattern.get(p, {}) for p in (ind1 + ind2, '?' + ind2, ind1 + '?', None) ]
+        subfield_matches = {}
+        for bycode in patterns:
+            for code, match in bycode.items():
+                if code is not None: subfield_matches.setdefault(code, []).append(match)
+        tag_matches = [ bycode[None] for bycode in patterns if None in bycode ]
+        resolved = self._resolved[tag, ind1, ind2] = (subfield_matches, tag_matches, tag in self.transforms)
+        return resolved
+
+    def dropped(self, tag, ind1, ind2, code):
+        '''
+        Lookup keys reported as dropped for a subfield without transforms, i.e. the specific
+        & plain ones (not the wildcards) which don't match
+        '''
+        try:
+            return self._dropped[tag, ind1, ind2, code]
+        except KeyError:
+            pass
+        lookups = ['{0}-{1}{2}${3}'.format(tag, ind1, ind2, code), '{0}${1}'.format(tag, code)]
+        dropped = self._dropped[tag, ind1, ind2, code] = [ l for l in lookups if l not in self.transforms ]
+        return dropped
+
+
 class transform_set(object):
     def __init__(self, tspec=None, specials_vocab=None):
         self.orderings = None
@@ -69,6 +134,7 @@ class transform_set(object):
                     self.iris[BOOTSTRAP_PHASE] = WORK_HASH_TRANSFORMS_ID
                     self.compiled[BOOTSTRAP_PHASE] = WORK_HASH_TRANSFORMS
         #raise(Exception(repr(self.iris)))
+        self.dispatch = { phase: transform_dispatch(t) for phase, t in self.compiled.items() }
         self.specials=special_transforms(specials_vocab)
 
 def force_tuple(val):
@@ -90,7 +156,7 @@ def merge_transform_lookups(lookups1, lookups2):
 
 
 #XXX: Deferred because of circular imports. True fix is to move above to subordinate module, but shhh! ;)
-from .engine import bfconvert
+from .engine import bfconvert, converter
 from .marcpatterns import TRANSFORMS as DEFAULT_TRANSFORMS
 from .marcworkidpatterns import WORK_HASH_TRANSFORMS, WORK_HASH_TRANSFORMS_ID, WORK_HASH_INPUT
 from .util import AVAILABLE_TRANSFORMS
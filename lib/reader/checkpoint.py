@@ -0,0 +1,208 @@
+'''
+Checkpoints of a long conversion run, from which it can be resumed after being interrupted,
+with the same output as if it had run straight through
+
+Every so many records (once each is completely done & written out) the state of the run is saved:
+the source & number of records read from it, the count of records processed towards any limit,
+the state of the made up ID sequence, the IDs of resources generated so far (which decide what gets folded),
+the incremental conversion store if any, and how far each output stream has got.
+
+On resuming, the output streams are cut back to where they were at the checkpoint, sources already done
+are passed over, and the records of the current source are read again but only passed on for conversion
+from where the checkpoint left off, so that the MARC readers make up the same record IDs as before.
+
+Only serial conversion to Versa JSON (array or NDJSON), Turtle and N-Triples is supported, the other outputs
+being written all at the end. Plug-ins' own state isn't checkpointed, so e.g. a report from a final task
+only covers the records converted since resuming.
+
+The checkpoint file is pickled, and replaced only once it's all written.
+'''
+
+import os
+import pickle
+
+from bibframe.contrib.datachefids import IDGEN_STATE
+
+CHECKPOINT_FORMAT = 'http://bibfra.me/tool/pybibframe/checkpoint'
+CHECKPOINT_VERSION = 1
+
+#Default number of records converted between checkpoints
+CHECKPOINT_EVERY = 10000
+
+
+class checkpointer(object):
+    '''
+    Takes checkpoints of a serial conversion run as its records are done, and resumes from one
+    '''
+    def __init__(self, fname, every=CHECKPOINT_EVERY, resume=False):
+        '''
+        fname - checkpoint file
+        every - number of records converted between checkpoints
+        resume - if True carry on from the checkpoint in the file. If there isn't one (e.g. the run
+                was interrupted before the first checkpoint) start from the beginning
+        '''
+        self.fname = fname
+        self.every = every
+        self._resume = resume
+        self.state = checkpointer.load(fname) if resume and os.path.exists(fname) else None
+        self._resume_source = self.state['source'] if self.state else None
+        self._streams = {}
+        self._writers = []
+        self._limiting = self._ids = self._store = None
+        #Of the source being read, its index, the number of records read & the number to skip as already done
+        self._source = -1
+        self._read = self._skip = 0
+        #Of the record handler for the source
+        self._existing_ids = self._jsonw = None
+        self._since = 0
+        self.saved = 0
+        return
+
+    @property
+    def resuming(self):
+        return self.state is not None
+
+    @staticmethod
+    def load(fname):
+        '''
+        Return the state from a checkpoint file
+        '''
+        with open(fname, 'rb') as f:
+            state = pickle.load(f)
+        if not isinstance(state, dict) or state.get('format') != CHECKPOINT_FORMAT or state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError('Not a conversion checkpoint, or an unsupported version of one')
+        return state
+
+    def track(self, streams, writers, limiting, ids, store=None):
+        '''
+        Register the state of the run to be checkpointed. When resuming it's first restored from the checkpoint,
+        with each output stream cut back to its position then
+
+        streams - mapping from name to output stream, e.g. {'out': ..., 'rdfnt': ...}. They must be seekable
+        writers - list of RDF stream writers (see bibframe.writer.rdfstream)
+        limiting - mutable pair of [count, limit] used to control the number of records processed
+        ids - resource ID generator, a bibframe.util.cached_idgen. If resuming it should have been created from the checkpoint's ID state
+        store - incremental conversion fingerprint store, if any. If resuming it should be the checkpoint's
+        '''
+        for name, stream in streams.items():
+            if not stream.seekable():
+                raise ValueError('Checkpoints need output written to files, but {0} isn\'t'.format(name))
+        if self.state:
+            if set(streams) != set(self.state['streams']) or len(writers) != len(self.state['writers']):
+                raise ValueError('The outputs aren\'t the same as for the run which was checkpointed')
+            for name, stream in streams.items():
+                pos = self.state['streams'][name]
+                stream.seek(0, os.SEEK_END)
+                if stream.tell() < pos:
+                    raise ValueError('Output {0} is shorter than when the checkpoint was taken'.format(name))
+                stream.seek(pos)
+                stream.truncate()
+            for writer, wstate in zip(writers, self.state['writers']):
+                writer.resume(wstate)
+            limiting[0] = self.state['limiting']
+        elif self._resume:
+            #Nothing to resume from, as the run was interrupted before its first checkpoint, so start afresh
+            for stream in streams.values():
+                stream.seek(0)
+                stream.truncate()
+        self._streams, self._writers, self._limiting, self._ids, self._store = streams, writers, limiting, ids, store
+        return
+
+    def skip_source(self, index):
+        '''
+        Return True if the source (by its index among the inputs) was all done before the checkpoint
+        '''
+        return self._resume_source is not None and index < self._resume_source
+
+    def records(self, sink, index):
+        '''
+        Coroutine which counts the records of a source on the way to the sink, and when resuming
+        skips those done before the checkpoint. Can be given to a MARC handler in place of the sink
+
+        sink - coroutine to be sent the records to be converted, e.g. from bibframe.reader.marc.record_handler
+        index - index of the source among the inputs
+        '''
+        self._source, self._read = index, 0
+        self._skip = self.state['records'] if index == self._resume_source else 0
+        next(sink) #Start the coroutine running
+        try:
+            while True:
+                input_model = yield
+                self._read += 1
+                if self._read <= self._skip: continue
+                try:
+                    sink.send(input_model)
+                except StopIteration:
+                    #The sink declined any more records (e.g. the limit was reached), so decline too
+                    return
+        finally:
+            sink.close()
+        return
+
+    def start_handler(self, existing_ids, jsonw):
+        '''
+        Called by a record handler as it starts on a source. Returns the IDs of resources already generated
+        to use, and whether the Versa JSON output was resumed from the checkpoint (so mustn't be started afresh)
+
+        existing_ids - the handler's own, empty store of IDs of resources already generated
+        jsonw - the handler's bibframe.writer.versajson.versajson_writer, or None
+        '''
+        resumed = self._source == self._resume_source
+        if resumed:
+            existing_ids = self.state['existing_ids']
+            if jsonw: jsonw.resume(self.state['jsonw'])
+            #Only the one source picks up from the checkpoint
+            self._resume_source = None
+        self._existing_ids, self._jsonw = existing_ids, jsonw
+        return existing_ids, resumed
+
+    def due(self):
+        '''
+        Return True if a checkpoint will be taken when the next record is done
+        '''
+        return self._since + 1 >= self.every
+
+    def record_done(self):
+        '''
+        Called by the record handler once a record is done & its output written, to take a checkpoint when due
+        '''
+        self._since += 1
+        if self._since >= self.every:
+            self.save()
+        return
+
+    def save(self):
+        '''
+        Take a checkpoint now
+        '''
+        positions = {}
+        for name, stream in self._streams.items():
+            stream.flush()
+            positions[name] = stream.tell()
+        state = {
+            'format': CHECKPOINT_FORMAT,
+            'version': CHECKPOINT_VERSION,
+            'source': self._source,
+            'records': self._read,
+            'limiting': self._limiting[0],
+            'ids': self._ids.send(IDGEN_STATE),
+            'existing_ids': self._existing_ids,
+            'jsonw': self._jsonw.state() if self._jsonw else None,
+            'writers': [ w.state() for w in self._writers ],
+            'store': self._store,
+            'streams': positions,
+        }
+        tmpname = self.fname + '.tmp'
+        with open(tmpname, 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, self.fname)
+        self._since = 0
+        self.saved += 1
+        return
+
+    def finish(self):
+        '''
+        Called once the run is complete. The checkpoint is removed, so there's nothing to resume
+        '''
+        if os.path.exists(self.fname): os.remove(self.fname)
+        return
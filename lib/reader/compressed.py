@@ -0,0 +1,189 @@
+'''
+Transparent handling of compressed & archived input sources
+
+gzip, bzip2 & xz streams and zip archives are recognized by their magic bytes, regardless of
+file name, and decompressed on the fly. Each member of a zip archive becomes a separate source.
+Decompression runs in a background thread, reading ahead a bounded number of chunks, so it
+overlaps with parsing (zlib, bz2 & lzma all release the GIL while they work)
+'''
+
+import io
+import bz2
+import gzip
+import lzma
+import queue
+import shutil
+import zipfile
+import tempfile
+import threading
+
+from amara3.inputsource import inputsource
+
+#Size of the chunks read from the decompressor by the background thread
+CHUNK_SIZE = 1 << 16
+#Number of decompressed chunks the background thread reads ahead
+READ_AHEAD = 16
+
+#(magic bytes, function to open a decompressing stream from a binary stream)
+COMPRESSED_FORMATS = [
+    (b'\x1f\x8b', lambda s: gzip.GzipFile(fileobj=s, mode='rb')),
+    (b'BZh', lambda s: bz2.BZ2File(s, mode='rb')),
+    (b'\xfd7zXZ\x00', lambda s: lzma.LZMAFile(s, mode='rb')),
+]
+#Local file header, or end of central directory record for an empty archive
+ZIP_MAGIC = (b'PK\x03\x04', b'PK\x05\x06')
+MAGIC_LEN = 6
+
+
+def peek_magic(stream):
+    '''
+    Return the first few bytes of the binary stream without consuming them,
+    or None if that's not possible (e.g. a text stream, or one which can neither peek nor seek)
+    '''
+    if isinstance(stream, io.TextIOBase): return None
+    if hasattr(stream, 'peek'):
+        return stream.peek(MAGIC_LEN)[:MAGIC_LEN]
+    if hasattr(stream, 'seekable') and stream.seekable():
+        pos = stream.tell()
+        magic = stream.read(MAGIC_LEN)
+        stream.seek(pos)
+        return magic
+    return None
+
+
+class threaded_reader(io.RawIOBase):
+    '''
+    Raw binary stream which reads from another stream in a background thread, keeping a bounded
+    number of chunks ready. Wrap in io.BufferedReader for efficient small reads
+
+    >>> r = io.BufferedReader(threaded_reader(io.BytesIO(b'spam' * 3), chunk_size=5))
+    >>> r.read()
+    b'spamspamspam'
+    >>> r.close()
+    '''
+    def __init__(self, stream, chunk_size=CHUNK_SIZE, read_ahead=READ_AHEAD):
+        '''
+        stream - binary stream to be read, which is closed along with this one
+        chunk_size - size of each read from the stream
+        read_ahead - maximum number of chunks read before they're consumed
+        '''
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(read_ahead)
+        self._pending = memoryview(b'')
+        self._eof = False
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+        return
+
+    def _fill(self):
+        try:
+            while not self._stopping.is_set():
+                chunk = self._stream.read(self._chunk_size)
+                self._put(chunk)
+                if not chunk: break
+        except Exception as e:
+            #To be raised for whoever's reading this stream
+            self._put(e)
+        return
+
+    def _put(self, item):
+        #Don't block forever if the stream is closed before being read to the end
+        while not self._stopping.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        return
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._pending:
+            if self._eof: return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._pending = memoryview(item)
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stopping.set()
+            self._thread.join()
+            self._stream.close()
+        super().close()
+        return
+
+
+def threaded_stream(stream):
+    '''
+    Return a buffered binary stream of the content of the given one, e.g. a decompressor, read in a background thread
+    '''
+    return io.BufferedReader(threaded_reader(stream), buffer_size=CHUNK_SIZE)
+
+
+def expand_sources(sources):
+    '''
+    Yield the inputsources to be processed for each of the given ones, i.e. the source itself if
+    it's not compressed, a decompressing source if it is, or a source for each member of a zip archive
+    (themselves possibly compressed). Streams opened along the way are closed once the next source is requested
+
+    sources - iterable of amara3.inputsource.inputsource, with binary streams
+    '''
+    if isinstance(sources, inputsource): sources = [sources]
+    for source in sources:
+        yield from expand_source(source)
+    return
+
+
+def expand_source(source):
+    magic = peek_magic(source.stream)
+    if magic:
+        for fmt_magic, open_decompressor in COMPRESSED_FORMATS:
+            if magic.startswith(fmt_magic):
+                stream = threaded_stream(open_decompressor(source.stream))
+                try:
+                    #Compressed tar files etc. aren't supported, but a compressed zip is fine
+                    yield from expand_source(inputsource(stream, siri=source.iri))
+                finally:
+                    stream.close()
+                return
+        if magic.startswith(ZIP_MAGIC):
+            yield from expand_zip(source)
+            return
+    yield source
+    return
+
+
+def expand_zip(source):
+    stream = source.stream
+    spooled = None
+    if not (hasattr(stream, 'seekable') and stream.seekable()):
+        #Zip needs random access to get at the central directory, at the end
+        spooled = stream = tempfile.TemporaryFile()
+        shutil.copyfileobj(source.stream, spooled, CHUNK_SIZE)
+        spooled.seek(0)
+    try:
+        with zipfile.ZipFile(stream, 'r') as zf:
+            for info in zf.infolist():
+                if info.filename.endswith('/'): continue #Directory entry
+                member_iri = '{0}#{1}'.format(source.iri, info.filename) if source.iri else None
+                member = threaded_stream(zf.open(info, 'r'))
+                try:
+                    yield from expand_source(inputsource(member, siri=member_iri))
+                finally:
+                    member.close()
+    finally:
+        if spooled: spooled.close()
+    return
@@ -1,12 +1,14 @@
 '''
 '''
 
+import queue
 import asyncio
 import logging
-from collections import defaultdict
+import threading
+from collections import defaultdict, namedtuple
 import warnings
-import zipfile
 import functools
+import multiprocessing
 
 from versa import I, VERSA_BASEIRI, ORIGIN, RELATIONSHIP, TARGET, ATTRIBUTES
 from versa import util
@@ -18,23 +20,279 @@ from amara3.uxml import writer
 from bibframe import BFZ, BFLC, BL, register_service
 from bibframe import g_services
 from bibframe import BF_INIT_TASK, BF_MARCREC_TASK, BF_FINAL_TASK
-from bibframe.writer import rdf, microxml
-
-from . import marc
+from bibframe.reader.util import INSTANCE_TYPE
+from bibframe.writer import rdfstream, microxml
+from bibframe.writer.canonical import canonical_writer
+from bibframe.model import DEFAULT_MODEL_CLS
+from bibframe.util import cached_idgen, ID_CACHE_SIZE
+from bibframe import profiling
+
+from . import marc, parallel
 from . import transform_set
-from .marcxml import handle_marcxml_source
+from .marcxml import handle_marcxml_source, handle_marcxml_lxml_source
+from .iso2709 import handle_iso2709_source
+from .marcjson import handle_marcjson_source
+from .compressed import expand_sources
+from .incremental import fingerprint_store, skip_unchanged
+from .checkpoint import checkpointer, CHECKPOINT_EVERY
+from .plugintasks import plugin_tasks as plugin_tasks_cls
 
 NSSEP = ' '
 
 #PYTHONASYNCIODEBUG = 1
 
+#Number of MARC records read ahead of the consumer by converter.iterconvert
+RECORD_READ_AHEAD = 16
+
+#Result of converting one MARC record, from converter.iterconvert
+#record_id - ID of the record from the MARC reader
+#work_id - ID of the work (or other main resource, if a specialized transform phase applied)
+#instance_ids - list of IDs of the instances
+#links - list of (origin, rel, target, attributes) links generated from the record
+record_result = namedtuple('record_result', ['record_id', 'work_id', 'instance_ids', 'links'])
+
+
+def resolve_class(fullname):
+    '''
+    Given a full name for a Python class, return the class object
+    '''
+    import importlib
+    modpath, name = fullname.rsplit('.', 1)
+    module = importlib.import_module(modpath)
+    cls = getattr(module, name)
+    return cls
+
+
+class converter(object):
+    '''
+    Conversion session which does all the setup from the configuration just the once (transforms,
+    plug-ins, lookups, ID generator, event loop), for converting many small batches of records in turn
+
+    >>> from io import BytesIO
+    >>> conv = converter(entbase='http://example.org/')
+    >>> rec = b'<collection xmlns="http://www.loc.gov/MARC21/slim"><record><leader>01142cam  2200301 a 4500</leader>' \\
+    ...     b'<datafield tag="245" ind1="0" ind2="0"><subfield code="a">Beware of pity</subfield></datafield></record></collection>'
+    >>> model = conv.convert(BytesIO(rec))
+    >>> [ t for (o, r, t, a) in model.match(None, I(BL + 'title')) ] #Work & instance
+    ['Beware of pity', 'Beware of pity']
+    >>> conv.close()
+    '''
+    def __init__(self, config=None, entbase=None, logger=logging, loop=None,
+                    handle_marc_source=handle_marcxml_source, profiler=None):
+        '''
+        config - configuration information, as for bfconvert
+        entbase - Base IRI to be used for creating resources
+        logger - logging object for messages
+        loop - optional asyncio event loop to use. If omitted one is created, and closed along with the session
+        handle_marc_source - Function to turn a source of MARC data (e.g. XML or JSON) into the internal format for processing,
+                unless overridden by marc_record_handler in the config
+        profiler - optional bibframe.profiling.profiler to collect timings of transforms, plug-ins etc. for the records converted
+        '''
+        config = config or {}
+        self.config = config
+        self.entbase = entbase
+        self.logger = logger
+        self.profiler = profiler
+        self._own_loop = loop is None
+        self.loop = asyncio.new_event_loop() if loop is None else loop
+
+        attr_cls = resolve_class(config.get('versa-attr-cls', 'builtins.dict'))
+        model_cls = resolve_class(config.get('versa-model-cls', DEFAULT_MODEL_CLS))
+        self.model_factory = functools.partial(model_cls, attr_cls=attr_cls) #,logger=logger)
+
+        if 'marc_record_handler' in config:
+            handle_marc_source = AVAILABLE_MARC_HANDLERS[config['marc_record_handler']]
+        self.handle_marc_source = handle_marc_source
+
+        #Allow configuration of a separate base URI for vocab items (classes & properties)
+        self.vocabbase = config.get('vocab-base-uri', BL)
+        self.transforms = transform_set(config.get('transforms', []), config.get('marcspecials-vocab'))
+        self.lookups = config.get('lookups', {})
+        #Seed made up IDs per record, so they don't depend on the record's position in the inputs
+        self.seed_ids = config.get('record-seeded-ids', False)
+        #Resource IDs are cached by their unique data, in front of the hashing. See ids.hits & ids.misses
+        self.ids = cached_idgen(marc.idgen(entbase), config.get('id-cache-size', ID_CACHE_SIZE))
+        #Store for the IDs of resources already generated in a run, which decides what gets folded
+        existing_ids_cls = resolve_class(config.get('existing-ids-cls', 'builtins.set'))
+        self.existing_ids_factory = functools.partial(existing_ids_cls, **config.get('existing-ids-args', {}))
+
+        #Initialize auxiliary services (i.e. plugins)
+        self.plugins = []
+        #Where each plug-in's record & materialized resource tasks are offloaded, if anywhere (see bibframe.reader.plugintasks)
+        self.plugin_executors = []
+        for pc in config.get('plugins', []):
+            try:
+                pinfo = g_services[pc['id']]
+                self.plugins.append(pinfo)
+                pinfo[BF_INIT_TASK](pinfo, config=pc)
+            except KeyError:
+                raise Exception('Unknown plugin {0}'.format(pc['id']))
+            self.plugin_executors.append(pc.get('executor'))
+        #If not 0, bfconvert runs those plug-in tasks concurrently, with up to this many records' tasks outstanding
+        self.plugin_queue_size = config.get('plugin-queue-size', 0)
+        return
+
+    @asyncio.coroutine
+    def _transform(self, input_model, model, params):
+        ok = yield from marc.transform_record(self.loop, input_model, model, params,
+                                                model_factory=self.model_factory)
+        if ok: yield from marc.finish_record(self.loop, model, params)
+        return ok
+
+    def _convert(self, input_model, model, existing_ids):
+        '''
+        Convert one MARC record, returning the processing parameters (see marc.record_params), or None if aborted
+        '''
+        params = marc.record_params(input_model, self.entbase, self.vocabbase, self.ids, existing_ids,
+                                    self.plugins, self.transforms, self.lookups, self.logger, self.loop,
+                                    seed_ids=self.seed_ids, profiler=self.profiler)
+        ok = self.loop.run_until_complete(self._transform(input_model, model, params))
+        return params if ok else None
+
+    def _sources(self, inputs, defaultsourcetype):
+        handle_marc_source = self.handle_marc_source
+        if handle_marc_source.makeinputsource:
+            inputs = factory(inputs, defaultsourcetype=defaultsourcetype, streamopenmode=handle_marc_source.readmode)
+            inputs = expand_sources(inputs)
+        return inputs
+
+    def convert_record(self, input_model, model=None, existing_ids=None):
+        '''
+        Convert one MARC record, returning the Versa model with the output, or None if a transform
+        signalled to abort the record
+
+        input_model - Versa model representing the MARC record, as generated by the MARC readers
+        model - optional Versa model to which the output is added. If omitted a new one is created
+        existing_ids - optional set of IDs of resources already generated, e.g. by other records in the batch,
+                to be folded rather than output again. Updated with the IDs of this record's resources
+        '''
+        if model is None: model = self.model_factory()
+        existing_ids = self.existing_ids_factory() if existing_ids is None else existing_ids
+        params = self._convert(input_model, model, existing_ids)
+        return model if params is not None else None
+
+    def convert(self, inputs, limit=None, lax=False, defaultsourcetype=inputsourcetype.unknown):
+        '''
+        Convert all the MARC records from one or more sources, returning the Versa model with the output.
+        As with bfconvert, resources already generated for an earlier record are folded
+
+        inputs - One or more open file-like object, string with MARC content, or filename or IRI, as for bfconvert
+        limit - Limit the number of records processed to this number. If omitted, all records will be processed.
+        lax - If True signal to the MARC reader that relaxed syntax rules should be applied
+        defaultsourcetype - Signal indicating how best to interpret inputs to create an inputsource
+        '''
+        model = self.model_factory()
+        existing_ids = self.existing_ids_factory()
+        count = [0]
+
+        def sink():
+            while limit is None or count[0] < limit:
+                input_model = yield
+                #Any leftovers of aborted records stay in the model, as with bfconvert
+                self.convert_record(input_model, model=model, existing_ids=existing_ids)
+                count[0] += 1
+
+        for source in self._sources(inputs, defaultsourcetype):
+            if limit is not None and count[0] >= limit: break
+            self.handle_marc_source(source, sink(), dict(lax=lax), self.logger, self.model_factory)
+        return model
+
+    def iterconvert(self, inputs, limit=None, lax=False, defaultsourcetype=inputsourcetype.unknown,
+                    read_ahead=RECORD_READ_AHEAD):
+        '''
+        Convert the MARC records from one or more sources, yielding a record_result for each (aborted records are skipped).
+        As with convert, resources already generated for an earlier record are folded
+
+        The sources are read in a background thread, which stays at most read_ahead records ahead,
+        so a slow consumer holds up the reading rather than the records piling up in memory.
+        Reading stops as soon as the iteration does (e.g. on break)
+
+        inputs - One or more open file-like object, string with MARC content, or filename or IRI, as for bfconvert
+        limit - Limit the number of records processed to this number. If omitted, all records will be processed.
+        lax - If True signal to the MARC reader that relaxed syntax rules should be applied
+        defaultsourcetype - Signal indicating how best to interpret inputs to create an inputsource
+        read_ahead - maximum number of records read but not yet converted
+        '''
+        records = queue.Queue(read_ahead)
+        stopping = threading.Event()
+        done = object()
+
+        def put(item):
+            #Give up if the iteration has stopped
+            while not stopping.is_set():
+                try:
+                    records.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def sink():
+            while True:
+                input_model = yield
+                #Returning means declining any more records, which stops the MARC reader
+                if not put(input_model): return
+
+        def read():
+            try:
+                for source in self._sources(inputs, defaultsourcetype):
+                    if stopping.is_set(): break
+                    self.handle_marc_source(source, sink(), dict(lax=lax), self.logger, self.model_factory)
+            except Exception as e:
+                #To be raised for the consumer
+                put(e)
+            put(done)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        existing_ids = self.existing_ids_factory()
+        count = 0
+        try:
+            while limit is None or count < limit:
+                input_model = records.get()
+                if input_model is done: break
+                if isinstance(input_model, Exception): raise input_model
+                model = self.model_factory()
+                params = self._convert(input_model, model, existing_ids)
+                if params is None: continue
+                count += 1
+                #Instances are only determined by the default main phase
+                instance_ids = [ i for i in params['instanceids'] if i ] if INSTANCE_TYPE in params['origins'] else []
+                yield record_result(next(input_model.match())[ORIGIN], params['default-origin'], instance_ids,
+                                    [ link for (lid, link) in model ])
+        finally:
+            stopping.set()
+            reader.join()
+        return
+
+    def close(self):
+        '''
+        Run the plug-ins' final tasks, and close the event loop if it was created for this session
+        '''
+        final_tasks = [ plugin[BF_FINAL_TASK](self.loop) for plugin in self.plugins if BF_FINAL_TASK in plugin ]
+        if final_tasks:
+            self.loop.run_until_complete(asyncio.wait(final_tasks, loop=self.loop))
+        if self._own_loop: self.loop.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
 def bfconvert(inputs, handle_marc_source=handle_marcxml_source, entbase=None, model=None,
                 out=None, limit=None, rdfttl=None, rdfxml=None, xml=None, config=None,
                 verbose=False, logger=logging, loop=None, canonical=False,
-                lax=False, defaultsourcetype=inputsourcetype.unknown):
+                lax=False, defaultsourcetype=inputsourcetype.unknown, workers=None, rdfnt=None,
+                ndjson=False, session=None, profile=None, fingerprints=None, deleted=None,
+                checkpoint=None, checkpoint_every=CHECKPOINT_EVERY, resume=False):
     '''
     inputs - One or more open file-like object, string with MARC content, or filename or IRI. If filename or
-                IRI it's a good idea to indicate this via the defaultsourcetype parameter
+                IRI it's a good idea to indicate this via the defaultsourcetype parameter. Compressed (gzip, bzip2 or xz)
+                inputs are recognized & decompressed, and each member of a zip archive input is processed as a separate source
     handle_marc_source - Function to turn a source of MARC data (e.g. XML or JSON) into the internal format for processing
     entbase - Base IRI to be used for creating resources.
     model - model instance for internal use
@@ -50,33 +308,48 @@ def bfconvert(inputs, handle_marc_source=handle_marcxml_source, entbase=None, mo
     lax - If True signal to the handle_marc_source function that relaxed syntax rules should be applied
             (e.g. accept XML with namespace problems)
     defaultsourcetype - Signal indicating how best to interpret inputs to create an inputsource
+    workers - number of worker processes across which to spread record conversion. If omitted or 1,
+            records are converted in this process. Output is the same either way, but config must be picklable
+    rdfnt - stream to where RDF N-Triples output should be written
+    ndjson - if True write the raw Versa JSON output with one link per line (NDJSON), rather than as one JSON array
+    session - optional converter, to reuse its setup (transforms, plug-ins, ID generator etc.) rather than doing it all
+            again from the config. Its config, entbase & event loop are used, and the loop isn't closed
+    profile - stream to where a JSON report of the calls & cumulative time for each transform (by match key), special transform,
+            plug-in task, resource materialization & ID hash, and processing phase should be written at the end
+    fingerprints - file name of the store of record fingerprints for incremental conversion. Only records which are new or
+            changed since the run which wrote the store are converted, then the store is updated (or created)
+    deleted - stream to where the control numbers of records in the fingerprint store which didn't turn up in this run
+            should be written, one per line
+    checkpoint - file name for checkpoints of the run, taken every checkpoint_every records, from which it can be resumed
+            if interrupted. Only for serial conversion, with out, rdfttl & rdfnt as the outputs, all of them seekable files.
+            The file is removed once the run is complete
+    resume - if True carry on from the checkpoint, cutting the outputs back to where they were then. The output
+            ends up just as for an uninterrupted run (not counting plug-ins, whose state isn't checkpointed)
     '''
     #if stats:
     #    register_service(statsgen.statshandler)
 
     config = config or {}
+    prof = profiling.profiler() if profile is not None else None
+    if prof: start = profiling.perf_counter()
     if limit is not None:
         try:
             limit = int(limit)
         except ValueError:
             logger.debug('Limit must be a number, not "{0}". Ignoring.'.format(limit))
 
-    def resolve_class(fullname):
-        '''
-        Given a full name for a Python class, return the class object
-        '''
-        import importlib
-        modpath, name = fullname.rsplit('.', 1)
-        module = importlib.import_module(modpath)
-        cls = getattr(module, name)
-        return cls
-
-    attr_cls = resolve_class(config.get('versa-attr-cls', 'builtins.dict'))
+    close_loop = session is None
+    if session is None:
+        #Set up event loop if not provided
+        if not loop:
+            loop = asyncio.get_event_loop()
+        session = converter(config, entbase=entbase, logger=logger, loop=loop, handle_marc_source=handle_marc_source)
+    else:
+        #All the setup is already done, and the session's event loop is left open
+        config, entbase, loop = session.config, session.entbase, session.loop
 
-    model_factory = functools.partial(memory.connection, attr_cls=attr_cls) #,logger=logger)
-
-    if 'marc_record_handler' in config:
-        handle_marc_source = AVAILABLE_MARC_HANDLERS[config['marc_record_handler']]
+    model_factory = session.model_factory
+    handle_marc_source = session.handle_marc_source
 
     readmode = handle_marc_source.readmode
     #inputs = ( inputsource(open(i, readmode)) for i in inputs )
@@ -85,21 +358,26 @@ def bfconvert(inputs, handle_marc_source=handle_marcxml_source, entbase=None, mo
 
     if handle_marc_source.makeinputsource:
         inputs = factory(inputs, defaultsourcetype=defaultsourcetype, streamopenmode=readmode)
+        #gzip, bzip2 & xz compressed sources are decompressed on the fly, and zip archives split into their members
+        inputs = expand_sources(inputs)
     #inputs = ( inputsource(i, streamopenmode=readmode) for i in inputs )
 
-    ids = marc.idgen(entbase)
+    ids = session.ids
     if model is None: model = model_factory()
 
-    if any((rdfttl, rdfxml)):
+    #Turtle & N-Triples are streamed out record by record. Only RDF/XML needs the whole graph in memory, via rdflib
+    rdf_writers = []
+    if rdfxml is not None:
         import rdflib
+        from bibframe.writer import rdf
 
         BFNS = rdflib.Namespace(BFZ)
         BFCNS = rdflib.Namespace(BFZ + 'cftag/')
         BFDNS = rdflib.Namespace(BFZ + 'dftag/')
 
         g = rdflib.Graph()
-    #Intentionally not using either factory
-    if canonical: global_model = memory.connection() #logger=logger)
+    #Sorted runs are spilled to temp files, so the whole run needn't be held in memory
+    if canonical: canonw = canonical_writer(out)
 
     if xml is not None:
         xmlw = writer.raw(xml, indent='  ')
@@ -108,48 +386,99 @@ def bfconvert(inputs, handle_marc_source=handle_marcxml_source, entbase=None, mo
     extant_resources = None
     #extant_resources = set()
     def postprocess():
-        #No need to bother with Versa -> RDF translation if we were not asked to generate Turtle
-        if any((rdfttl, rdfxml)): rdf.process(model, g, to_ignore=extant_resources, logger=logger)
-        if canonical: global_model.add_many([(o,r,t,a) for (rid,(o,r,t,a)) in model])
+        #No need to bother with Versa -> RDF translation if we were not asked to generate RDF
+        for rdfw in rdf_writers: rdfw.process(model, to_ignore=extant_resources, logger=logger)
+        if rdfxml is not None: rdf.process(model, g, to_ignore=extant_resources, logger=logger)
+        if canonical: canonw.add_model(model)
 
         if xml is not None:
             microxml.process(model, xmlw, to_ignore=extant_resources, logger=logger)
 
         model.create_space()
 
-    #Set up event loop if not provided
-    if not loop:
-        loop = asyncio.get_event_loop()
-
     #Allow configuration of a separate base URI for vocab items (classes & properties)
     #XXX: Is this the best way to do this, or rather via a post-processing plug-in
-    vb = config.get('vocab-base-uri', BL)
-
-    transform_iris = config.get('transforms', [])
-    marcspecials_vocab = config.get('marcspecials-vocab')
-    transforms = transform_set(transform_iris, marcspecials_vocab)
+    vb = session.vocabbase
 
-    lookups = config.get('lookups', {})
+    if rdfttl is not None:
+        if vb == BFZ:
+            prefixes = {'bf': BFZ, 'bfc': BFZ + 'cftag/', 'bfd': BFZ + 'dftag/'}
+        else:
+            prefixes = {'vb': vb}
+        if entbase:
+            prefixes['ent'] = entbase
+        rdf_writers.append(rdfstream.turtle_writer(rdfttl, prefixes))
+    if rdfnt is not None:
+        rdf_writers.append(rdfstream.ntriples_writer(rdfnt))
 
-    #Initialize auxiliary services (i.e. plugins)
-    plugins = []
-    for pc in config.get('plugins', []):
-        try:
-            pinfo = g_services[pc['id']]
-            plugins.append(pinfo)
-            pinfo[BF_INIT_TASK](pinfo, config=pc)
-        except KeyError:
-            raise Exception('Unknown plugin {0}'.format(pc['id']))
+    transforms = session.transforms
+    lookups = session.lookups
+    seed_ids = session.seed_ids
+    plugins = session.plugins
 
     limiting = [0, limit]
     #logger=logger,
 
+    store = fingerprint_store.load(fingerprints) if fingerprints else None
+
+    checkpoints = None
+    if checkpoint:
+        if workers and workers > 1:
+            raise ValueError('Checkpoints are only supported for conversion in one process')
+        if canonical or rdfxml is not None or xml is not None:
+            raise ValueError('Checkpoints are only supported with Versa JSON, Turtle & N-Triples output')
+        checkpoints = checkpointer(checkpoint, every=checkpoint_every, resume=resume)
+        if checkpoints.resuming:
+            if (store is None) != (checkpoints.state['store'] is None):
+                raise ValueError('Incremental conversion must be used for both the checkpointed & resumed runs, or neither')
+            #Carry on the sequence of made up IDs, and the record fingerprints seen so far
+            ids = cached_idgen(marc.idgen(entbase, state=checkpoints.state['ids']), config.get('id-cache-size', ID_CACHE_SIZE))
+            store = checkpoints.state['store']
+            if plugins:
+                logger.warning('Plug-in state isn\'t checkpointed, so plug-ins only see the records converted since resuming')
+        streams = { name: stream for (name, stream) in (('out', out), ('rdfttl', rdfttl), ('rdfnt', rdfnt)) if stream is not None }
+        checkpoints.track(streams, rdf_writers, limiting, ids, store)
+
+    plugin_tasks = None
+    if session.plugin_queue_size and plugins and not (workers and workers > 1):
+        plugin_tasks = plugin_tasks_cls(plugins, session.plugin_queue_size, session.plugin_executors, logger=logger, profiler=prof)
+
+    pool = None
+    if workers and workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=parallel.init_worker,
+                                    initargs=(config, entbase, vb, getattr(logger, 'name', None), prof is not None))
+
     #raise(Exception(repr(inputs)))
-    for source in inputs:
+    for index, source in enumerate(inputs):
+        #Don't even open up any more sources once the limit is reached
+        if limiting[1] is not None and limiting[0] >= limiting[1]: break
+        if checkpoints is not None and checkpoints.skip_source(index): continue
         @asyncio.coroutine
         #Wrap the parse operation to make it a task in the event loop
         def wrap_task(): #source=source
-            sink = marc.record_handler( loop,
+            if pool:
+                sink = parallel.record_handler( loop,
+                                            model,
+                                            pool,
+                                            window=4*workers,
+                                            entbase=entbase,
+                                            vocabbase=vb,
+                                            limiting=limiting,
+                                            plugins=plugins,
+                                            ids=ids,
+                                            postprocess=postprocess,
+                                            out=out,
+                                            logger=logger,
+                                            transforms=transforms,
+                                            canonical=canonical,
+                                            lookups=lookups,
+                                            model_factory=model_factory,
+                                            seed_ids=seed_ids,
+                                            ndjson=ndjson,
+                                            profiler=prof,
+                                            existing_ids_factory=session.existing_ids_factory)
+            else:
+                sink = marc.record_handler( loop,
                                         model,
                                         entbase=entbase,
                                         vocabbase=vb,
@@ -162,7 +491,19 @@ def bfconvert(inputs, handle_marc_source=handle_marcxml_source, entbase=None, mo
                                         transforms=transforms,
                                         canonical=canonical,
                                         lookups=lookups,
-                                        model_factory=model_factory)
+                                        model_factory=model_factory,
+                                        seed_ids=seed_ids,
+                                        ndjson=ndjson,
+                                        profiler=prof,
+                                        existing_ids_factory=session.existing_ids_factory,
+                                        checkpoints=checkpoints,
+                                        plugin_tasks=plugin_tasks)
+            if store is not None:
+                #Only records which are new or changed since the last run get through to be converted
+                sink = skip_unchanged(sink, store)
+            if checkpoints is not None:
+                #Records are counted as read, and when resuming those done before the checkpoint skipped
+                sink = checkpoints.records(sink, index)
 
             args = dict(lax=lax)
             handle_marc_source(source, sink, args, logger, model_factory)
@@ -173,14 +514,36 @@ def bfconvert(inputs, handle_marc_source=handle_marcxml_source, entbase=None, mo
         try:
             loop.run_until_complete(task)
         except Exception as ex:
+            if plugin_tasks: plugin_tasks.close()
+            if close_loop: loop.close()
             raise ex
-        finally:
-            loop.close()
+
+    if plugin_tasks: plugin_tasks.close()
+
+    #Only close the loop once all the sources are done with, e.g. all the members of a zip archive
+    if close_loop: loop.close()
+
+    if pool:
+        #All results have been consumed by now
+        pool.terminate()
+        pool.join()
+
+    if store is not None:
+        #If the limit was reached not all the records were seen, so none can be taken as deleted
+        complete = limiting[1] is None or limiting[0] < limiting[1]
+        removed = store.deleted() if complete else []
+        logger.info('Incremental conversion: {0} new, {1} changed, {2} unchanged (skipped), {3} without control number, {4} deleted'.format(
+                        store.new, store.changed, store.unchanged, store.untracked, len(removed)))
+        if deleted is not None:
+            for cn in removed: deleted.write(cn + '\n')
+        store.save(fingerprints, complete=complete)
 
     if canonical:
-        out.write(repr(global_model))
+        canonw.close()
+
+    for rdfw in rdf_writers: rdfw.close()
 
-    if any((rdfttl, rdfxml)):
+    if rdfxml is not None:
         if vb == BFZ:
             g.bind('bf', BFNS)
             g.bind('bfc', BFCNS)
@@ -190,10 +553,6 @@ def bfconvert(inputs, handle_marc_source=handle_marcxml_source, entbase=None, mo
         if entbase:
             g.bind('ent', entbase)
 
-    if rdfttl is not None:
-        logger.debug('Converting to RDF (Turtle).')
-        rdfttl.write(g.serialize(format="turtle"))
-
     if rdfxml is not None:
         logger.debug('Converting to RDF (XML).')
         rdfxml.write(g.serialize(format="pretty-xml"))
@@ -201,12 +560,25 @@ def bfconvert(inputs, handle_marc_source=handle_marcxml_source, entbase=None, mo
     if xml is not None:
         logger.debug('Converting to XML.')
         xmlw.end_element('bibframe')
+
+    if checkpoints is not None:
+        logger.debug('{0} checkpoint{1} taken'.format(checkpoints.saved, '' if checkpoints.saved == 1 else 's'))
+        checkpoints.finish()
+
+    logger.debug('Resource ID cache: {0} hits, {1} misses'.format(ids.hits, ids.misses))
+    if prof:
+        prof.lap('run', 'total', start)
+        prof.write(profile)
     return
 
 
 AVAILABLE_MARC_HANDLERS = {
-    "http://bibfra.me/tool/pybibframe/marchandler#marcjson": handle_marcxml_source
+    "http://bibfra.me/tool/pybibframe/marchandler#marcjson": handle_marcjson_source
 }
 
 def register_marc_handler(iri, func):
     AVAILABLE_MARC_HANDLERS[iri] = func
+
+
+register_marc_handler("http://bibfra.me/tool/pybibframe/marchandler#iso2709", handle_iso2709_source)
+register_marc_handler("http://bibfra.me/tool/pybibframe/marchandler#marcxml-lxml", handle_marcxml_lxml_source)
@@ -0,0 +1,158 @@
+'''
+Incremental conversion: only convert the MARC records which are new or changed since the previous run
+
+Each record is fingerprinted from its input model (everything the MARC reader got from it,
+but not the record ID it made up from the record's position). The fingerprints are kept by control
+number (001) in a store file, which is read at the start of a run and written out again at the end.
+Records with the same fingerprint as last time are skipped. Control numbers in the store which
+don't turn up at all are reported as deleted. Records without a control number are always converted.
+
+For the output of a changed record to line up with that of the previous run, made up IDs
+should be seeded per record (see the record-seeded-ids config option).
+
+The store file is a line of JSON with details of the format, then a line per record of
+fingerprint & control number, tab separated.
+'''
+
+import os
+import json
+
+from versa import RELATIONSHIP, TARGET, ATTRIBUTES
+from versa.contrib.datachefids import mmh3
+
+from .marc import marc_lookup
+
+STORE_FORMAT = 'http://bibfra.me/tool/pybibframe/fingerprints'
+STORE_VERSION = 1
+
+
+def record_fingerprint(input_model):
+    '''
+    Return a fingerprint (hex string) of a MARC record from its input model, regardless of its record ID
+    '''
+    content = [ (link[RELATIONSHIP], link[TARGET], link[ATTRIBUTES]) for (lid, link) in input_model ]
+    return '{0:032x}'.format(mmh3.hash128(json.dumps(content, sort_keys=True, separators=(',', ':'))))
+
+
+def control_number(input_model):
+    '''
+    Return the control number (001) of the MARC record, or None. Whitespace is normalized
+    '''
+    for code, value in marc_lookup(input_model, '001'):
+        return ' '.join(value.split()) or None
+    return None
+
+
+class fingerprint_store(object):
+    '''
+    Fingerprints of the records from the previous run, and those of this one as they're checked
+    '''
+    def __init__(self, previous=None):
+        '''
+        previous - set of (control number, fingerprint) from the previous run
+        '''
+        self.previous = previous or set()
+        self._previous_numbers = { cn for (cn, fp) in self.previous }
+        self.seen = set()
+        self.new = self.changed = self.unchanged = self.untracked = 0
+        return
+
+    @staticmethod
+    def read(f):
+        '''
+        Read in a store
+
+        f - text stream
+        '''
+        header = json.loads(f.readline())
+        if header.get('format') != STORE_FORMAT or header.get('version') != STORE_VERSION:
+            raise ValueError('Not a record fingerprint store, or an unsupported version of one')
+        previous = set()
+        for line in f:
+            fp, cn = line.rstrip('\n').split('\t', 1)
+            previous.add((cn, fp))
+        return fingerprint_store(previous)
+
+    @staticmethod
+    def load(fname):
+        '''
+        Return the store in the file, or an empty one if there's no such file (e.g. the first run)
+        '''
+        if not os.path.exists(fname): return fingerprint_store()
+        with open(fname, encoding='utf-8') as f:
+            return fingerprint_store.read(f)
+
+    def check(self, input_model):
+        '''
+        Note the record as seen in this run, and return True if it's to be converted, i.e. it's new or changed
+        '''
+        cn = control_number(input_model)
+        if cn is None:
+            self.untracked += 1
+            return True
+        entry = (cn, record_fingerprint(input_model))
+        self.seen.add(entry)
+        if entry in self.previous:
+            self.unchanged += 1
+            return False
+        if cn in self._previous_numbers:
+            self.changed += 1
+        else:
+            self.new += 1
+        return True
+
+    def deleted(self):
+        '''
+        Return the sorted list of control numbers from the previous run which weren't seen in this one
+        '''
+        return sorted(self._previous_numbers - { cn for (cn, fp) in self.seen })
+
+    def write(self, out, complete=True):
+        '''
+        Write out the store for the next run
+
+        out - text stream
+        complete - if False not all the records were read (e.g. the run was limited), so
+                those from the previous run which weren't seen are kept
+        '''
+        entries = set(self.seen)
+        if not complete:
+            seen_numbers = { cn for (cn, fp) in self.seen }
+            entries.update(( (cn, fp) for (cn, fp) in self.previous if cn not in seen_numbers ))
+        out.write(json.dumps({'format': STORE_FORMAT, 'version': STORE_VERSION}, sort_keys=True) + '\n')
+        for cn, fp in sorted(entries):
+            out.write('{0}\t{1}\n'.format(fp, cn))
+        return
+
+    def save(self, fname, complete=True):
+        '''
+        Write out the store to a file, replacing it only once it's all written
+        '''
+        tmpname = fname + '.tmp'
+        with open(tmpname, 'w', encoding='utf-8') as f:
+            self.write(f, complete=complete)
+        os.replace(tmpname, fname)
+        return
+
+
+def skip_unchanged(sink, store):
+    '''
+    Coroutine which passes on to the sink just the records which are new or changed according to the store.
+    Can be given to a MARC handler in place of the sink
+
+    sink - coroutine to be sent the records to be converted, e.g. from bibframe.reader.marc.record_handler
+    store - fingerprint_store
+    '''
+    next(sink) #Start the coroutine running
+    try:
+        while True:
+            input_model = yield
+            if store.check(input_model):
+                try:
+                    sink.send(input_model)
+                except StopIteration:
+                    #The sink declined any more records (e.g. the limit was reached), so decline too
+                    return
+    finally:
+        sink.close()
+    return
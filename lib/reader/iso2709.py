@@ -0,0 +1,144 @@
+'''
+For processing binary MARC (ISO 2709, i.e. MARC21 communications format)
+Streams records straight from the directory & field offsets, without a detour through MARC/XML
+
+Records in MARC-8 (leader position 09 other than 'a') are decoded using pymarc if it's installed.
+Otherwise they're decoded as UTF-8, with a warning
+'''
+
+import mmap
+import warnings
+
+from bibframe.reader import marc
+from .marcxml import VALID_SUBFIELD_PAT, normalize_text
+
+MARCXML_NS = marc.MARCXML_NS
+
+RECORD_TERMINATOR = b'\x1d'
+FIELD_TERMINATOR = b'\x1e'
+SUBFIELD_DELIMITER = '\x1f'
+
+LEADER_LEN = 24
+DIRECTORY_ENTRY_LEN = 12
+
+
+def iso2709_records(stream):
+    '''
+    Yield (byte offset, record bytes) for each record in the stream of binary MARC.
+    Memory maps the stream if it's a regular file, otherwise reads a record at a time
+
+    stream - file-like object opened in binary mode
+    '''
+    try:
+        buf = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        #Not backed by a (non-empty) file, e.g. BytesIO
+        buf = None
+
+    offset = 0
+    while True:
+        head = buf[offset:offset+5] if buf is not None else stream.read(5)
+        if not head.strip(): break
+        if not head.isdigit():
+            raise ValueError('Invalid record length "{0}" at byte offset {1}'.format(head, offset))
+        length = int(head)
+        if buf is not None:
+            record = buf[offset:offset+length]
+        else:
+            record = head + stream.read(length - 5)
+        yield offset, record
+        offset += length
+
+    if buf is not None: buf.close()
+    return
+
+
+def marc8_decoder():
+    try:
+        from pymarc.marc8 import MARC8ToUnicode
+    except ImportError:
+        warnings.warn('pymarc is needed to decode MARC-8 records. Treating them as UTF-8.', RuntimeWarning)
+        return lambda b: b.decode('utf-8', errors='replace')
+    return MARC8ToUnicode(quiet=True).translate
+
+
+def handle_iso2709_source(source, sink, args, logger, model_factory):
+    '''
+    Process one source of binary MARC records in the form of an amara3 inputsource
+
+    Builds the same Versa record model as the MARC/XML reader. Record IDs are based on the byte offset
+
+    source - amara3.inputsource.inputsource instance
+    sink - coroutine to be sent the generated resources
+    args -
+    model_factory - Factory function for creating Versa models
+    '''
+    next(sink) #Start the coroutine running
+    no_records = True
+    decode_marc8 = None
+    for offset, record in iso2709_records(source.stream):
+        no_records = False
+        record_id = 'record-{0}'.format(offset)
+        if record[-1:] != RECORD_TERMINATOR:
+            logger.warn('Missing record terminator in record "{0}"'.format(record_id))
+
+        leader = record[:LEADER_LEN].decode('ascii', errors='replace')
+        if leader[9] == 'a':
+            decode = lambda b: b.decode('utf-8', errors='replace')
+        else:
+            decode_marc8 = decode_marc8 or marc8_decoder()
+            decode = decode_marc8
+        normalize = lambda b: normalize_text(decode(b))
+
+        #Versa model with a representation of the record
+        #For input model plugins, important that natural ordering be preserved
+        record_model = model_factory()
+        record_model.add(record_id, MARCXML_NS + '/leader', normalize(record[:LEADER_LEN]), {})
+
+        base_address = int(record[12:17])
+        directory = record[LEADER_LEN:base_address - 1]
+        for entry_start in range(0, len(directory) - DIRECTORY_ENTRY_LEN + 1, DIRECTORY_ENTRY_LEN):
+            entry = directory[entry_start:entry_start + DIRECTORY_ENTRY_LEN]
+            tag = entry[:3].decode('ascii', errors='replace')
+            field_len, field_start = int(entry[3:7]), int(entry[7:12])
+            data = record[base_address + field_start:base_address + field_start + field_len]
+            if data[-1:] == FIELD_TERMINATOR: data = data[:-1]
+
+            is_control = tag.startswith('00')
+            if len(tag) != 3 or not tag.isdigit():
+                logger.warn('Invalid datafield tag "{0}" in record "{1}"'.format(tag, record_id))
+                is_control = SUBFIELD_DELIMITER.encode('ascii') not in data
+                tag = '000'
+
+            if is_control:
+                #Control tags have neither indicators nor subfields
+                record_model.add(record_id, MARCXML_NS + '/control/' + tag, normalize(data), {'tag': tag})
+                continue
+
+            indicators = data[:2].decode('ascii', errors='replace').ljust(2)
+            marc_attributes = {'tag': tag, 'ind1': indicators[0].strip(), 'ind2': indicators[1].strip()}
+            #Subfield counter as with the MARC/XML reader, so the keys come out the same
+            subfield_count = 1
+            #Anything before the first delimiter is junk
+            for subfield in normalize(data[2:]).split(SUBFIELD_DELIMITER)[1:]:
+                code, value = subfield[:1].strip(), subfield[1:]
+                if not VALID_SUBFIELD_PAT.match(code):
+                    logger.warn('Invalid subfield code "{0}" in record "{1}", tag "{2}"'.format(code, record_id, tag))
+                    code = '_'
+                subfield_count += 1
+                marc_attributes['{}.{}'.format(subfield_count, code)] = value
+            record_model.add(record_id, MARCXML_NS + '/data/' + tag, '', marc_attributes)
+
+        try:
+            sink.send(record_model)
+        except StopIteration:
+            #Handler coroutine has declined to process more records. Perhaps it's hit a limit
+            break
+
+    if no_records:
+        warnings.warn("No records found in this file.", RuntimeWarning)
+    return
+
+
+handle_iso2709_source.readmode = 'rb'
+handle_iso2709_source.makeinputsource = True
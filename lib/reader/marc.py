@@ -10,9 +10,9 @@ import functools
 import logging
 import itertools
 import asyncio
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, OrderedDict, deque
 
-from bibframe.contrib.datachefids import idgen#, FROM_EMPTY_64BIT_HASH
+from bibframe.contrib.datachefids import idgen, idseed#, FROM_EMPTY_64BIT_HASH
 
 from amara3 import iri
 
@@ -23,10 +23,12 @@ from versa.driver import memory
 
 from bibframe import MARC, POSTPROCESS_AS_INSTANCE
 from bibframe import BF_INIT_TASK, BF_INPUT_TASK, BF_INPUT_XREF_TASK, BF_MARCREC_TASK, BF_MATRES_TASK, BF_FINAL_TASK
-from bibframe.util import materialize_entity
+from bibframe.util import materialize_entity, cached_idgen
+from bibframe.profiling import perf_counter, task_key
+from bibframe.writer.versajson import versajson_writer
 from bibframe.isbnplus import isbn_list, compute_ean13_check
-from . import transform_set, BOOTSTRAP_PHASE, DEFAULT_MAIN_PHASE, PYBF_BOOTSTRAP_TARGET_REL, VTYPE_REL
-from .util import WORK_TYPE, INSTANCE_TYPE, subfields
+from . import transform_set, transform_dispatch, BOOTSTRAP_PHASE, DEFAULT_MAIN_PHASE, PYBF_BOOTSTRAP_TARGET_REL, VTYPE_REL
+from .util import WORK_TYPE, INSTANCE_TYPE, SUBFIELD_INDEX, subfields, index_subfields
 from .marcpatterns import TRANSFORMS, bfcontext
 from .marcworkidpatterns import WORK_HASH_TRANSFORMS, WORK_HASH_INPUT
 from .marcextra import transforms as default_special_transforms
@@ -42,6 +44,9 @@ NON_ISBN_CHARS = re.compile('\D')
 
 NEW_RECORD = 'http://bibfra.me/purl/versa/' + 'newrecord'
 
+#Fixed length fields, interpreted by the special transforms
+FIXED_FIELD_TAGS = frozenset(['006', '007', '008'])
+
 # Namespaces
 
 BL = 'http://bibfra.me/vocab/lite/'
@@ -167,11 +172,11 @@ def gather_workid_data(model, origin):
     Called after a first pass has been made to derive a BIBFRAME model sufficient to
     Compute a hash for the work, a task undertaken by this function
     '''
-    data = []
-    for rel in WORK_HASH_INPUT:
-        for link in model.match(origin, rel):
-            data.append([link[RELATIONSHIP], link[TARGET]])
-    return data
+    #One pass through the model, rather than one per relationship
+    byrel = defaultdict(list)
+    for link in model.match(origin):
+        byrel[link[RELATIONSHIP]].append([link[RELATIONSHIP], link[TARGET]])
+    return [ item for rel in WORK_HASH_INPUT for item in byrel.get(rel, ()) ]
 
 
 def gather_targetid_data(model, origin, orderings=None):
@@ -188,9 +193,18 @@ def gather_targetid_data(model, origin, orderings=None):
 
 #XXX Generalize by using URIs for phase IDs
 def process_marcpatterns(params, transforms, input_model, phase_target):
+    '''
+    Apply the transforms for a phase to each field of the input model
+
+    transforms - transform_dispatch for the phase, or plain dict from lookup key to transform
+    '''
+    if not isinstance(transforms, transform_dispatch): transforms = transform_dispatch(transforms)
     output_model = params['output_model']
     if phase_target == BOOTSTRAP_PHASE:
         input_model_iter = params['input_model']
+        #Nothing else happens in the bootstrap phase for fields without transforms, so skip them
+        #The fixed length fields are still needed for the special transforms
+        bootstrap_tags = transforms.tags | FIXED_FIELD_TAGS
     else:
         # Need to sort our way through the input model so that the materializations occur
         # at the same place each time, otherwise canonicalization fails due to the
@@ -199,6 +213,8 @@ def process_marcpatterns(params, transforms, input_model, phase_target):
         # XXX Is the int() cast necessary? If not we could do key=operator.itemgetter(0)
         input_model_iter = sorted(list(params['input_model']), key=lambda x: int(x[0]))
     params['to_postprocess'] = []
+    profiler = params.get('profiler')
+    profile_category = 'bootstrap-transforms' if phase_target == BOOTSTRAP_PHASE else 'transforms'
     for lid, marc_link in input_model_iter:
         origin, taglink, val, attribs = marc_link
         origin = params.get('default-origin', origin)
@@ -206,8 +222,11 @@ def process_marcpatterns(params, transforms, input_model, phase_target):
         if taglink == MARCXML_NS + '/leader':
             params['leader'] = leader = val
             continue
+        if phase_target == BOOTSTRAP_PHASE and attribs.get('tag') not in bootstrap_tags: continue
         #Sort out attributes
         params['indicators'] = indicators = { k: v for k, v in attribs.items() if k.startswith('ind') }
+        #Parse the subfields just once for all the actions on this field. attribs is our own copy, so OK to annotate
+        attribs[SUBFIELD_INDEX] = index_subfields(attribs)
         params['subfields'] = curr_subfields = subfields(attribs)
         curr_subfields_keys = [ tup[0] for tup in curr_subfields ]
         if taglink.startswith(MARCXML_NS + '/extra/') or 'tag' not in attribs: continue
@@ -233,43 +252,25 @@ def process_marcpatterns(params, transforms, input_model, phase_target):
             if phase_target != BOOTSTRAP_PHASE: params['fields_used'].append(tuple([tag] + curr_subfields_keys))
 
         #This is where we check each incoming MARC link to see if it matches a transform into an output link (e.g. renaming 001 to 'controlCode')
+        #Start with most specific matches, then to most general ("?" syntax in lookups is a single char wildcard)
+        subfield_matches, tag_matches, tag_handled = transforms.resolve(tag, indicator_list[0], indicator_list[1])
         to_process = []
-        #Start with most specific matches, then to most general
-
-        # "?" syntax in lookups is a single char wildcard
         #First with subfields, with & without indicators:
         for k, v in curr_subfields:
-            #if indicator_list == ('#', '#'):
-            lookups = [
-                '{0}-{1}{2}${3}'.format(tag, indicator_list[0], indicator_list[1], k),
-                '{0}-?{2}${3}'.format(tag, indicator_list[0], indicator_list[1], k),
-                '{0}-{1}?${3}'.format(tag, indicator_list[0], indicator_list[1], k),
-                '{0}${1}'.format(tag, k),
-            ]
-            for lookup in lookups:
-                if lookup in transforms:
-                    to_process.append((transforms[lookup], v, lookup))
-                else:
-                    # don't report on subfields for which a code-transform exists,
-                    # disregard wildcards
-                    if phase_target != BOOTSTRAP_PHASE and not tag in transforms and '?' not in lookup:
-
-                        params['dropped_codes'].setdefault(lookup,0)
-                        params['dropped_codes'][lookup] += 1
-
-        #Now just the tag, with & without indicators
-        lookups = [
-            '{0}-{1}{2}'.format(tag, indicator_list[0], indicator_list[1]),
-            '{0}-?{2}'.format(tag, indicator_list[0], indicator_list[1]),
-            '{0}-{1}?'.format(tag, indicator_list[0], indicator_list[1]),
-            tag,
-        ]
+            for funcinfo, lookup in subfield_matches.get(k, ()):
+                to_process.append((funcinfo, v, lookup))
+            # don't report on subfields for which a code-transform exists,
+            # disregard wildcards
+            if phase_target != BOOTSTRAP_PHASE and not tag_handled:
+                for lookup in transforms.dropped(tag, indicator_list[0], indicator_list[1], k):
+                    params['dropped_codes'].setdefault(lookup,0)
+                    params['dropped_codes'][lookup] += 1
 
         #Remember how many lookups were successful based on subfields
         subfields_results_len = len(to_process)
-        for lookup in lookups:
-            if lookup in transforms:
-                to_process.append((transforms[lookup], val, lookup))
+        #Now just the tag, with & without indicators
+        for funcinfo, lookup in tag_matches:
+            to_process.append((funcinfo, val, lookup))
 
         if phase_target != BOOTSTRAP_PHASE and subfields_results_len == len(to_process) and not curr_subfields:
             # Count as dropped if subfields were not processed and theer were no matches on non-subfield lookups
@@ -301,7 +302,12 @@ def process_marcpatterns(params, transforms, input_model, phase_target):
                                     output_model, extras=extras,
                                     base=params['vocabbase'], idgen=mat_ent,
                                     existing_ids=params['existing_ids'])
-                func(ctx)
+                if profiler:
+                    start = perf_counter()
+                    func(ctx)
+                    profiler.add(profile_category, lookup, perf_counter() - start)
+                else:
+                    func(ctx)
                 params['to_postprocess'].extend(ctx.extras['postprocessing'])
                 if ctx.extras['abort-signal']:
                     return False
@@ -331,11 +337,16 @@ def process_marcpatterns(params, transforms, input_model, phase_target):
         #params['logger'].debug('PHASE {}\n'.format(phase_target))
         extra_stmts = set() # prevent duplicate statements
         special_transforms = params['transforms'].specials
-        for origin, k, v in itertools.chain(
-                    special_transforms.process_leader(params),
-                    special_transforms.process_006(params['fields006'], params),
-                    special_transforms.process_007(params['fields007'], params),
-                    special_transforms.process_008(params['field008'], params)):
+        specials = [
+            ('leader', special_transforms.process_leader(params)),
+            ('006', special_transforms.process_006(params['fields006'], params)),
+            ('007', special_transforms.process_007(params['fields007'], params)),
+            ('008', special_transforms.process_008(params['field008'], params)),
+        ]
+        if profiler:
+            #The special transforms are generators, so time them by running them through right away
+            specials = [ (name, profiler.consume('specials', name, items)) for (name, items) in specials ]
+        for origin, k, v in itertools.chain(*[ items for (name, items) in specials ]):
             v = v if isinstance(v, tuple) else (v,)
             for item in v:
                 o = origin or I(params['default-origin'])
@@ -346,18 +357,334 @@ def process_marcpatterns(params, transforms, input_model, phase_target):
 
 unused_flag = object()
 
+def record_params(input_model, entbase, vocabbase, ids, existing_ids, plugins, transforms,
+                    lookups, logger, loop, seed_ids=False, profiler=None, plugin_tasks=None):
+    '''
+    Set up the parameters dictionary used throughout the processing of one MARC record
+
+    seed_ids - if True made up IDs (i.e. for resources with no unique data) are seeded per record (see record_seed)
+    profiler - optional bibframe.profiling.profiler to collect timings of transforms, plug-ins etc.
+    plugin_tasks - optional bibframe.reader.plugintasks.plugin_tasks, to run the record & materialized resource
+            plug-in tasks concurrently rather than one after another
+    '''
+    #Add work item record, with actual hash resource IDs based on default or plugged-in algo
+    #FIXME: No plug-in support yet
+    return {
+        'input_model': input_model, 'logger': logger,
+        #'input_model': input_model, 'output_model': model, 'logger': logger,
+        'entbase': entbase, 'vocabbase': vocabbase, 'ids': ids,
+        'existing_ids': existing_ids, 'plugins': plugins, 'transforms': transforms,
+        'materialize_entity': materialize_entity, 'leader': None, 'lookups': lookups or {},
+        'loop': loop, 'seed-ids': seed_ids, 'profiler': profiler, 'plugin-tasks': plugin_tasks
+    }
+
+
+def record_seed(input_model):
+    '''
+    Seed for made up IDs for a record: its control number (001) if any, otherwise its ID from
+    the MARC reader, which is derived from its position in the source
+    '''
+    control_code = list(marc_lookup(input_model, '001'))
+    if control_code:
+        return control_code[0][1]
+    return next(input_model.match())[ORIGIN]
+
+
+@asyncio.coroutine
+def plugin_task(profiler, task, func, *args):
+    '''
+    Run a plug-in task coroutine, timing it if there's a profiler
+    '''
+    if not profiler:
+        return (yield from func(*args))
+    with profiler.timer('plugins', task_key(task, func)):
+        return (yield from func(*args))
+
+
+@asyncio.coroutine
+def transform_record(loop, input_model, model, params, model_factory=memory.connection,
+                        instancegen=isbn_instancegen):
+    '''
+    Run the transform phases for one MARC record: input plug-ins, cross-references (i.e. 880s),
+    the bootstrap phase to establish the main resource ID and then the main phase.
+    Returns False if a transform signalled to abort the record
+
+    loop - asyncio event loop
+    input_model - Versa model representing the MARC record
+    model - Versa model to which the output is added
+    params - per-record processing parameters (see record_params)
+    model_factory - factory function for creating Versa models
+    '''
+    logger = params['logger']
+    plugins = params['plugins']
+    entbase = params['entbase']
+    vocabbase = params['vocabbase']
+    existing_ids = params['existing_ids']
+    transforms = params['transforms']
+    profiler = params.get('profiler')
+    if profiler: mark = perf_counter()
+
+    if params['seed-ids']:
+        #Made up IDs then don't depend on where the record sits in the stream, so e.g. shards of a file convert alike
+        params['ids'].send(idseed(record_seed(input_model)))
+
+    # Earliest plugin stage, with an unadulterated input model
+    for plugin in plugins:
+        if BF_INPUT_TASK in plugin:
+            yield from plugin_task(profiler, BF_INPUT_TASK, plugin[BF_INPUT_TASK], loop, input_model, params)
+    if profiler: mark = profiler.lap('phases', 'input-plugins', mark)
+
+    #Prepare cross-references (i.e. 880s)
+    #See the "$6 - Linkage" section of https://www.loc.gov/marc/bibliographic/ecbdcntf.html
+    #XXX: Figure out a way to declare in TRANSFORMS? We might have to deal with non-standard relationship designators: https://github.com/lcnetdev/marc2bibframe/issues/83
+    xrefs = {}
+    remove_links = set()
+    add_links = []
+
+    xref_link_tag_workaround = {}
+    for lid, marc_link in input_model:
+        origin, taglink, val, attribs = marc_link
+        if taglink == MARCXML_NS + '/leader' or taglink.startswith(MARCXML_NS + '/data/9'):
+            #900 fields are local and might not follow the general xref rules
+            params['leader'] = leader = val
+            continue
+        #XXX Do other fields with a 9 digit (not just 9XX) also need to be skipped?
+        if taglink.startswith(MARCXML_NS + '/extra/') or 'tag' not in attribs: continue
+        this_tag = attribs['tag']
+        #if this_tag == '100': import pdb; pdb.set_trace()
+        for xref in attribs.get('6', []):
+            matched = LINKAGE_PAT.match(xref)
+            this_taglink, this_occ, this_scriptid, this_rtl = matched.groups() if matched else (None, None, None, None)
+            if not this_taglink and occ:
+                control_code = list(marc_lookup(input_model, '001')) or ['NO 001 CONTROL CODE']
+                dumb_title = list(marc_lookup(input_model, '245$a')) or ['NO 245$a TITLE']
+                logger.warning('Skipping invalid $6: "{}" for {}: "{}"'.format(xref, control_code[0], dumb_title[0]))
+                continue
+
+            if this_tag == this_taglink:
+                #Pretty sure this is an erroneous self-link, but we've seen this in the wild (e.g. QNL). Issue warning & do the best we can linking via occurrence
+                #Note: the resulting workround (lookup table from occurence code to the correct tag) will not work in cases of linking from any tag higher in ordinal value than 880 (if such a situation is even possible)
+                logger.warning('Invalid input: erroneous self-link $6: "{}" from "{}". Trying to work around.'.format(xref, this_tag))
+                if this_tag != '880':
+                    xref_link_tag_workaround[this_occ] = this_tag
+
+            #FIXME: Remove this debugging if statament at some point
+            if scriptid or rtl:
+                logger.debug('Language info specified in subfield 6, {}'.format(xref))
+
+            #Locate the matching taglink
+            if this_tag == '880' and this_occ == '00':
+                #Special case, no actual xref, used to separate scripts in a record (re Multiscript Records)
+                #FIXME: Not really handled right now. Presume some sort of merge dynamics will need to be implemented
+                attribs['tag'] = this_taglink
+                add_links.append((origin, MARCXML_NS + '/data/' + this_taglink, val, attribs))
+
+            if xref_link_tag_workaround:
+                if this_tag == '880':
+                    this_taglink = xref_link_tag_workaround.get(this_occ)
+
+            links = input_model.match(None, MARCXML_NS + '/data/' + this_taglink)
+            for that_link in links:
+                #6 is the cross-reference subfield
+                for that_ref in link[ATTRIBUTES].get('6', []):
+                    matched = LINKAGE_PAT.match(that_ref)
+                    that_taglink, that_occ, that_scriptid, that_rtl = matched.groups() if matched else (None, None, None, None)
+                    #if not that_tag and that_occ:
+                    #    control_code = list(marc_lookup(input_model, '001')) or ['NO 001 CONTROL CODE']
+                    #    dumb_title = list(marc_lookup(input_model, '245$a')) or ['NO 245$a TITLE']
+                    #    logger.warning('Skipping invalid $6: "{}" for {}: "{}"'.format(to_ref, control_code[0], dumb_title[0]))
+                    #    continue
+                    if ([that_taglink, that_occ] == [this_tag, this_occ]) or (xref_link_tag_workaround and that_occ == this_occ):
+                        if this_tag == '880':
+                            #This is an 880, which we'll handle by integrating back into the input model using the correct tag, flagged to show the relationship
+                            remove_links.add(lid)
+
+                        if that_taglink == '880':
+                            #Rule for 880s: duplicate but link more robustly
+                            copied_attribs = attribs.copy()
+                            for k, v in that_link[ATTRIBUTES].items():
+                                if k[:3] not in ('tag', 'ind'):
+                                    copied_attribs.setdefault(k, []).extend(v)
+                            add_links.append((origin, MARCXML_NS + '/data/' + this_tag, val, copied_attribs))
+
+    input_model.remove(remove_links)
+    input_model.add_many(add_links)
+    if profiler: mark = profiler.lap('phases', 'xref', mark)
+
+    # hook for plugins interested in the xref-resolved input model
+    for plugin in plugins:
+        if BF_INPUT_XREF_TASK in plugin:
+            yield from plugin_task(profiler, BF_INPUT_XREF_TASK, plugin[BF_INPUT_XREF_TASK], loop, input_model, params)
+    if profiler: mark = profiler.lap('phases', 'input-xref-plugins', mark)
+
+    #Do one pass to establish work hash
+    #XXX Should crossrefs precede this?
+    bootstrap_dummy_id = next(params['input_model'].match())[ORIGIN]
+    logger.debug('Entering bootstrap phase. Dummy ID: {}'.format(bootstrap_dummy_id))
+
+    params['default-origin'] = bootstrap_dummy_id
+    params['instanceids'] = [bootstrap_dummy_id + '-instance']
+    params['output_model'] = model_factory()
+
+    params['field008'] = leader = None
+    params['fields006'] = fields006 = []
+    params['fields007'] = fields007 = []
+    params['to_postprocess'] = []
+
+    params['origins'] = {WORK_TYPE: bootstrap_dummy_id, INSTANCE_TYPE: params['instanceids'][0]}
+
+    #First apply special patterns for determining the main target resources
+    curr_transforms = transforms.dispatch[BOOTSTRAP_PHASE]
+
+    ok = process_marcpatterns(params, curr_transforms, input_model, BOOTSTRAP_PHASE)
+    if profiler: mark = profiler.lap('phases', 'bootstrap', mark)
+    if not ok: return False #Abort current record if signalled
+
+    bootstrap_output = params['output_model']
+    temp_main_target = main_type = None
+    for o, r, t, a in bootstrap_output.match(None, PYBF_BOOTSTRAP_TARGET_REL):
+        #FIXME: We need a better designed way of determining fallback to bib
+        if t is not None: temp_main_target, main_type = o, t
+
+    #Switch to the main output model for processing
+    params['output_model'] = model
+
+    if temp_main_target is None:
+        #If no target was set explicitly fall back to the transforms registered for the biblio phase
+        #params['logger'].debug('WORK HASH ORIGIN {}\n'.format(bootstrap_dummy_id))
+        #params['logger'].debug('WORK HASH MODEL {}\n'.format(repr(bootstrap_output)))
+        workid_data = gather_workid_data(bootstrap_output, bootstrap_dummy_id)
+        workid = materialize_entity('Work', ctx_params=params, data=workid_data, loop=loop)
+        logger.debug('Entering default main phase, Work ID: {0}'.format(workid))
+
+        is_folded = workid in existing_ids
+        existing_ids.add(workid)
+
+        control_code = list(marc_lookup(input_model, '001')) or ['NO 001 CONTROL CODE']
+        dumb_title = list(marc_lookup(input_model, '245$a')) or ['NO 245$a TITLE']
+        logger.debug('Work hash data: {0}'.format(repr(workid_data)))
+        logger.debug('Control code: {0}'.format(control_code[0]))
+        logger.debug('Uniform title: {0}'.format(dumb_title[0]))
+        logger.debug('Work ID: {0}'.format(workid))
+
+        workid = I(iri.absolutize(workid, entbase)) if entbase else I(workid)
+        folded = [workid] if is_folded else []
+
+        model.add(workid, VTYPE_REL, I(iri.absolutize('Work', vocabbase)))
+
+        params['default-origin'] = workid
+        params['folded'] = folded
+
+        #Figure out instances
+        instanceids = instancegen(params, loop, model)
+        params['instanceids'] = instanceids or [None]
+
+        main_transforms = transforms.dispatch[DEFAULT_MAIN_PHASE]
+        params['origins'] = {WORK_TYPE: workid, INSTANCE_TYPE: params['instanceids'][0]}
+        phase_target = DEFAULT_MAIN_PHASE
+    else:
+        targetid_data = gather_targetid_data(bootstrap_output, temp_main_target, transforms.orderings[main_type])
+        #params['logger'].debug('Data for resource: {}\n'.format([main_type] + targetid_data))
+        targetid = materialize_entity(main_type, ctx_params=params, data=targetid_data, loop=loop)
+        logger.debug('Entering specialized phase, Target resource ID: {}, type: {}'.format(targetid, main_type))
+
+        is_folded = targetid in existing_ids
+        existing_ids.add(targetid)
+        #Determine next transform phase
+        main_transforms = transforms.dispatch[main_type]
+        params['origins'] = {main_type: targetid}
+        params['default-origin'] = targetid
+        phase_target = main_type
+        model.add(I(targetid), VTYPE_REL, I(main_type))
+
+    params['transform_log'] = [] # set()
+    params['fields_used'] = []
+    params['dropped_codes'] = {}
+    #Defensive coding against missing leader or 008
+    params['field008'] = leader = None
+    params['fields006'] = fields006 = []
+    params['fields007'] = fields007 = []
+    params['to_postprocess'] = []
+    if profiler: mark = profiler.lap('phases', 'main-resource', mark)
+
+    ok = process_marcpatterns(params, main_transforms, input_model, phase_target)
+    if profiler: profiler.lap('phases', 'main', mark)
+    return ok #False means abort current record if signalled
+
+
+@asyncio.coroutine
+def finish_record(loop, model, params):
+    '''
+    Record level processing once the transform phases are complete: resources
+    flagged for postprocessing (e.g. as additional instances), then plug-ins.
+    If the plug-in tasks are run concurrently (see record_params) they're just scheduled,
+    and the concurrent.futures.Future for them is returned
+
+    loop - asyncio event loop
+    model - Versa model with the output for the record
+    params - per-record processing parameters (see record_params)
+    '''
+    logger = params['logger']
+    plugins = params['plugins']
+    profiler = params.get('profiler')
+    if profiler: mark = perf_counter()
+
+    skipped_rels = set()
+    for op, rels, rid in params['to_postprocess']:
+        for rel in rels: skipped_rels.add(rel)
+        if op == POSTPROCESS_AS_INSTANCE:
+            if params['instanceids'] == [None]:
+                params['instanceids'] = [rid]
+            else:
+                params['instanceids'].append(rid)
+    instance_postprocess(params, skip_relationships=skipped_rels)
+    if profiler: mark = profiler.lap('phases', 'postprocess', mark)
+
+    logger.debug('+')
+
+    #XXX At this point there must be at least one record with a Versa type
+
+    if params.get('plugin-tasks') is not None:
+        return params['plugin-tasks'].submit(model, params)
+
+    for plugin in plugins:
+        #Each plug-in is a task
+        #task = asyncio.Task(plugin[BF_MARCREC_TASK](loop, relsink, params), loop=loop)
+        if BF_MARCREC_TASK in plugin:
+            yield from plugin_task(profiler, BF_MARCREC_TASK, plugin[BF_MARCREC_TASK], loop, model, params)
+        logger.debug("Pending tasks: %s" % asyncio.Task.all_tasks(loop))
+        #FIXME: This blocks and thus serializes the plugin operation, rather than the desired coop scheduling approach
+        #(which is had by setting plugin-queue-size; see bibframe.reader.plugintasks)
+        #For some reason seting to async task then immediately deferring to next task via yield from sleep leads to the "yield from wasn't used with future" error (Not much clue at: https://codereview.appspot.com/7396044/)
+        #yield from asyncio.Task(asyncio.sleep(0.01), loop=loop)
+        #yield from asyncio.async(asyncio.sleep(0.01))
+        #yield from asyncio.sleep(0.01) #Basically yield to next task
+    if profiler: profiler.lap('phases', 'record-plugins', mark)
+
+    return
+
+
 @asyncio.coroutine
 def record_handler( loop, model, entbase=None, vocabbase=BL, limiting=None,
                     plugins=None, ids=None, postprocess=None, out=None,
                     logger=logging, transforms=TRANSFORMS,
                     special_transforms=unused_flag,
                     canonical=False, model_factory=memory.connection,
-                    lookups=None, **kwargs):
+                    lookups=None, seed_ids=False, ndjson=False, profiler=None, existing_ids_factory=set,
+                    checkpoints=None, plugin_tasks=None, **kwargs):
     '''
     loop - asyncio event loop
     model - the Versa model for the record
     entbase - base IRI used for IDs of generated entity resources
     limiting - mutable pair of [count, limit] used to control the number of records processed
+    seed_ids - if True made up IDs are seeded per record rather than following on throughout the stream
+    ndjson - if True the Versa JSON output has one link per line rather than being a JSON array
+    profiler - optional bibframe.profiling.profiler to collect timings of transforms, plug-ins etc.
+    existing_ids_factory - callable returning the (empty) store for the IDs of resources generated so far, e.g. a set
+            or a bibframe.idstore.packed_id_set
+    checkpoints - optional bibframe.reader.checkpoint.checkpointer, to take checkpoints as records are done, and to resume from one
+    plugin_tasks - optional bibframe.reader.plugintasks.plugin_tasks, to run the record & materialized resource plug-in tasks
+            concurrently, overlapping with the records which follow. Each record's output is written once its tasks are done
     '''
     #Deprecated legacy API support
     if isinstance(transforms, dict) or special_transforms is not unused_flag:
@@ -369,265 +696,77 @@ def record_handler( loop, model, entbase=None, vocabbase=BL, limiting=None,
     _final_tasks = set() #Tasks for the event loop contributing to the MARC processing
 
     plugins = plugins or []
-    if ids is None: ids = idgen(entbase)
+    if ids is None: ids = cached_idgen(idgen(entbase))
 
     #FIXME: For now always generate instances from ISBNs, but consider working this through the plugins system
     instancegen = isbn_instancegen
 
-    existing_ids = set()
+    existing_ids = existing_ids_factory()
     #Start the process of writing out the JSON representation of the resulting Versa
-    if out and not canonical: out.write('[')
-    first_record = True
+    jsonw = versajson_writer(out, ndjson=ndjson) if out and not canonical else None
+    resumed = False
+    if checkpoints:
+        #When resuming, the IDs generated & the output written before the checkpoint are carried on with
+        existing_ids, resumed = checkpoints.start_handler(existing_ids, jsonw)
+    if jsonw and not resumed: jsonw.start()
+
+    #Records whose plug-in tasks are outstanding, oldest first, as (model, future, ok)
+    pending = deque()
+    def write_done(keep):
+        #Write out records in order as their tasks are done, until no more than keep are left outstanding
+        while len(pending) > keep:
+            rec_model, future, ok = pending.popleft()
+            future.result()
+            #Whatever an aborted record left behind goes out with the next record, as usual
+            model.add_many([ link for (lid, link) in rec_model ])
+            if not ok: continue
+            if jsonw: jsonw.write_model(model)
+            if postprocess: postprocess()
+        return
 
     try:
         while True:
             input_model = yield
-            leader = None
-            #Add work item record, with actual hash resource IDs based on default or plugged-in algo
-            #FIXME: No plug-in support yet
-            params = {
-                'input_model': input_model, 'logger': logger,
-                #'input_model': input_model, 'output_model': model, 'logger': logger,
-                'entbase': entbase, 'vocabbase': vocabbase, 'ids': ids,
-                'existing_ids': existing_ids, 'plugins': plugins, 'transforms': transforms,
-                'materialize_entity': materialize_entity, 'leader': leader, 'lookups': lookups or {},
-                'loop': loop
-            }
-
-            # Earliest plugin stage, with an unadulterated input model
-            for plugin in plugins:
-                if BF_INPUT_TASK in plugin:
-                    yield from plugin[BF_INPUT_TASK](loop, input_model, params)
-
-            #Prepare cross-references (i.e. 880s)
-            #See the "$6 - Linkage" section of https://www.loc.gov/marc/bibliographic/ecbdcntf.html
-            #XXX: Figure out a way to declare in TRANSFORMS? We might have to deal with non-standard relationship designators: https://github.com/lcnetdev/marc2bibframe/issues/83
-            xrefs = {}
-            remove_links = set()
-            add_links = []
-
-            xref_link_tag_workaround = {}
-            for lid, marc_link in input_model:
-                origin, taglink, val, attribs = marc_link
-                if taglink == MARCXML_NS + '/leader' or taglink.startswith(MARCXML_NS + '/data/9'):
-                    #900 fields are local and might not follow the general xref rules
-                    params['leader'] = leader = val
-                    continue
-                #XXX Do other fields with a 9 digit (not just 9XX) also need to be skipped?
-                if taglink.startswith(MARCXML_NS + '/extra/') or 'tag' not in attribs: continue
-                this_tag = attribs['tag']
-                #if this_tag == '100': import pdb; pdb.set_trace()
-                for xref in attribs.get('6', []):
-                    matched = LINKAGE_PAT.match(xref)
-                    this_taglink, this_occ, this_scriptid, this_rtl = matched.groups() if matched else (None, None, None, None)
-                    if not this_taglink and occ:
-                        control_code = list(marc_lookup(input_model, '001')) or ['NO 001 CONTROL CODE']
-                        dumb_title = list(marc_lookup(input_model, '245$a')) or ['NO 245$a TITLE']
-                        logger.warning('Skipping invalid $6: "{}" for {}: "{}"'.format(xref, control_code[0], dumb_title[0]))
-                        continue
-
-                    if this_tag == this_taglink:
-                        #Pretty sure this is an erroneous self-link, but we've seen this in the wild (e.g. QNL). Issue warning & do the best we can linking via occurrence
-                        #Note: the resulting workround (lookup table from occurence code to the correct tag) will not work in cases of linking from any tag higher in ordinal value than 880 (if such a situation is even possible)
-                        logger.warning('Invalid input: erroneous self-link $6: "{}" from "{}". Trying to work around.'.format(xref, this_tag))
-                        if this_tag != '880':
-                            xref_link_tag_workaround[this_occ] = this_tag
-
-                    #FIXME: Remove this debugging if statament at some point
-                    if scriptid or rtl:
-                        logger.debug('Language info specified in subfield 6, {}'.format(xref))
-
-                    #Locate the matching taglink
-                    if this_tag == '880' and this_occ == '00':
-                        #Special case, no actual xref, used to separate scripts in a record (re Multiscript Records)
-                        #FIXME: Not really handled right now. Presume some sort of merge dynamics will need to be implemented
-                        attribs['tag'] = this_taglink
-                        add_links.append((origin, MARCXML_NS + '/data/' + this_taglink, val, attribs))
-
-                    if xref_link_tag_workaround:
-                        if this_tag == '880':
-                            this_taglink = xref_link_tag_workaround.get(this_occ)
-
-                    links = input_model.match(None, MARCXML_NS + '/data/' + this_taglink)
-                    for that_link in links:
-                        #6 is the cross-reference subfield
-                        for that_ref in link[ATTRIBUTES].get('6', []):
-                            matched = LINKAGE_PAT.match(that_ref)
-                            that_taglink, that_occ, that_scriptid, that_rtl = matched.groups() if matched else (None, None, None, None)
-                            #if not that_tag and that_occ:
-                            #    control_code = list(marc_lookup(input_model, '001')) or ['NO 001 CONTROL CODE']
-                            #    dumb_title = list(marc_lookup(input_model, '245$a')) or ['NO 245$a TITLE']
-                            #    logger.warning('Skipping invalid $6: "{}" for {}: "{}"'.format(to_ref, control_code[0], dumb_title[0]))
-                            #    continue
-                            if ([that_taglink, that_occ] == [this_tag, this_occ]) or (xref_link_tag_workaround and that_occ == this_occ):
-                                if this_tag == '880':
-                                    #This is an 880, which we'll handle by integrating back into the input model using the correct tag, flagged to show the relationship
-                                    remove_links.add(lid)
-
-                                if that_taglink == '880':
-                                    #Rule for 880s: duplicate but link more robustly
-                                    copied_attribs = attribs.copy()
-                                    for k, v in that_link[ATTRIBUTES].items():
-                                        if k[:3] not in ('tag', 'ind'):
-                                            copied_attribs.setdefault(k, []).extend(v)
-                                    add_links.append((origin, MARCXML_NS + '/data/' + this_tag, val, copied_attribs))
-
-            input_model.remove(remove_links)
-            input_model.add_many(add_links)
-
-            # hook for plugins interested in the xref-resolved input model
-            for plugin in plugins:
-                if BF_INPUT_XREF_TASK in plugin:
-                    yield from plugin[BF_INPUT_XREF_TASK](loop, input_model, params)
-
-            #Do one pass to establish work hash
-            #XXX Should crossrefs precede this?
-            bootstrap_dummy_id = next(params['input_model'].match())[ORIGIN]
-            logger.debug('Entering bootstrap phase. Dummy ID: {}'.format(bootstrap_dummy_id))
-
-            params['default-origin'] = bootstrap_dummy_id
-            params['instanceids'] = [bootstrap_dummy_id + '-instance']
-            params['output_model'] = model_factory()
-
-            params['field008'] = leader = None
-            params['fields006'] = fields006 = []
-            params['fields007'] = fields007 = []
-            params['to_postprocess'] = []
-
-            params['origins'] = {WORK_TYPE: bootstrap_dummy_id, INSTANCE_TYPE: params['instanceids'][0]}
-
-            #First apply special patterns for determining the main target resources
-            curr_transforms = transforms.compiled[BOOTSTRAP_PHASE]
-
-            ok = process_marcpatterns(params, curr_transforms, input_model, BOOTSTRAP_PHASE)
+            params = record_params(input_model, entbase, vocabbase, ids, existing_ids,
+                                    plugins, transforms, lookups, logger, loop, seed_ids=seed_ids,
+                                    profiler=profiler, plugin_tasks=plugin_tasks)
+            #With concurrent plug-in tasks each record has a model of its own until they're done
+            rec_model = model if plugin_tasks is None else model_factory()
+            ok = yield from transform_record(loop, input_model, rec_model, params,
+                                                model_factory=model_factory, instancegen=instancegen)
+            if plugin_tasks is not None:
+                #Tasks for resources an aborted record materialized still run
+                future = (yield from finish_record(loop, rec_model, params)) if ok else plugin_tasks.submit(rec_model, params, complete=False)
+                pending.append((rec_model, future, ok))
+                write_done(plugin_tasks.queue_size)
             if not ok: continue #Abort current record if signalled
+            if plugin_tasks is None:
+                yield from finish_record(loop, model, params)
 
-            bootstrap_output = params['output_model']
-            temp_main_target = main_type = None
-            for o, r, t, a in bootstrap_output.match(None, PYBF_BOOTSTRAP_TARGET_REL):
-                #FIXME: We need a better designed way of determining fallback to bib
-                if t is not None: temp_main_target, main_type = o, t
-
-            #Switch to the main output model for processing
-            params['output_model'] = model
-
-            if temp_main_target is None:
-                #If no target was set explicitly fall back to the transforms registered for the biblio phase
-                #params['logger'].debug('WORK HASH ORIGIN {}\n'.format(bootstrap_dummy_id))
-                #params['logger'].debug('WORK HASH MODEL {}\n'.format(repr(bootstrap_output)))
-                workid_data = gather_workid_data(bootstrap_output, bootstrap_dummy_id)
-                workid = materialize_entity('Work', ctx_params=params, data=workid_data, loop=loop)
-                logger.debug('Entering default main phase, Work ID: {0}'.format(workid))
-
-                is_folded = workid in existing_ids
-                existing_ids.add(workid)
-
-                control_code = list(marc_lookup(input_model, '001')) or ['NO 001 CONTROL CODE']
-                dumb_title = list(marc_lookup(input_model, '245$a')) or ['NO 245$a TITLE']
-                logger.debug('Work hash data: {0}'.format(repr(workid_data)))
-                logger.debug('Control code: {0}'.format(control_code[0]))
-                logger.debug('Uniform title: {0}'.format(dumb_title[0]))
-                logger.debug('Work ID: {0}'.format(workid))
-
-                workid = I(iri.absolutize(workid, entbase)) if entbase else I(workid)
-                folded = [workid] if is_folded else []
-
-                model.add(workid, VTYPE_REL, I(iri.absolutize('Work', vocabbase)))
-
-                params['default-origin'] = workid
-                params['folded'] = folded
-
-                #Figure out instances
-                instanceids = instancegen(params, loop, model)
-                params['instanceids'] = instanceids or [None]
-
-                main_transforms = transforms.compiled[DEFAULT_MAIN_PHASE]
-                params['origins'] = {WORK_TYPE: workid, INSTANCE_TYPE: params['instanceids'][0]}
-                phase_target = DEFAULT_MAIN_PHASE
-            else:
-                targetid_data = gather_targetid_data(bootstrap_output, temp_main_target, transforms.orderings[main_type])
-                #params['logger'].debug('Data for resource: {}\n'.format([main_type] + targetid_data))
-                targetid = materialize_entity(main_type, ctx_params=params, data=targetid_data, loop=loop)
-                logger.debug('Entering specialized phase, Target resource ID: {}, type: {}'.format(targetid, main_type))
-
-                is_folded = targetid in existing_ids
-                existing_ids.add(targetid)
-                #Determine next transform phase
-                main_transforms = transforms.compiled[main_type]
-                params['origins'] = {main_type: targetid}
-                params['default-origin'] = targetid
-                phase_target = main_type
-                model.add(I(targetid), VTYPE_REL, I(main_type))
-
-            params['transform_log'] = [] # set()
-            params['fields_used'] = []
-            params['dropped_codes'] = {}
-            #Defensive coding against missing leader or 008
-            params['field008'] = leader = None
-            params['fields006'] = fields006 = []
-            params['fields007'] = fields007 = []
-            params['to_postprocess'] = []
-
-            ok = process_marcpatterns(params, main_transforms, input_model, phase_target)
-            if not ok: continue #Abort current record if signalled
-
-            skipped_rels = set()
-            for op, rels, rid in params['to_postprocess']:
-                for rel in rels: skipped_rels.add(rel)
-                if op == POSTPROCESS_AS_INSTANCE:
-                    if params['instanceids'] == [None]:
-                        params['instanceids'] = [rid]
-                    else:
-                        params['instanceids'].append(rid)
-            instance_postprocess(params, skip_relationships=skipped_rels)
-
-            logger.debug('+')
-
-            #XXX At this point there must be at least one record with a Versa type
-
-            for plugin in plugins:
-                #Each plug-in is a task
-                #task = asyncio.Task(plugin[BF_MARCREC_TASK](loop, relsink, params), loop=loop)
-                if BF_MARCREC_TASK in plugin:
-                    yield from plugin[BF_MARCREC_TASK](loop, model, params)
-                logger.debug("Pending tasks: %s" % asyncio.Task.all_tasks(loop))
-                #FIXME: This blocks and thus serializes the plugin operation, rather than the desired coop scheduling approach
-                #For some reason seting to async task then immediately deferring to next task via yield from sleep leads to the "yield from wasn't used with future" error (Not much clue at: https://codereview.appspot.com/7396044/)
-                #yield from asyncio.Task(asyncio.sleep(0.01), loop=loop)
-                #yield from asyncio.async(asyncio.sleep(0.01))
-                #yield from asyncio.sleep(0.01) #Basically yield to next task
-
-            #Can we somehow move this to passed-in postprocessing?
-            if out and not canonical and not first_record: out.write(',\n')
-            if out:
-                if not canonical:
-                    first_record = False
-                    last_chunk = None
-                    #Using iterencode avoids building a big JSON string in memory, or having to resort to file pointer seeking
-                    #Then again builds a big list in memory, so still working on opt here
-                    for chunk in json.JSONEncoder().iterencode([ link for link in model ]):
-                        if last_chunk is None:
-                            last_chunk = chunk[1:]
-                        else:
-                            out.write(last_chunk)
-                            last_chunk = chunk
-                    if last_chunk: out.write(last_chunk[:-1])
-            #FIXME: Postprocessing should probably be a task too
-            if postprocess: postprocess()
+                #Can we somehow move this to passed-in postprocessing?
+                if jsonw: jsonw.write_model(model)
+                #FIXME: Postprocessing should probably be a task too
+                if postprocess: postprocess()
             #limiting--running count of records processed versus the max number, if any
             limiting[0] += 1
             if limiting[1] is not None and limiting[0] >= limiting[1]:
+                write_done(0)
                 break
+            if checkpoints:
+                #A checkpoint can only be taken once everything read so far is written out
+                if checkpoints.due(): write_done(0)
+                checkpoints.record_done()
     except GeneratorExit:
+        write_done(0)
         logger.debug('Completed processing {0} record{1}.'.format(limiting[0], '' if limiting[0] == 1 else 's'))
-        if out and not canonical: out.write(']')
+        if jsonw: jsonw.close()
 
         #if not plugins: loop.stop()
         for plugin in plugins:
             #Each plug-in is a task
             func = plugin.get(BF_FINAL_TASK)
             if not func: continue
-            task = asyncio.Task(func(loop), loop=loop)
+            task = asyncio.Task(plugin_task(profiler, BF_FINAL_TASK, func, loop), loop=loop)
             _final_tasks.add(task)
             def task_done(task):
                 #print('Task done: ', task)
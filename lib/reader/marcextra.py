@@ -56,6 +56,20 @@ def marc_date_yyyymm(d): # used in 007
 
     return date
 
+#Marks patterns for links on the instance rather than the work
+INSTANCE = object()
+
+#Byte offset into each kind of field of the data covered by the fixed length patterns
+FIXED_LENGTH_OFFSETS = {'006': 1, '007': 0, '008': 18}
+
+def lookup(table, slug=True):
+    '''
+    Value function for fixed length patterns, looking up the character(s) at hand in the table
+    '''
+    if slug:
+        return lambda code: SLUG(table.get(code))
+    return table.get
+
 class transforms(object):
     def __init__(self, vocab=None):
         DEFAULT_VOCAB = { i:i for i in DEFAULT_VOCAB_ITEMS }
@@ -1395,6 +1409,232 @@ class transforms(object):
             'z': 'UnspecifiedCategory',
         }
 
+        # Leader 06 (type of record) to work types
+        self.WORK_06 = dict(
+            a=I(self._vocab[MARC]+"LanguageMaterial"),
+            c=(I(self._vocab[MARC]+"LanguageMaterial"), I(self._vocab[MARC]+"NotatedMusic")),
+            d=(I(self._vocab[MARC]+"LanguageMaterial"), I(self._vocab[MARC]+"Manuscript"), I(self._vocab[MARC]+"NotatedMusic")),
+            e=(I(self._vocab[MARC]+"StillImage"), I(self._vocab[MARC]+"Cartography")),
+            f=(I(self._vocab[MARC]+"Manuscript"), I(self._vocab[MARC]+"Cartography"), I(self._vocab[MARC]+"StillImage")),
+            g=I(self._vocab[MARC]+"MovingImage"),
+            i=(I(self._vocab[MARC]+"Audio"), I(self._vocab[MARC]+"Nonmusical"), I(self._vocab[MARC]+"Sounds")),
+            j=(I(self._vocab[MARC]+"Audio"), I(self._vocab[MARC]+"Musical")),
+            k=I(self._vocab[MARC]+"StillImage"),
+            m=(I(self._vocab[MARC]+"Multimedia"), I(self._vocab[MARC]+"Software")),
+            o=I(self._vocab[MARC]+"Kit"),
+            p=(I(self._vocab[MARC]+"Collection"), I(self._vocab[MARC]+"Multimedia")),
+            r=I(self._vocab[MARC]+"ThreeDimensionalObject"),
+            t=(I(self._vocab[MARC]+"LanguageMaterial"), I(self._vocab[MARC]+"Manuscript"))
+            )
+
+        # Leader 06 (type of record) to instance types
+        self.INSTANCE_06 = dict(
+            )
+
+        # Registry of patterns to be processed from 006/007/008 fields, by material type or category
+        # {index key: (origin, rel, value function)}
+        # There are 3 types of index keys to these dicts
+        # 1) An int, simply processed as a character position
+        # 2) A tuple of ints, processed once for each character position in the list
+        # 3) A tuple starting with 'slice' and then 2 ints, processed as a character chunk/slice as a whole
+        # The value function is passed the character(s) at hand. If it returns None it's a signal to do nothing for the case at hand
+        # origin is INSTANCE for links on the instance, otherwise None, meaning the work
+        #
+        # The current pattern structure could be simplified greatly if it
+        # internalized the common relationship between property name and the map
+        # for that field FIXME
+        self.FIXED_LENGTH_PATTERNS = dict(
+            Books = {
+                (0, 1, 2, 3): (None, I(self._vocab[MARC]+'illustrations'), lookup(self.Books['Illustrations'])),
+                4: (None, I(self._vocab[MARC]+'targetAudience'), lookup(self.AUDIENCE)),
+                5: (INSTANCE, I(self._vocab[MARC]+'formOfItem'), lookup(self.FORM_OF_ITEM)),
+                (6, 7, 8, 9): (None, I(self._vocab[MARC]+'natureOfContents'), lookup(self.NATURE_OF_CONTENTS)),
+                10: (None, I(self._vocab[MARC]+'governmentPublication'), lookup(self.GOVT_PUBLICATION)),
+                11: (None, I(self._vocab[VTYPE]), lookup(self.CONFERENCE_PUBLICATION, slug=False)),
+                12: (None, I(self._vocab[VTYPE]), lookup(self.Books['Festschrift'], slug=False)),
+                13: (None, I(self._vocab[MARC]+'index'), lookup(self.INDEX)),
+                15: (None, I(self._vocab[MARC]+'literaryForm'), lookup(self.LITERARY_FORM)),
+                16: (None, I(self._vocab[MARC]+'biographical'), lookup(self.BIOGRAPHICAL)),
+            },
+            Music = {
+                ('slice', 0, 2): (None, I(self._vocab[MARC]+'formOfComposition'), lookup(self.Music['FormOfComposition'])),
+                2: (None, I(self._vocab[MARC]+'formatOfMusic'), lookup(self.Music['FormatOfMusic'])),
+                3: (None, I(self._vocab[MARC]+'musicParts'), lookup(self.Music['MusicParts'])),
+                4: (None, I(self._vocab[MARC]+'targetAudience'), lookup(self.AUDIENCE)),
+                5: (INSTANCE, I(self._vocab[MARC]+'formOfItem'), lookup(self.FORM_OF_ITEM)),
+                (6, 7, 8, 9, 10, 11): (None, I(self._vocab[MARC]+'accompanyingMatter'), lookup(self.Music['AccompanyingMatter'])),
+                (12, 13): (None, I(self._vocab[MARC]+'literaryTextForSoundRecordings'), lookup(self.Music['LiteraryTextForSoundRecordings'])),
+                15: (None, I(self._vocab[MARC]+'transpositionAndArrangement'), lookup(self.Music['TranspositionAndArrangement'])),
+            },
+            Maps = { #006/008
+                (0, 1, 2, 3): (None, I(self._vocab[MARC]+'relief'), lookup(self.Maps['Relief'])),
+                ('slice', 4, 5): (None, I(self._vocab[MARC]+'projection'), lookup(self.Maps['Projection'])),
+                7: (None, I(self._vocab[MARC]+'characteristic'), lookup(self.Maps['TypeOfCartographicMaterial'])),
+                10: (None, I(self._vocab[MARC]+'governmentPublication'), lookup(self.GOVT_PUBLICATION)),
+                11: (INSTANCE, I(self._vocab[MARC]+'formOfItem'), lookup(self.FORM_OF_ITEM)),
+                13: (None, I(self._vocab[MARC]+'index'), lookup(self.INDEX)),
+                (15, 16): (None, I(self._vocab[MARC]+'specialFormatCharacteristics'), lookup(self.Maps['SpecialFormatCharacteristics'])),
+            },
+            VisualMaterials = {
+                ('slice', 0, 3): (None, I(self._vocab[MARC]+'runtime'), self.marc_int),
+                4: (None, I(self._vocab[MARC]+'targetAudience'), lookup(self.AUDIENCE)),
+                10: (None, I(self._vocab[MARC]+'governmentPublication'), lookup(self.GOVT_PUBLICATION)),
+                11: (INSTANCE, I(self._vocab[MARC]+'formOfItem'), lookup(self.FORM_OF_ITEM)),
+                15: (None, I(self._vocab[MARC]+'characteristic'), lookup(self.VisualMaterials['TypeOfVisualMaterial'])),
+                16: (None, I(self._vocab[MARC]+'technique'), lookup(self.VisualMaterials['Technique'])),
+            },
+            ComputerFiles = {
+                4: (None, I(self._vocab[MARC]+'targetAudience'), lookup(self.AUDIENCE)),
+                5: (INSTANCE, I(self._vocab[MARC]+'formOfItem'), lookup(self.ComputerFiles['FormOfItem'])),
+                8: (None, I(self._vocab[MARC]+'characteristic'), lookup(self.ComputerFiles['TypeOfComputerFile'])),
+                10: (None, I(self._vocab[MARC]+'governmentPublication'), lookup(self.GOVT_PUBLICATION)),
+            },
+            MixedMaterials = {
+                5: (None, I(self._vocab[VTYPE]), lookup(self.FORM_OF_ITEM, slug=False)),
+            },
+            ContinuingResources = {
+                0: (None, I(self._vocab[MARC]+'frequency'), lookup(self.ContinuingResources['Frequency'])),
+                1: (None, I(self._vocab[MARC]+'regularity'), lookup(self.ContinuingResources['Regularity'])),
+                3: (None, I(self._vocab[MARC]+'characteristic'), lookup(self.ContinuingResources['TypeOfContinuingResource'])),
+                4: (INSTANCE, I(self._vocab[MARC]+'formOfOriginalItem'), lookup(self.FORM_OF_ITEM)),
+                5: (INSTANCE, I(self._vocab[MARC]+'formOfItem'), lookup(self.FORM_OF_ITEM)),
+                6: (None, I(self._vocab[MARC]+'natureOfEntireWork'), lookup(self.NATURE_OF_CONTENTS)),
+                (7,8,9): (None, I(self._vocab[MARC]+'natureOfContents'), lookup(self.NATURE_OF_CONTENTS)),
+                10: (None, I(self._vocab[MARC]+'governmentPublication'), lookup(self.GOVT_PUBLICATION)),
+                11: (None, I(self._vocab[VTYPE]), lookup(self.CONFERENCE_PUBLICATION, slug=False)),
+                15: (None, I(self._vocab[MARC]+'originalAlphabetOrScriptOfTitle'), lookup(self.ContinuingResources['OriginalAlphabetOrScriptOfTitle'])),
+                16: (None, I(self._vocab[MARC]+'entryConvention'), lookup(self.ContinuingResources['EntryConvention'])),
+            },
+            Map = { #007
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.Map['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'color'), lookup(self.COLOR)),
+                4: (INSTANCE, I(self._vocab[MARC]+'physicalMedium'), lookup(self.PHYSICAL_MEDIUM)),
+                5: (INSTANCE, I(self._vocab[MARC]+'typeOfReproduction'), lookup(self.TYPE_OF_REPRODUCTION)),
+                6: (INSTANCE, I(self._vocab[MARC]+'productionReproductionDetails'), lookup(self.PRODUCTION_REPRODUCTION_DETAILS)),
+                7: (INSTANCE, I(self._vocab[MARC]+'positiveNegativeAspect'), lookup(self.POSITIVE_NEGATIVE_ASPECT)),
+            },
+            ElectronicResource = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.ElectronicResource['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'color'), lookup(self.COLOR)),
+                4: (INSTANCE, I(self._vocab[MARC]+'dimensions'), lookup(self.ElectronicResource['Dimensions'])),
+                5: (INSTANCE, I(self._vocab[MARC]+'sound'), lookup(self.ElectronicResource['Sound'])),
+                ('slice', 6, 8): (None, I(self._vocab[MARC]+'imageBitDepth'), self.marc_int),
+                9: (INSTANCE, I(self._vocab[MARC]+'fileFormat'), lookup(self.ElectronicResource['FileFormats'])),
+                10: (INSTANCE, I(self._vocab[MARC]+'qualityAssuranceTargets'), lookup(self.ElectronicResource['QualityAssuranceTargets'])),
+                11: (INSTANCE, I(self._vocab[MARC]+'antecedentSource'), lookup(self.ElectronicResource['AntecedentSource'])),
+                12: (INSTANCE, I(self._vocab[MARC]+'levelOfCompression'), lookup(self.ElectronicResource['LevelOfCompression'])),
+                13: (INSTANCE, I(self._vocab[MARC]+'reformattingQuality'), lookup(self.ElectronicResource['ReformattingQuality'])),
+            },
+            Globe = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.Globe['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'color'), lookup(self.COLOR)),
+                4: (INSTANCE, I(self._vocab[MARC]+'physicalMedium'), lookup(self.PHYSICAL_MEDIUM)),
+                5: (INSTANCE, I(self._vocab[MARC]+'typeOfReproduction'), lookup(self.TYPE_OF_REPRODUCTION)),
+            },
+            TactileMaterial = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.TactileMaterial['SpecificMaterialDesignation'])),
+                ('slice', 3, 4): (INSTANCE, I(self._vocab[MARC]+'classOfBrailleWriting'), lookup(self.TactileMaterial['ClassOfBrailleWriting'])),
+                5: (INSTANCE, I(self._vocab[MARC]+'levelOfContraction'), lookup(self.TactileMaterial['LevelOfContraction'])),
+                (6, 7, 8): (INSTANCE, I(self._vocab[MARC]+'brailleMusicFormat'), lookup(self.TactileMaterial['BrailleMusicFormat'])),
+                9: (INSTANCE, I(self._vocab[MARC]+'specialPhysicalCharacteristics'), lookup(self.TactileMaterial['SpecialPhysicalCharacteristics'])),
+            },
+            ProjectedGraphic = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.ProjectedGraphic['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'color'), lookup(self.COLOR)),
+                4: (INSTANCE, I(self._vocab[MARC]+'baseOfEmulsion'), lookup(self.ProjectedGraphic['SpecificMaterialDesignation'])),
+                5: (INSTANCE, I(self._vocab[MARC]+'soundOnMediumOrSeparate'), lookup(self.SOUND_ON_MEDIUM_OR_SEPARATE)),
+                6: (INSTANCE, I(self._vocab[MARC]+'mediumForSound'), lookup(self.MEDIUM_FOR_SOUND)),
+                7: (INSTANCE, I(self._vocab[MARC]+'dimensions'), lookup(self.DIMENSIONS_FILM)),
+                8: (INSTANCE, I(self._vocab[MARC]+'secondarySupportMaterial'), lookup(self.SUPPORT_MATERIAL)),
+            },
+            Microform = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.Microform['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'positiveNegativeAspect'), lookup(self.POSITIVE_NEGATIVE_ASPECT)),
+                4: (INSTANCE, I(self._vocab[MARC]+'dimensions'), lookup(self.Microform['Dimensions'])),
+                5: (INSTANCE, I(self._vocab[MARC]+'reductionRatioRange'), lookup(self.Microform['ReductionRatioRange'])),
+                ('slice', 6, 8): (INSTANCE, I(self._vocab[MARC]+'reductionRatio'), str),
+                9: (INSTANCE, I(self._vocab[MARC]+'color'), lookup(self.COLOR)),
+               10: (INSTANCE, I(self._vocab[MARC]+'emulsionOnFilm'), lookup(self.Microform['EmulsionOnFilm'])),
+               11: (INSTANCE, I(self._vocab[MARC]+'generation'), lookup(self.Microform['Generation'])),
+               12: (INSTANCE, I(self._vocab[MARC]+'baseOfFilm'), lookup(self.BASE_OF_FILM)),
+            },
+            NonprojectedGraphic = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.NonprojectedGraphic['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'color'), lookup(self.COLOR)),
+                4: (INSTANCE, I(self._vocab[MARC]+'primarySupportMaterial'), lookup(self.SUPPORT_MATERIAL)),
+                5: (INSTANCE, I(self._vocab[MARC]+'secondarySupportMaterial'), lookup(self.SUPPORT_MATERIAL)),
+            },
+            MotionPicture = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.MotionPicture['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'color'), lookup(self.COLOR)),
+                4: (INSTANCE, I(self._vocab[MARC]+'motionPicturePresentationFormat'), lookup(self.MotionPicture['MotionPicturePresentationFormat'])),
+                5: (INSTANCE, I(self._vocab[MARC]+'soundOnMediumOrSeparate'), lookup(self.SOUND_ON_MEDIUM_OR_SEPARATE)),
+                6: (INSTANCE, I(self._vocab[MARC]+'mediumForSound'), lookup(self.MEDIUM_FOR_SOUND)),
+                7: (INSTANCE, I(self._vocab[MARC]+'dimensions'), lookup(self.DIMENSIONS_FILM)),
+                8: (INSTANCE, I(self._vocab[MARC]+'configurationOfPlaybackChannels'), lookup(self.CONFIGURATION_OF_PLAYBACK_CHANNELS)),
+                9: (INSTANCE, I(self._vocab[MARC]+'productionElements'), lookup(self.MotionPicture['ProductionElements'])),
+               10: (INSTANCE, I(self._vocab[MARC]+'positiveNegativeAspect'), lookup(self.POSITIVE_NEGATIVE_ASPECT)),
+               11: (INSTANCE, I(self._vocab[MARC]+'generation'), lookup(self.MotionPicture['Generation'])),
+               12: (INSTANCE, I(self._vocab[MARC]+'baseOfFilm'), lookup(self.BASE_OF_FILM)),
+               13: (INSTANCE, I(self._vocab[MARC]+'refinedCategoriesOfColor'), lookup(self.MotionPicture['RefinedCategoriesOfColor'])),
+               14: (INSTANCE, I(self._vocab[MARC]+'kindOfColorStockOrPrint'), lookup(self.MotionPicture['KindOfColorStockOrPrint'])),
+               15: (INSTANCE, I(self._vocab[MARC]+'deteriorationStage'), lookup(self.MotionPicture['DeteriorationStage'])),
+               16: (INSTANCE, I(self._vocab[MARC]+'completeness'), lookup(self.MotionPicture['Completeness'])),
+               ('slice', 17, 23): (INSTANCE, I(self._vocab[MARC]+'filmInspectionDate'), marc_date_yyyymm),
+            },
+            Kit = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.Kit['SpecificMaterialDesignation'])),
+            },
+            NotatedMusic = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.NotatedMusic['SpecificMaterialDesignation'])),
+            },
+            RemoteSensingImage = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.RemoteSensingImage['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'altitudeOfSensor'), lookup(self.RemoteSensingImage['AltitudeOfSensor'])),
+                4: (INSTANCE, I(self._vocab[MARC]+'attitudeOfSensor'), lookup(self.RemoteSensingImage['AttitudeOfSensor'])),
+                5: (INSTANCE, I(self._vocab[MARC]+'cloudCover'), lookup(self.RemoteSensingImage['CloudCover'])),
+                6: (INSTANCE, I(self._vocab[MARC]+'platformConstructionType'), lookup(self.RemoteSensingImage['PlatformConstructionType'])),
+                7: (INSTANCE, I(self._vocab[MARC]+'platformUseCategory'), lookup(self.RemoteSensingImage['PlatformUseCategory'])),
+                8: (INSTANCE, I(self._vocab[MARC]+'sensorType'), lookup(self.RemoteSensingImage['SensorType'])),
+                ('slice', 9, 10): (INSTANCE, I(self._vocab[MARC]+'dataType'), lookup(self.RemoteSensingImage['DataType'])),
+            },
+            SoundRecording = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.SoundRecording['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'speed'), lookup(self.SoundRecording['Speed'])),
+                4: (INSTANCE, I(self._vocab[MARC]+'configurationOfPlaybackChannels'), lookup(self.CONFIGURATION_OF_PLAYBACK_CHANNELS)),
+                5: (INSTANCE, I(self._vocab[MARC]+'grooveWidthPitch'), lookup(self.SoundRecording['GrooveWidthPitch'])),
+                6: (INSTANCE, I(self._vocab[MARC]+'dimensions'), lookup(self.SoundRecording['Dimensions'])),
+                7: (INSTANCE, I(self._vocab[MARC]+'tapeWidth'), lookup(self.SoundRecording['TapeWidth'])),
+                8: (INSTANCE, I(self._vocab[MARC]+'tapeConfiguration'), lookup(self.SoundRecording['TapeConfiguration'])),
+                9: (INSTANCE, I(self._vocab[MARC]+'kindOfDiscCylinderOrTape'), lookup(self.SoundRecording['KindOfDiscCylinderOrTape'])),
+               10: (INSTANCE, I(self._vocab[MARC]+'kindOfMaterial'), lookup(self.SoundRecording['KindOfMaterial'])),
+               11: (INSTANCE, I(self._vocab[MARC]+'kindOfCutting'), lookup(self.SoundRecording['KindOfCutting'])),
+               12: (INSTANCE, I(self._vocab[MARC]+'specialPlaybackCharacteristics'), lookup(self.SoundRecording['SpecialPlaybackCharacteristics'])),
+               13: (INSTANCE, I(self._vocab[MARC]+'captureAndStorageTechnique'), lookup(self.SoundRecording['CaptureAndStorageTechnique'])),
+            },
+            Text = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.Text['SpecificMaterialDesignation'])),
+            },
+            VideoRecording = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.VideoRecording['SpecificMaterialDesignation'])),
+                3: (INSTANCE, I(self._vocab[MARC]+'color'), lookup(self.COLOR)),
+                4: (INSTANCE, I(self._vocab[MARC]+'videorecordingFormat'), lookup(self.VideoRecording['VideorecordingFormat'])),
+                5: (INSTANCE, I(self._vocab[MARC]+'soundOnMediumOrSeparate'), lookup(self.SOUND_ON_MEDIUM_OR_SEPARATE)),
+                6: (INSTANCE, I(self._vocab[MARC]+'mediumForSound'), lookup(self.MEDIUM_FOR_SOUND)),
+                7: (INSTANCE, I(self._vocab[MARC]+'dimensions'), lookup(self.VideoRecording['Dimensions'])),
+                8: (INSTANCE, I(self._vocab[MARC]+'configurationOfPlaybackChannels'), lookup(self.CONFIGURATION_OF_PLAYBACK_CHANNELS)),
+            },
+            UnspecifiedCategory = {
+                1: (INSTANCE, I(self._vocab[MARC]+'specificMaterialDesignation'), lookup(self.UnspecifiedCategory['SpecificMaterialDesignation'])),
+            }
+        )
+
+        # Patterns compiled against the byte offset of the germane data, {(material type, offset): patterns}
+        self._fixed_length = {}
+        for offset in FIXED_LENGTH_OFFSETS.values():
+            for typ in self.FIXED_LENGTH_PATTERNS:
+                self._compile_fixed_length(typ, offset)
+
         return
 
     def marc_int(self, rt):
@@ -1416,6 +1656,31 @@ class transforms(object):
 
         return mi
 
+    def _compile_fixed_length(self, typ, offset):
+        '''
+        Compile the patterns for a material type or category into a tuple of
+        (character positions, origin, rel, value function), with the positions (ints or slices)
+        shifted by the byte offset, i.e. 18 bytes for 006->008. Cached for later use
+
+        Returns None if there are no patterns for the material type
+        '''
+        patterns = self.FIXED_LENGTH_PATTERNS.get(typ)
+        if patterns is None: return None
+        compiled = []
+        for k, (origin, rel, value) in patterns.items():
+            if isinstance(k, tuple):
+                if k[0] == 'slice':
+                    positions = (slice(k[1]+offset, k[2]+offset),)
+                else:
+                    positions = tuple((kk+offset for kk in k))
+            else: # int
+                positions = (k+offset,)
+            compiled.append((positions, origin, rel, value))
+
+        compiled = tuple(compiled)
+        self._fixed_length[typ, offset] = compiled
+        return compiled
+
     def material_type_by_leader(self, leader, logger):
 
         # first perform 6/7 lookup, then fallback to 6 lookup
@@ -1458,31 +1723,11 @@ class transforms(object):
         work = I(params['default-origin'])
         instance = params['instanceids'][0]
         instance = I(instance) if instance else None
-        work_06 = dict(
-            a=I(self._vocab[MARC]+"LanguageMaterial"),
-            c=(I(self._vocab[MARC]+"LanguageMaterial"), I(self._vocab[MARC]+"NotatedMusic")),
-            d=(I(self._vocab[MARC]+"LanguageMaterial"), I(self._vocab[MARC]+"Manuscript"), I(self._vocab[MARC]+"NotatedMusic")),
-            e=(I(self._vocab[MARC]+"StillImage"), I(self._vocab[MARC]+"Cartography")),
-            f=(I(self._vocab[MARC]+"Manuscript"), I(self._vocab[MARC]+"Cartography"), I(self._vocab[MARC]+"StillImage")),
-            g=I(self._vocab[MARC]+"MovingImage"),
-            i=(I(self._vocab[MARC]+"Audio"), I(self._vocab[MARC]+"Nonmusical"), I(self._vocab[MARC]+"Sounds")),
-            j=(I(self._vocab[MARC]+"Audio"), I(self._vocab[MARC]+"Musical")),
-            k=I(self._vocab[MARC]+"StillImage"),
-            m=(I(self._vocab[MARC]+"Multimedia"), I(self._vocab[MARC]+"Software")),
-            o=I(self._vocab[MARC]+"Kit"),
-            p=(I(self._vocab[MARC]+"Collection"), I(self._vocab[MARC]+"Multimedia")),
-            r=I(self._vocab[MARC]+"ThreeDimensionalObject"),
-            t=(I(self._vocab[MARC]+"LanguageMaterial"), I(self._vocab[MARC]+"Manuscript"))
-            )
-
-        instance_06 = dict(
-            )
-
         _06 = leader[6]
-        if _06 in work_06.keys():
-            yield work, I(self._vocab[VTYPE]), work_06[_06]
-        if _06 in instance_06.keys():
-            yield instance, I(self._vocab[VTYPE]), instance_06[_06]
+        if _06 in self.WORK_06:
+            yield work, I(self._vocab[VTYPE]), self.WORK_06[_06]
+        if _06 in self.INSTANCE_06:
+            yield instance, I(self._vocab[VTYPE]), self.INSTANCE_06[_06]
         if leader[7] in ('c', 's'):
             yield None, I(self._vocab[VTYPE]), I(self._vocab[MARC]+"Collection")
 
@@ -1514,224 +1759,20 @@ class transforms(object):
         #In most cases we dont have to actually check for these, as they'll just not be in the value lookup tables above
         SKIP_CHARS = ('#', ' ', '|')
 
-        # Registry of patterns to be processed from 008 field {index key: value function}
-        # There are 3 types of index keys to this dict
-        # 1) An int, simply processed as a character position passed to the value function
-        # 2) A tuple of ints, processed once for each character position in the list, each int passed to the value function
-        # 3) A tuple starting with 'slice' and then 2 ints, processed as a character chunk/slice passed as a whole to the value function
-        # If the value function returns None or a tuple with None in the last position, it's a signal to do nothing for the case at hand
-        #
-        # The current pattern structure could be simplified greatly if it
-        # internalized the common relationship between property name and the map
-        # for that field FIXME
-        PATTERNS = dict(
-            Books = {
-                (0, 1, 2, 3): lambda i: (None, I(self._vocab[MARC]+'illustrations'), SLUG(self.Books['Illustrations'].get(info[i]))),
-                4: lambda i: (None, I(self._vocab[MARC]+'targetAudience'), SLUG(self.AUDIENCE.get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'formOfItem'), SLUG(self.FORM_OF_ITEM.get(info[i]))),
-                (6, 7, 8, 9): lambda i: (None, I(self._vocab[MARC]+'natureOfContents'), SLUG(self.NATURE_OF_CONTENTS.get(info[i]))),
-                10: lambda i: (None, I(self._vocab[MARC]+'governmentPublication'), SLUG(self.GOVT_PUBLICATION.get(info[i]))),
-                11: lambda i: (None, I(self._vocab[VTYPE]), self.CONFERENCE_PUBLICATION.get(info[i])),
-                12: lambda i: (None, I(self._vocab[VTYPE]), self.Books['Festschrift'].get(info[i])),
-                13: lambda i: (None, I(self._vocab[MARC]+'index'), SLUG(self.INDEX.get(info[i]))),
-                15: lambda i: (None, I(self._vocab[MARC]+'literaryForm'), SLUG(self.LITERARY_FORM.get(info[i]))),
-                16: lambda i: (None, I(self._vocab[MARC]+'biographical'), SLUG(self.BIOGRAPHICAL.get(info[i]))),
-            },
-            Music = {
-                ('slice', 0, 2): lambda i: (None, I(self._vocab[MARC]+'formOfComposition'), SLUG(self.Music['FormOfComposition'].get(info[i]))),
-                2: lambda i: (None, I(self._vocab[MARC]+'formatOfMusic'), SLUG(self.Music['FormatOfMusic'].get(info[i]))),
-                3: lambda i: (None, I(self._vocab[MARC]+'musicParts'), SLUG(self.Music['MusicParts'].get(info[i]))),
-                4: lambda i: (None, I(self._vocab[MARC]+'targetAudience'), SLUG(self.AUDIENCE.get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'formOfItem'), SLUG(self.FORM_OF_ITEM.get(info[i]))),
-                (6, 7, 8, 9, 10, 11): lambda i: (None, I(self._vocab[MARC]+'accompanyingMatter'), SLUG(self.Music['AccompanyingMatter'].get(info[i]))),
-                (12, 13): lambda i: (None, I(self._vocab[MARC]+'literaryTextForSoundRecordings'), SLUG(self.Music['LiteraryTextForSoundRecordings'].get(info[i]))),
-                15: lambda i: (None, I(self._vocab[MARC]+'transpositionAndArrangement'), SLUG(self.Music['TranspositionAndArrangement'].get(info[i]))),
-            },
-            Maps = { #006/008
-                (0, 1, 2, 3): lambda i: (None, I(self._vocab[MARC]+'relief'), SLUG(self.Maps['Relief'].get(info[i]))),
-                ('slice', 4, 5): lambda i: (None, I(self._vocab[MARC]+'projection'), SLUG(self.Maps['Projection'].get(info[i]))),
-                7: lambda i: (None, I(self._vocab[MARC]+'characteristic'), SLUG(self.Maps['TypeOfCartographicMaterial'].get(info[i]))),
-                10: lambda i: (None, I(self._vocab[MARC]+'governmentPublication'), SLUG(self.GOVT_PUBLICATION.get(info[i]))),
-                11: lambda i: (instance, I(self._vocab[MARC]+'formOfItem'), SLUG(self.FORM_OF_ITEM.get(info[i]))),
-                13: lambda i: (None, I(self._vocab[MARC]+'index'), SLUG(self.INDEX.get(info[i]))),
-                (15, 16): lambda i: (None, I(self._vocab[MARC]+'specialFormatCharacteristics'), SLUG(self.Maps['SpecialFormatCharacteristics'].get(info[i]))),
-            },
-            VisualMaterials = {
-                ('slice', 0, 3): lambda i: (None, I(self._vocab[MARC]+'runtime'), self.marc_int(info[i])),
-                4: lambda i: (None, I(self._vocab[MARC]+'targetAudience'), SLUG(self.AUDIENCE.get(info[i]))),
-                10: lambda i: (None, I(self._vocab[MARC]+'governmentPublication'), SLUG(self.GOVT_PUBLICATION.get(info[i]))),
-                11: lambda i: (instance, I(self._vocab[MARC]+'formOfItem'), SLUG(self.FORM_OF_ITEM.get(info[i]))),
-                15: lambda i: (None, I(self._vocab[MARC]+'characteristic'), SLUG(self.VisualMaterials['TypeOfVisualMaterial'].get(info[i]))),
-                16: lambda i: (None, I(self._vocab[MARC]+'technique'), SLUG(self.VisualMaterials['Technique'].get(info[i]))),
-            },
-            ComputerFiles = {
-                4: lambda i: (None, I(self._vocab[MARC]+'targetAudience'), SLUG(self.AUDIENCE.get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'formOfItem'), SLUG(self.ComputerFiles['FormOfItem'].get(info[i]))),
-                8: lambda i: (None, I(self._vocab[MARC]+'characteristic'), SLUG(self.ComputerFiles['TypeOfComputerFile'].get(info[i]))),
-                10: lambda i: (None, I(self._vocab[MARC]+'governmentPublication'), SLUG(self.GOVT_PUBLICATION.get(info[i]))),
-            },
-            MixedMaterials = {
-                5: lambda i: (None, I(self._vocab[VTYPE]), self.FORM_OF_ITEM.get(info[i])),
-            },
-            ContinuingResources = {
-                0: lambda i: (None, I(self._vocab[MARC]+'frequency'), SLUG(self.ContinuingResources['Frequency'].get(info[i]))),
-                1: lambda i: (None, I(self._vocab[MARC]+'regularity'), SLUG(self.ContinuingResources['Regularity'].get(info[i]))),
-                3: lambda i: (None, I(self._vocab[MARC]+'characteristic'), SLUG(self.ContinuingResources['TypeOfContinuingResource'].get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'formOfOriginalItem'), SLUG(self.FORM_OF_ITEM.get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'formOfItem'), SLUG(self.FORM_OF_ITEM.get(info[i]))),
-                6: lambda i: (None, I(self._vocab[MARC]+'natureOfEntireWork'), SLUG(self.NATURE_OF_CONTENTS.get(info[i]))),
-                (7,8,9): lambda i: (None, I(self._vocab[MARC]+'natureOfContents'), SLUG(self.NATURE_OF_CONTENTS.get(info[i]))),
-                10: lambda i: (None, I(self._vocab[MARC]+'governmentPublication'), SLUG(self.GOVT_PUBLICATION.get(info[i]))),
-                11: lambda i: (None, I(self._vocab[VTYPE]), self.CONFERENCE_PUBLICATION.get(info[i])),
-                15: lambda i: (None, I(self._vocab[MARC]+'originalAlphabetOrScriptOfTitle'), SLUG(self.ContinuingResources['OriginalAlphabetOrScriptOfTitle'].get(info[i]))),
-                16: lambda i: (None, I(self._vocab[MARC]+'entryConvention'), SLUG(self.ContinuingResources['EntryConvention'].get(info[i]))),
-            },
-            Map = { #007
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.Map['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'color'), SLUG(self.COLOR.get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'physicalMedium'), SLUG(self.PHYSICAL_MEDIUM.get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'typeOfReproduction'), SLUG(self.TYPE_OF_REPRODUCTION.get(info[i]))),
-                6: lambda i: (instance, I(self._vocab[MARC]+'productionReproductionDetails'), SLUG(self.PRODUCTION_REPRODUCTION_DETAILS.get(info[i]))),
-                7: lambda i: (instance, I(self._vocab[MARC]+'positiveNegativeAspect'), SLUG(self.POSITIVE_NEGATIVE_ASPECT.get(info[i]))),
-            },
-            ElectronicResource = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.ElectronicResource['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'color'), SLUG(self.COLOR.get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'dimensions'), SLUG(self.ElectronicResource['Dimensions'].get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'sound'), SLUG(self.ElectronicResource['Sound'].get(info[i]))),
-                ('slice', 6, 8): lambda i: (None, I(self._vocab[MARC]+'imageBitDepth'), self.marc_int(info[i])),
-                9: lambda i: (instance, I(self._vocab[MARC]+'fileFormat'), SLUG(self.ElectronicResource['FileFormats'].get(info[i]))),
-                10: lambda i: (instance, I(self._vocab[MARC]+'qualityAssuranceTargets'), SLUG(self.ElectronicResource['QualityAssuranceTargets'].get(info[i]))),
-                11: lambda i: (instance, I(self._vocab[MARC]+'antecedentSource'), SLUG(self.ElectronicResource['AntecedentSource'].get(info[i]))),
-                12: lambda i: (instance, I(self._vocab[MARC]+'levelOfCompression'), SLUG(self.ElectronicResource['LevelOfCompression'].get(info[i]))),
-                13: lambda i: (instance, I(self._vocab[MARC]+'reformattingQuality'), SLUG(self.ElectronicResource['ReformattingQuality'].get(info[i]))),
-            },
-            Globe = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.Globe['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'color'), SLUG(self.COLOR.get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'physicalMedium'), SLUG(self.PHYSICAL_MEDIUM.get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'typeOfReproduction'), SLUG(self.TYPE_OF_REPRODUCTION.get(info[i]))),
-            },
-            TactileMaterial = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.TactileMaterial['SpecificMaterialDesignation'].get(info[i]))),
-                ('slice', 3, 4): lambda i: (instance, I(self._vocab[MARC]+'classOfBrailleWriting'), SLUG(self.TactileMaterial['ClassOfBrailleWriting'].get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'levelOfContraction'), SLUG(self.TactileMaterial['LevelOfContraction'].get(info[i]))),
-                (6, 7, 8): lambda i: (instance, I(self._vocab[MARC]+'brailleMusicFormat'), SLUG(self.TactileMaterial['BrailleMusicFormat'].get(info[i]))),
-                9: lambda i: (instance, I(self._vocab[MARC]+'specialPhysicalCharacteristics'), SLUG(self.TactileMaterial['SpecialPhysicalCharacteristics'].get(info[i]))),
-            },
-            ProjectedGraphic = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.ProjectedGraphic['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'color'), SLUG(self.COLOR.get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'baseOfEmulsion'), SLUG(self.ProjectedGraphic['SpecificMaterialDesignation'].get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'soundOnMediumOrSeparate'), SLUG(self.SOUND_ON_MEDIUM_OR_SEPARATE.get(info[i]))),
-                6: lambda i: (instance, I(self._vocab[MARC]+'mediumForSound'), SLUG(self.MEDIUM_FOR_SOUND.get(info[i]))),
-                7: lambda i: (instance, I(self._vocab[MARC]+'dimensions'), SLUG(self.DIMENSIONS_FILM.get(info[i]))),
-                8: lambda i: (instance, I(self._vocab[MARC]+'secondarySupportMaterial'), SLUG(self.SUPPORT_MATERIAL.get(info[i]))),
-            },
-            Microform = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.Microform['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'positiveNegativeAspect'), SLUG(self.POSITIVE_NEGATIVE_ASPECT.get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'dimensions'), SLUG(self.Microform['Dimensions'].get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'reductionRatioRange'), SLUG(self.Microform['ReductionRatioRange'].get(info[i]))),
-                ('slice', 6, 8): lambda i: (instance, I(self._vocab[MARC]+'reductionRatio'), info[i]),
-                9: lambda i: (instance, I(self._vocab[MARC]+'color'), SLUG(self.COLOR.get(info[i]))),
-               10: lambda i: (instance, I(self._vocab[MARC]+'emulsionOnFilm'), SLUG(self.Microform['EmulsionOnFilm'].get(info[i]))),
-               11: lambda i: (instance, I(self._vocab[MARC]+'generation'), SLUG(self.Microform['Generation'].get(info[i]))),
-               12: lambda i: (instance, I(self._vocab[MARC]+'baseOfFilm'), SLUG(self.BASE_OF_FILM.get(info[i]))),
-            },
-            NonprojectedGraphic = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.NonprojectedGraphic['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'color'), SLUG(self.COLOR.get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'primarySupportMaterial'), SLUG(self.SUPPORT_MATERIAL.get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'secondarySupportMaterial'), SLUG(self.SUPPORT_MATERIAL.get(info[i]))),
-            },
-            MotionPicture = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.MotionPicture['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'color'), SLUG(self.COLOR.get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'motionPicturePresentationFormat'), SLUG(self.MotionPicture['MotionPicturePresentationFormat'].get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'soundOnMediumOrSeparate'), SLUG(self.SOUND_ON_MEDIUM_OR_SEPARATE.get(info[i]))),
-                6: lambda i: (instance, I(self._vocab[MARC]+'mediumForSound'), SLUG(self.MEDIUM_FOR_SOUND.get(info[i]))),
-                7: lambda i: (instance, I(self._vocab[MARC]+'dimensions'), SLUG(self.DIMENSIONS_FILM.get(info[i]))),
-                8: lambda i: (instance, I(self._vocab[MARC]+'configurationOfPlaybackChannels'), SLUG(self.CONFIGURATION_OF_PLAYBACK_CHANNELS.get(info[i]))),
-                9: lambda i: (instance, I(self._vocab[MARC]+'productionElements'), SLUG(self.MotionPicture['ProductionElements'].get(info[i]))),
-               10: lambda i: (instance, I(self._vocab[MARC]+'positiveNegativeAspect'), SLUG(self.POSITIVE_NEGATIVE_ASPECT.get(info[i]))),
-               11: lambda i: (instance, I(self._vocab[MARC]+'generation'), SLUG(self.MotionPicture['Generation'].get(info[i]))),
-               12: lambda i: (instance, I(self._vocab[MARC]+'baseOfFilm'), SLUG(self.BASE_OF_FILM.get(info[i]))),
-               13: lambda i: (instance, I(self._vocab[MARC]+'refinedCategoriesOfColor'), SLUG(self.MotionPicture['RefinedCategoriesOfColor'].get(info[i]))),
-               14: lambda i: (instance, I(self._vocab[MARC]+'kindOfColorStockOrPrint'), SLUG(self.MotionPicture['KindOfColorStockOrPrint'].get(info[i]))),
-               15: lambda i: (instance, I(self._vocab[MARC]+'deteriorationStage'), SLUG(self.MotionPicture['DeteriorationStage'].get(info[i]))),
-               16: lambda i: (instance, I(self._vocab[MARC]+'completeness'), SLUG(self.MotionPicture['Completeness'].get(info[i]))),
-               ('slice', 17, 23): lambda i: (instance, I(self._vocab[MARC]+'filmInspectionDate'), marc_date_yyyymm(info[i])),
-            },
-            Kit = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.Kit['SpecificMaterialDesignation'].get(info[i]))),
-            },
-            NotatedMusic = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.NotatedMusic['SpecificMaterialDesignation'].get(info[i]))),
-            },
-            RemoteSensingImage = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.RemoteSensingImage['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'altitudeOfSensor'), SLUG(self.RemoteSensingImage['AltitudeOfSensor'].get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'attitudeOfSensor'), SLUG(self.RemoteSensingImage['AttitudeOfSensor'].get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'cloudCover'), SLUG(self.RemoteSensingImage['CloudCover'].get(info[i]))),
-                6: lambda i: (instance, I(self._vocab[MARC]+'platformConstructionType'), SLUG(self.RemoteSensingImage['PlatformConstructionType'].get(info[i]))),
-                7: lambda i: (instance, I(self._vocab[MARC]+'platformUseCategory'), SLUG(self.RemoteSensingImage['PlatformUseCategory'].get(info[i]))),
-                8: lambda i: (instance, I(self._vocab[MARC]+'sensorType'), SLUG(self.RemoteSensingImage['SensorType'].get(info[i]))),
-                ('slice', 9, 10): lambda i: (instance, I(self._vocab[MARC]+'dataType'), SLUG(self.RemoteSensingImage['DataType'].get(info[i]))),
-            },
-            SoundRecording = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.SoundRecording['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'speed'), SLUG(self.SoundRecording['Speed'].get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'configurationOfPlaybackChannels'), SLUG(self.CONFIGURATION_OF_PLAYBACK_CHANNELS.get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'grooveWidthPitch'), SLUG(self.SoundRecording['GrooveWidthPitch'].get(info[i]))),
-                6: lambda i: (instance, I(self._vocab[MARC]+'dimensions'), SLUG(self.SoundRecording['Dimensions'].get(info[i]))),
-                7: lambda i: (instance, I(self._vocab[MARC]+'tapeWidth'), SLUG(self.SoundRecording['TapeWidth'].get(info[i]))),
-                8: lambda i: (instance, I(self._vocab[MARC]+'tapeConfiguration'), SLUG(self.SoundRecording['TapeConfiguration'].get(info[i]))),
-                9: lambda i: (instance, I(self._vocab[MARC]+'kindOfDiscCylinderOrTape'), SLUG(self.SoundRecording['KindOfDiscCylinderOrTape'].get(info[i]))),
-               10: lambda i: (instance, I(self._vocab[MARC]+'kindOfMaterial'), SLUG(self.SoundRecording['KindOfMaterial'].get(info[i]))),
-               11: lambda i: (instance, I(self._vocab[MARC]+'kindOfCutting'), SLUG(self.SoundRecording['KindOfCutting'].get(info[i]))),
-               12: lambda i: (instance, I(self._vocab[MARC]+'specialPlaybackCharacteristics'), SLUG(self.SoundRecording['SpecialPlaybackCharacteristics'].get(info[i]))),
-               13: lambda i: (instance, I(self._vocab[MARC]+'captureAndStorageTechnique'), SLUG(self.SoundRecording['CaptureAndStorageTechnique'].get(info[i]))),
-            },
-            Text = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.Text['SpecificMaterialDesignation'].get(info[i]))),
-            },
-            VideoRecording = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.VideoRecording['SpecificMaterialDesignation'].get(info[i]))),
-                3: lambda i: (instance, I(self._vocab[MARC]+'color'), SLUG(self.COLOR.get(info[i]))),
-                4: lambda i: (instance, I(self._vocab[MARC]+'videorecordingFormat'), SLUG(self.VideoRecording['VideorecordingFormat'].get(info[i]))),
-                5: lambda i: (instance, I(self._vocab[MARC]+'soundOnMediumOrSeparate'), SLUG(self.SOUND_ON_MEDIUM_OR_SEPARATE.get(info[i]))),
-                6: lambda i: (instance, I(self._vocab[MARC]+'mediumForSound'), SLUG(self.MEDIUM_FOR_SOUND.get(info[i]))),
-                7: lambda i: (instance, I(self._vocab[MARC]+'dimensions'), SLUG(self.VideoRecording['Dimensions'].get(info[i]))),
-                8: lambda i: (instance, I(self._vocab[MARC]+'configurationOfPlaybackChannels'), SLUG(self.CONFIGURATION_OF_PLAYBACK_CHANNELS.get(info[i]))),
-            },
-            UnspecifiedCategory = {
-                1: lambda i: (instance, I(self._vocab[MARC]+'specificMaterialDesignation'), SLUG(self.UnspecifiedCategory['SpecificMaterialDesignation'].get(info[i]))),
-            }
-        )
-
-        # build new patterns from existing patterns by byte shifting, i.e. 18 bytes for 006->008
-        def shift_patterns(patterns, offset):
-            new_patt = {}
-            for k, v in patterns.items():
-                if isinstance(k, tuple):
-                    if k[0] == 'slice':
-                        new_k = (k[0], k[1]+offset, k[2]+offset)
-                    else:
-                        new_k = tuple((kk+offset for kk in k))
-                else: # int
-                    new_k = k+offset
+        patterns = self._fixed_length.get((typ, offset)) or self._compile_fixed_length(typ, offset)
+        if not patterns: return
 
-                new_patt[new_k] = v
+        #Execute the rules detailed in the various positional patterns lookup tables above
+        for positions, origin, rel, value in patterns:
+            origin = instance if origin is INSTANCE else None
+            for pos in positions:
+                try:
+                    target = value(info[pos])
+                except IndexError:
+                    continue #Truncated field
+                if target is not None:
+                    yield origin, rel, target
 
-            return new_patt
-
-        patterns = PATTERNS.get(typ)
-        if patterns:
-            if offset:
-                patterns = shift_patterns(patterns, offset)
-
-            yield from process_patterns(patterns)
 
     def process_008(self, info, params):
         '''
@@ -1766,7 +1807,7 @@ class transforms(object):
         if typ:
             yield work, I(self._vocab[VTYPE]), I(self._vocab[MARC]+typ)
 
-        yield from self._process_fixed_length(typ, info, 18, params)
+        yield from self._process_fixed_length(typ, info, FIXED_LENGTH_OFFSETS['008'], params)
 
     def process_006(self, infos, params):
         '''
@@ -1790,7 +1831,7 @@ class transforms(object):
             # pad to expected size
             info = info.ljust(18)
 
-            yield from self._process_fixed_length(typ, info, 1, params)
+            yield from self._process_fixed_length(typ, info, FIXED_LENGTH_OFFSETS['006'], params)
 
     def process_007(self, infos, params):
         '''
@@ -1808,25 +1849,4 @@ class transforms(object):
             else:
                 yield instance, I(self._vocab[VTYPE]), I(self._vocab[MARC]+typ)
 
-            yield from self._process_fixed_length(typ, info, 0, params)
-
-def process_patterns(patterns):
-    #Execute the rules detailed in the various positional patterns lookup tables above
-    for i, func in patterns.items():
-        if isinstance(i, tuple):
-            if i[0] == 'slice':
-                params = [slice(i[1], i[2])]
-            else:
-                params = i
-        elif isinstance(i, int):
-            params = [i]
-
-        for param in params:
-            try:
-                result = func(param)
-                result = result if isinstance(result, list) else [result]
-                for r in result:
-                    if r and r[2] is not None:
-                        yield r
-            except IndexError:
-                pass #Truncated field
+            yield from self._process_fixed_length(typ, info, FIXED_LENGTH_OFFSETS['007'], params)
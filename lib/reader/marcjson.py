@@ -0,0 +1,96 @@
+'''
+For processing MARC-in-JSON (http://dilettantes.code4lib.org/blog/2010/09/a-proposal-to-serialize-marc-in-json/)
+as newline-delimited JSON, i.e. one record object per line, e.g.
+
+{"leader": "01471cjm  2200349 a 4500", "fields": [{"001": "5674874"}, {"245": {"ind1": "0", "ind2": "0", "subfields": [{"a": "Title"}]}}]}
+
+Each line is decoded & converted on its own, so ranges of lines can be handed out separately
+'''
+
+import json
+import itertools
+import warnings
+
+from bibframe.reader import marc
+from .marcxml import VALID_SUBFIELD_PAT, normalize_text
+
+MARCXML_NS = marc.MARCXML_NS
+
+
+def marcjson_record_model(obj, record_id, logger, model_factory):
+    '''
+    Build the Versa model representing one record, the same as the MARC/XML reader would
+
+    obj - decoded MARC-in-JSON record object
+    record_id - ID for the record in the model
+    model_factory - Factory function for creating Versa models
+    '''
+    normalize = normalize_text
+
+    #For input model plugins, important that natural ordering be preserved
+    record_model = model_factory()
+    if 'leader' in obj:
+        record_model.add(record_id, MARCXML_NS + '/leader', normalize(obj['leader']), {})
+    for field in obj.get('fields', []):
+        for tag, val in field.items():
+            tag = tag.strip()
+            if len(tag) != 3 or not tag.isdigit():
+                logger.warn('Invalid datafield tag "{0}" in record "{1}"'.format(tag, record_id))
+                tag = '000'
+            if isinstance(val, str):
+                #Control tags have neither indicators nor subfields
+                record_model.add(record_id, MARCXML_NS + '/control/' + tag, normalize(val), {'tag': tag})
+                continue
+            marc_attributes = {'tag': tag, 'ind1': val.get('ind1', '').strip(), 'ind2': val.get('ind2', '').strip()}
+            #Subfield counter as with the MARC/XML reader, so the keys come out the same
+            subfield_count = 1
+            for subfield in val.get('subfields', []):
+                for code, sfval in subfield.items():
+                    code = code.strip()
+                    if not VALID_SUBFIELD_PAT.match(code):
+                        logger.warn('Invalid subfield code "{0}" in record "{1}", tag "{2}"'.format(code, record_id, tag))
+                        code = '_'
+                    subfield_count += 1
+                    marc_attributes['{}.{}'.format(subfield_count, code)] = normalize(sfval)
+            record_model.add(record_id, MARCXML_NS + '/data/' + tag, '', marc_attributes)
+    return record_model
+
+
+def handle_marcjson_source(source, sink, args, logger, model_factory):
+    '''
+    Process one source of newline-delimited MARC-in-JSON records in the form of an amara3 inputsource
+
+    Record IDs are based on the line number (from 1). Blank lines are skipped
+
+    source - amara3.inputsource.inputsource instance
+    sink - coroutine to be sent the generated resources
+    args - optionally args['lines'] is a (start, stop) pair of 0-based line offsets to restrict
+            processing to a range of lines, with stop None for the rest of the source
+    model_factory - Factory function for creating Versa models
+    '''
+    next(sink) #Start the coroutine running
+    start, stop = args.get('lines') or (0, None)
+    no_records = True
+    for lineno, line in enumerate(itertools.islice(source.stream, start, stop), start=start+1):
+        if isinstance(line, bytes): line = line.decode('utf-8')
+        if not line.strip(): continue
+        no_records = False
+        record_id = 'record-{0}'.format(lineno)
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            logger.warn('Skipping invalid JSON in record "{0}": {1}'.format(record_id, e))
+            continue
+        try:
+            sink.send(marcjson_record_model(obj, record_id, logger, model_factory))
+        except StopIteration:
+            #Handler coroutine has declined to process more records. Perhaps it's hit a limit
+            break
+
+    if no_records:
+        warnings.warn("No records found in this file.", RuntimeWarning)
+    return
+
+
+handle_marcjson_source.readmode = 'rb'
+handle_marcjson_source.makeinputsource = True
@@ -27,6 +27,31 @@ IS_VALID_TAG = lambda t: len(t.rsplit('/',1)[-1]) == 3
 
 NSSEP = ' '
 
+#On Python 3.7+ a constant-time check of the string's internal flag; otherwise rely on normalize's own quick check
+STR_ISASCII = getattr(str, 'isascii', None)
+
+def normalize_text(text):
+    '''
+    NFKC normalization precombines composed characters and substitutes compatibility codepoints
+    We want to make sure we're dealing with comparable & consistently hashable strings throughout the toolchain
+
+    Pure ASCII text (the vast majority of MARC values) is unaffected, so where it can be cheaply detected it's passed straight through
+
+    >>> normalize_text('Zweig, Stefan')
+    'Zweig, Stefan'
+    >>> normalize_text('Cafe\u0301 \ufb01n') == 'Caf\xe9 fin'
+    True
+    '''
+    if STR_ISASCII is not None and STR_ISASCII(text): return text
+    return unicodedata.normalize('NFKC', text)
+
+class stop_parse(Exception):
+    '''
+    Raised from within the expat callbacks to stop the parse, e.g. once the sink declines any more records.
+    (pyexpat doesn't expose XML_StopParser)
+    '''
+    pass
+
 class expat_callbacks(object):
     def __init__(self, sink, parser, logger, model_factory, lax=False):
         self._sink = sink
@@ -58,12 +83,12 @@ class expat_callbacks(object):
                 #For input model plugins, important that natural ordering be preserved
                 self._record_model = self._model_factory()
             elif local == 'leader':
-                self._chardata_dest = ''
+                self._chardata = []
                 self._link_iri = MARCXML_NS + '/leader'
                 self._marc_attributes = {}
                 self._getcontent = True
             elif local == 'controlfield':
-                self._chardata_dest = ''
+                self._chardata = []
                 tag = attributes['tag'].strip()
                 if len(tag) != 3 or not tag.isdigit():
                     self._logger.warn('Invalid datafield tag "{0}" in record "{1}"'.format(tag, self._record_id))
@@ -81,7 +106,7 @@ class expat_callbacks(object):
                 self._marc_attributes = dict(([k, v.strip()] for (k, v) in attributes.items() if ' ' not in k))
                 self._subfield_count = 1
             elif local == 'subfield':
-                self._chardata_dest = ''
+                self._chardata = []
                 self._subfield = attributes['code'].strip()
                 if not VALID_SUBFIELD_PAT.match(self._subfield):
                     self._logger.warn('Invalid subfield code "{0}" in record "{1}", tag "{2}"'.format(self._subfield, self._record_id, self._marc_attributes['tag']))
@@ -103,8 +128,8 @@ class expat_callbacks(object):
                     self._sink.send(self._record_model)
                 except StopIteration:
                     #Handler coroutine has declined to process more records. Perhaps it's hit a limit
-                    #FIXME would be nice to throw some sort of signal to stop parse. Or...we can wait until we've evolved beyond SAX to enhance the event architecture
-                    pass
+                    #No point parsing the rest of the input, so bail out of the parse
+                    raise stop_parse
             elif local == 'datafield':
                 #Convert list of pairs of subfield codes/values to dict of lists (since there can be multiple of each subfields)
                 #sfdict = defaultdict(list)
@@ -114,20 +139,19 @@ class expat_callbacks(object):
                     self._record_model.add(self._record_id, self._link_iri, '', self._marc_attributes)
                 self._getcontent = False
             elif local == 'subfield':
-                self._marc_attributes['{}.{}'.format(self._subfield_count, self._subfield)] = self._chardata_dest
+                self._marc_attributes['{}.{}'.format(self._subfield_count, self._subfield)] = normalize_text(''.join(self._chardata))
             elif local == 'leader':
-                if self._record_model: self._record_model.add(self._record_id, self._link_iri, self._chardata_dest, self._marc_attributes)
+                if self._record_model: self._record_model.add(self._record_id, self._link_iri, normalize_text(''.join(self._chardata)), self._marc_attributes)
                 self._getcontent = False
             elif local == 'controlfield':
                 if self._record_model and IS_VALID_TAG(self._link_iri):
-                    self._record_model.add(self._record_id, self._link_iri, self._chardata_dest, self._marc_attributes)
+                    self._record_model.add(self._record_id, self._link_iri, normalize_text(''.join(self._chardata)), self._marc_attributes)
                 self._getcontent = False
 
     def char_data(self, data):
         if self._getcontent:
-            #NFKC normalization precombines composed characters and substitutes compatibility codepoints
-            #We want to make sure we're dealing with comparable & consistently hashable strings throughout the toolchain
-            self._chardata_dest += unicodedata.normalize('NFKC', data)
+            #Text can come in several chunks. Collect them, to be joined & normalized once at the end of the element
+            self._chardata.append(data)
 
 
 #PYTHONASYNCIODEBUG = 1
@@ -137,6 +161,8 @@ def handle_marcxml_source(source, sink, args, logger, model_factory):
     '''
     Process one source of MARC/XML records in the form of an amara3 inputsource
     Generally this will be a single XML file with a marc:collection with one or more marc:record
+    As with all MARC handlers, stops reading the source as soon as the sink declines
+    any more records (i.e. sending to it raises StopIteration)
 
     source - amara3.inputsource.inputsource instance
     sink - coroutine to be sent the generated resources
@@ -158,7 +184,11 @@ def handle_marcxml_source(source, sink, args, logger, model_factory):
     parser.CharacterDataHandler = handler.char_data
     parser.buffer_text = True
 
-    parser.ParseFile(source.stream)
+    try:
+        parser.ParseFile(source.stream)
+    except stop_parse:
+        #Sink has declined any more records
+        pass
     if handler.no_records:
         warnings.warn("No records found in this file. Possibly an XML namespace problem (try using the 'lax' flag).", RuntimeWarning)
     return
@@ -166,3 +196,103 @@ def handle_marcxml_source(source, sink, args, logger, model_factory):
 
 handle_marcxml_source.readmode = 'rb'
 handle_marcxml_source.makeinputsource = True
+
+
+#Element names as lxml reports them
+LXML_RECORD = '{' + MARCXML_NS + '}record'
+LXML_LEADER = '{' + MARCXML_NS + '}leader'
+LXML_CONTROLFIELD = '{' + MARCXML_NS + '}controlfield'
+LXML_DATAFIELD = '{' + MARCXML_NS + '}datafield'
+LXML_SUBFIELD = '{' + MARCXML_NS + '}subfield'
+
+
+def lxml_record_model(elem, record_id, logger, model_factory):
+    '''
+    Build the Versa model representing one record from its lxml element, the same as the expat callbacks would
+
+    elem - lxml element for the marc:record
+    record_id - ID for the record in the model
+    model_factory - Factory function for creating Versa models
+    '''
+    normalize = lambda e: normalize_text(''.join(e.itertext()) if len(e) else (e.text or ''))
+
+    #For input model plugins, important that natural ordering be preserved
+    record_model = model_factory()
+    for child in elem:
+        #Each access of .tag builds a new string, so just the once
+        ctag = child.tag
+        if ctag == LXML_DATAFIELD:
+            tag = child.get('tag').strip()
+            if len(tag) != 3 or not tag.isdigit():
+                logger.warn('Invalid datafield tag "{0}" in record "{1}"'.format(tag, record_id))
+                tag = '000'
+            #Namespaced attributes are left out
+            marc_attributes = { k: v.strip() for (k, v) in child.items() if k[0] != '{' }
+            subfield_count = 1
+            for sf in child.iterchildren(LXML_SUBFIELD):
+                code = sf.get('code').strip()
+                if not VALID_SUBFIELD_PAT.match(code):
+                    logger.warn('Invalid subfield code "{0}" in record "{1}", tag "{2}"'.format(code, record_id, marc_attributes['tag']))
+                    code = '_'
+                subfield_count += 1
+                marc_attributes['{}.{}'.format(subfield_count, code)] = normalize(sf)
+            record_model.add(record_id, MARCXML_NS + '/data/' + tag, '', marc_attributes)
+        elif ctag == LXML_CONTROLFIELD:
+            tag = child.get('tag').strip()
+            if len(tag) != 3 or not tag.isdigit():
+                logger.warn('Invalid datafield tag "{0}" in record "{1}"'.format(tag, record_id))
+                tag = '000'
+            #Control tags have neither indicators nor subfields
+            record_model.add(record_id, MARCXML_NS + '/control/' + tag, normalize(child), {'tag': tag})
+        elif ctag == LXML_LEADER:
+            record_model.add(record_id, MARCXML_NS + '/leader', normalize(child), {})
+    return record_model
+
+
+def handle_marcxml_lxml_source(source, sink, args, logger, model_factory):
+    '''
+    Process one source of MARC/XML records in the form of an amara3 inputsource, using lxml.etree.iterparse
+    Each record is built from its element in one go, and then the element is cleared
+
+    Falls back to handle_marcxml_source if lxml isn't installed, or for lax parsing
+
+    source - amara3.inputsource.inputsource instance
+    sink - coroutine to be sent the generated resources
+    args -
+    model_factory - Factory function for creating Versa models
+    '''
+    try:
+        from lxml import etree
+    except ImportError:
+        warnings.warn('lxml is needed for this MARC/XML handler. Using the expat based one instead.', RuntimeWarning)
+        return handle_marcxml_source(source, sink, args, logger, model_factory)
+    if args.get('lax'):
+        #Namespace problems are fatal to lxml
+        return handle_marcxml_source(source, sink, args, logger, model_factory)
+
+    next(sink) #Start the coroutine running
+    no_records = True
+    #resolve_entities=False for the same reasons as the security note at the top
+    for ix, (event, elem) in enumerate(etree.iterparse(source.stream, events=('end',), tag=LXML_RECORD,
+                                                        resolve_entities=False, no_network=True)):
+        no_records = False
+        #lxml doesn't report column numbers, so use the record's position instead
+        record_id = 'record-{0}:{1}'.format(elem.sourceline, ix)
+        record_model = lxml_record_model(elem, record_id, logger, model_factory)
+        #Free up the memory for this and any prior elements
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+        try:
+            sink.send(record_model)
+        except StopIteration:
+            #Handler coroutine has declined to process more records. Perhaps it's hit a limit
+            break
+
+    if no_records:
+        warnings.warn("No records found in this file. Possibly an XML namespace problem (try using the 'lax' flag).", RuntimeWarning)
+    return
+
+
+handle_marcxml_lxml_source.readmode = 'rb'
+handle_marcxml_lxml_source.makeinputsource = True
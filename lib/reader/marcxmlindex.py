@@ -0,0 +1,329 @@
+'''
+Byte offset index of the records in a MARC/XML file, for random access & splitting
+
+A single pass over the file records where each marc:record starts & ends, along with its
+control number (001), in a compact sidecar file (by default the name of the MARC/XML file plus
+INDEX_SUFFIX). Selected records (by control number or byte range, or a shard of the file) can then be
+read straight from the file as a small MARC/XML document of their own, without parsing anything else.
+
+The sidecar is a line of JSON with details of the indexed file, then a line per record of
+start offset, length & control number, tab separated.
+
+Offsets are into the file as stored, so compressed files need to be decompressed to be indexed.
+Only ASCII compatible encodings (e.g. UTF-8, the norm) are supported.
+'''
+
+import io
+import os
+import json
+import bisect
+import xml.parsers.expat
+
+from bibframe.reader import marc
+
+MARCXML_NS = marc.MARCXML_NS
+
+INDEX_SUFFIX = '.recidx'
+INDEX_FORMAT = 'http://bibfra.me/tool/pybibframe/marcxml-index'
+INDEX_VERSION = 1
+
+#Size of the blocks read & parsed while building an index
+CHUNK_SIZE = 1 << 16
+
+NSSEP = ' '
+
+#Expanded names of the elements of interest, as expat reports them
+SCANNED_ELEMENTS = { MARCXML_NS + NSSEP + local: local for local in ('record', 'controlfield') }
+
+
+class index_scanner(object):
+    '''
+    expat callbacks to note the byte offsets & control number of each record
+    '''
+    def __init__(self, parser, lax=False):
+        self._parser = parser
+        self._lax = lax
+        self.records = []
+        self.namespaces = {}
+        self.encoding = None
+        self._in_record = False
+        self._pending_decls = []
+        #Block of the source being parsed, and its offset
+        self.chunk = b''
+        self.chunk_offset = 0
+        return
+
+    def local_name(self, name):
+        '''
+        Return the local name of a MARC/XML element of interest, otherwise None
+        '''
+        if self._lax:
+            (head, sep, tail) = name.partition(':')
+            return tail or head
+        #Called for every element, so just a lookup
+        return SCANNED_ELEMENTS.get(name)
+
+    def xml_decl(self, version, encoding, standalone):
+        self.encoding = encoding
+        return
+
+    def start_namespace_decl(self, prefix, uri):
+        self._pending_decls.append((prefix or '', uri))
+        return
+
+    def start_element(self, name, attributes):
+        #Declarations on the record itself are within its bytes. Those outside are needed to read it on its own
+        if self._pending_decls:
+            if not self._in_record:
+                for prefix, uri in self._pending_decls:
+                    self.namespaces.setdefault(prefix, uri)
+            self._pending_decls = []
+        local = self.local_name(name)
+        if local == 'record':
+            self._in_record = True
+            self._start = self._parser.CurrentByteIndex
+            self._control_number = ''
+        elif local == 'controlfield' and self._in_record and attributes.get('tag', '').strip() == '001':
+            self._chardata = []
+            #Only 001 text is of interest, so only then pay for the callbacks
+            self._parser.CharacterDataHandler = self._chardata.append
+        return
+
+    def end_element(self, name):
+        local = self.local_name(name)
+        if local == 'record' and self._in_record:
+            #The byte index is the start of the end tag. Its '>' must be in the block just parsed,
+            #since expat only reports the end of the element once it's seen all of the tag
+            pos = max(self._parser.CurrentByteIndex - self.chunk_offset, 0)
+            end = self.chunk_offset + self.chunk.index(b'>', pos) + 1
+            self.records.append((self._start, end, self._control_number))
+            self._in_record = False
+        elif local == 'controlfield' and self._parser.CharacterDataHandler:
+            self._control_number = ''.join(self._chardata).strip()
+            self._parser.CharacterDataHandler = None
+        return
+
+
+class record_index(object):
+    '''
+    Byte offsets & control numbers of the records in a MARC/XML file
+
+    >>> doc = b'<collection xmlns="http://www.loc.gov/MARC21/slim"><record><controlfield tag="001">a1</controlfield></record>\\n<record><controlfield tag="001">b2</controlfield></record></collection>'
+    >>> ix = record_index.build(io.BytesIO(doc))
+    >>> ix.records
+    [(51, 109, 'a1'), (110, 168, 'b2')]
+    >>> print(ix.source(io.BytesIO(doc), ix.lookup('b2')).read().decode('utf-8'))
+    <?xml version="1.0" encoding="utf-8"?>
+    <collection xmlns="http://www.loc.gov/MARC21/slim"><record><controlfield tag="001">b2</controlfield></record></collection>
+    '''
+    def __init__(self, records=None, namespaces=None, encoding=None, size=None, mtime=None):
+        '''
+        records - list of (start offset, end offset, control number) in file order
+        namespaces - mapping from prefix ('' for the default namespace) to namespace of the declarations in scope for the records
+        encoding - encoding given in the XML declaration, if any
+        size - size in bytes of the indexed file
+        mtime - modification time of the indexed file
+        '''
+        self.records = records or []
+        self.namespaces = namespaces or {}
+        self.encoding = encoding
+        self.size = size
+        self.mtime = mtime
+        self._starts = [ r[0] for r in self.records ]
+        self._by_control_number = None
+        return
+
+    @staticmethod
+    def build(stream, lax=False, chunk_size=CHUNK_SIZE):
+        '''
+        Scan a MARC/XML source, from its beginning, and return its index
+
+        stream - binary stream at the start of the MARC/XML
+        lax - If True don't require the MARC/XML namespace (e.g. for XML with namespace problems)
+        '''
+        if lax:
+            parser = xml.parsers.expat.ParserCreate()
+        else:
+            parser = xml.parsers.expat.ParserCreate(namespace_separator=NSSEP)
+        scanner = index_scanner(parser, lax)
+        parser.XmlDeclHandler = scanner.xml_decl
+        parser.StartNamespaceDeclHandler = scanner.start_namespace_decl
+        parser.StartElementHandler = scanner.start_element
+        parser.EndElementHandler = scanner.end_element
+        parser.buffer_text = True
+
+        offset = 0
+        while True:
+            chunk = stream.read(chunk_size)
+            scanner.chunk, scanner.chunk_offset = chunk, offset
+            parser.Parse(chunk, not chunk)
+            if not chunk: break
+            offset += len(chunk)
+        return record_index(scanner.records, scanner.namespaces, scanner.encoding, size=offset)
+
+    @staticmethod
+    def build_for_file(fname, lax=False):
+        '''
+        Scan a MARC/XML file and return its index, noting the file's size & modification time
+        '''
+        with open(fname, 'rb') as f:
+            index = record_index.build(f, lax=lax)
+        index.mtime = os.stat(fname).st_mtime
+        return index
+
+    def write(self, out):
+        '''
+        Write out the index in sidecar form
+
+        out - binary stream
+        '''
+        header = {'format': INDEX_FORMAT, 'version': INDEX_VERSION, 'size': self.size, 'mtime': self.mtime,
+                    'encoding': self.encoding, 'namespaces': self.namespaces}
+        lines = [json.dumps(header, sort_keys=True)]
+        for start, end, control_number in self.records:
+            #Keep each entry on one line, whatever's in the control number
+            control_number = ' '.join(control_number.split())
+            lines.append('{0}\t{1}\t{2}'.format(start, end - start, control_number))
+        out.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        return
+
+    @staticmethod
+    def read(f):
+        '''
+        Read in an index in sidecar form
+
+        f - binary stream
+        '''
+        header = json.loads(f.readline().decode('utf-8'))
+        if header.get('format') != INDEX_FORMAT or header.get('version') != INDEX_VERSION:
+            raise ValueError('Not a MARC/XML record index, or an unsupported version of one')
+        records = []
+        for line in f:
+            start, length, control_number = line.decode('utf-8').rstrip('\n').split('\t', 2)
+            start = int(start)
+            records.append((start, start + int(length), control_number))
+        return record_index(records, header['namespaces'], header['encoding'], header['size'], header['mtime'])
+
+    def matches_file(self, fname):
+        '''
+        Return True if the file appears to be the one indexed, i.e. it has the same size & modification time
+        '''
+        st = os.stat(fname)
+        return st.st_size == self.size and st.st_mtime == self.mtime
+
+    def lookup(self, control_number):
+        '''
+        Return the list of records with the given control number (001), in file order
+        '''
+        if self._by_control_number is None:
+            self._by_control_number = {}
+            for rec in self.records:
+                self._by_control_number.setdefault(rec[2], []).append(rec)
+        return self._by_control_number.get(control_number, [])
+
+    def in_range(self, start, end=None):
+        '''
+        Return the list of records which start within the byte range, in file order.
+        So adjoining ranges never both include a record, wherever they fall
+
+        start - offset of the start of the range
+        end - offset just past the end of the range, or None for the rest of the file
+        '''
+        lo = bisect.bisect_left(self._starts, start)
+        hi = len(self._starts) if end is None else bisect.bisect_left(self._starts, end)
+        return self.records[lo:hi]
+
+    def shards(self, count):
+        '''
+        Split the file into (up to) count byte ranges of about the same size, each starting at a record.
+        Returns a list of (start, end) offsets, with end None for the last one
+        '''
+        if not self.records: return []
+        first, last = self.records[0][0], self.records[-1][1]
+        bounds = [first]
+        for i in range(1, count):
+            #Start the shard at the first record at or past the ideal split point
+            ix = bisect.bisect_left(self._starts, first + (last - first) * i // count)
+            if ix < len(self._starts) and self._starts[ix] > bounds[-1]:
+                bounds.append(self._starts[ix])
+        return list(zip(bounds, bounds[1:] + [None]))
+
+    def source(self, stream, records):
+        '''
+        Return a binary stream of a MARC/XML document with just the given records, read from the indexed source
+        as needed. It can be given as input to bfconvert like any other
+
+        stream - seekable binary stream of the indexed MARC/XML
+        records - list of index entries for the records, e.g. from lookup or in_range
+        '''
+        encoding = self.encoding or 'utf-8'
+        decls = ''.join([ ' xmlns{0}="{1}"'.format(':' + prefix if prefix else '', uri.replace('"', '&quot;'))
+                            for prefix, uri in sorted(self.namespaces.items()) ])
+        parts = ['<?xml version="1.0" encoding="{0}"?>\n<collection{1}>'.format(encoding, decls).encode(encoding)]
+        #Adjoining records are read in one go, along with whatever's between them
+        for start, end, control_number in records:
+            if len(parts) > 1 and not isinstance(parts[-1], bytes) and parts[-1][1] == start:
+                parts[-1] = (parts[-1][0], end)
+            else:
+                parts.append((start, end))
+        parts.append('</collection>'.encode(encoding))
+        return io.BufferedReader(region_reader(stream, parts), buffer_size=CHUNK_SIZE)
+
+
+class region_reader(io.RawIOBase):
+    '''
+    Raw binary stream made up of literal bytes and (start, end) regions of another, seekable stream
+    '''
+    def __init__(self, stream, parts):
+        self._stream = stream
+        #Parts still to be read, last first
+        self._parts = list(reversed(parts))
+        return
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._parts:
+            part = self._parts[-1]
+            if isinstance(part, bytes):
+                n = min(len(b), len(part))
+                b[:n] = part[:n]
+                rest = part[n:]
+            else:
+                start, end = part
+                #Seek every time, in case anything else is reading the stream
+                self._stream.seek(start)
+                data = self._stream.read(min(len(b), end - start))
+                if not data:
+                    raise ValueError('Source ended before the indexed region {0}-{1}. Is the index out of date?'.format(start, end))
+                n = len(data)
+                b[:n] = data
+                rest = (start + n, end) if start + n < end else None
+            if rest:
+                self._parts[-1] = rest
+            else:
+                self._parts.pop()
+            if n: return n
+        return 0
+
+
+def index_path(fname):
+    '''
+    Return the file name of the sidecar index for a MARC/XML file
+    '''
+    return fname + INDEX_SUFFIX
+
+
+def load_index(fname, lax=False, logger=None):
+    '''
+    Return the index for a MARC/XML file, from its sidecar if that's up to date, otherwise by scanning the file
+    '''
+    sidecar = index_path(fname)
+    if os.path.exists(sidecar):
+        with open(sidecar, 'rb') as f:
+            index = record_index.read(f)
+        if index.matches_file(fname):
+            return index
+        if logger: logger.warning('Index {0} is out of date, so scanning {1}'.format(sidecar, fname))
+    return record_index.build_for_file(fname, lax=lax)
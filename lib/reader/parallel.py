@@ -0,0 +1,314 @@
+'''
+Conversion of MARC records across multiple worker processes
+
+The transform phases for each record (input plug-ins, cross-references, bootstrap
+and main phase) run in a pool of worker processes. Results are applied back in
+the main process strictly in record order, so output is the same as for serial conversion.
+
+The catch is resource folding: whether a materialized resource has already been
+seen (existing_ids) depends on all prior records in the source. Workers convert
+each record as if nothing had been seen before, tracing each materialization and
+tagging the links it generates. The main process then replays the trace against
+the real set of existing IDs and drops whatever would have been folded away.
+
+Plug-in input & materialized resource hooks run in the worker processes. Record
+and final hooks run in the main process.
+
+When profiling, each worker keeps its own timings, which are sent back with each
+record's result and merged in the main process. Times are then summed across the workers.
+'''
+
+import asyncio
+import logging
+import functools
+from collections import deque
+
+from versa.driver import memory
+
+from bibframe import g_services
+from bibframe import BF_INIT_TASK, BF_FINAL_TASK
+from bibframe.contrib.datachefids import idgen
+from bibframe.model import DEFAULT_MODEL_CLS
+from bibframe.util import cached_idgen, ID_CACHE_SIZE
+from bibframe.profiling import profiler as profiler_cls
+from bibframe.writer.versajson import versajson_writer
+
+from . import transform_set
+from .marc import record_params, transform_record, finish_record, plugin_task, BL
+
+#Attribute used to tag links with the materialization which generated them. Never appears in output
+FOLD_EVENT_ATTR = '@fold-event'
+
+ENTER_OP = 1
+ADD_OP = 2
+
+#Per-record params which only make sense within one process
+LOCAL_PARAMS = frozenset(['input_model', 'output_model', 'logger', 'ids', 'existing_ids',
+                            'plugins', 'transforms', 'materialize_entity', 'lookups', 'loop', 'profiler', 'plugin-tasks'])
+
+
+class fold_trace(object):
+    '''
+    Stand-in for the set of existing resource IDs while converting a record in a worker.
+    Claims never to have seen any ID, and records the materializations & additions
+    so that they can be replayed against the real set of existing IDs
+    '''
+    def __init__(self):
+        self.ops = []
+        self._stack = []
+        self._count = 0
+        return
+
+    def __contains__(self, eid):
+        return False
+
+    def enter(self, eid, npostprocess):
+        '''
+        Called by materialize for a resource it's about to fill in. Returns the attributes with which to tag the resulting links
+        '''
+        event = self._count
+        self._count += 1
+        parent = self._stack[-1] if self._stack else None
+        self.ops.append((ENTER_OP, event, eid, parent, npostprocess))
+        self._stack.append(event)
+        return {FOLD_EVENT_ATTR: event}
+
+    def add(self, eid):
+        #Materialize adds its resource ID when done, which closes the innermost materialization
+        owner = self._stack.pop() if self._stack else None
+        self.ops.append((ADD_OP, eid, owner))
+        return
+
+
+def replay_folds(ops, existing_ids):
+    '''
+    Replay a fold trace from a worker against the set of existing IDs
+
+    Returns a tuple of (dict of materialization event to whether it was kept, list of main phase
+    materialization events, whether the main resource was folded), or None if the bootstrap phase
+    came out differently than in the worker, in which case the record must be converted again.
+    existing_ids is only updated if the replay succeeds
+    '''
+    added = set()
+    kept = {}
+    main_events = []
+    main_folded = None
+    for op in ops:
+        if op[0] == ENTER_OP:
+            _, event, eid, parent, npostprocess = op
+            kept[event] = (parent is None or kept[parent]) and eid not in existing_ids and eid not in added
+            if main_folded is None:
+                if not kept[event]: return None
+            else:
+                main_events.append((event, npostprocess))
+        else:
+            _, eid, owner = op
+            if owner is None and main_folded is None:
+                #The first top level ID added is the main (e.g. work) resource, and marks the start of the main phase
+                main_folded = eid in existing_ids or eid in added
+            if owner is None or kept[owner]:
+                added.add(eid)
+    existing_ids.update(added)
+    return kept, main_events, bool(main_folded)
+
+
+_worker = {}
+
+def init_worker(config, entbase, vocabbase, loggername=None, profile=False):
+    '''
+    Initializer for each worker process. Sets up transforms & plug-ins from the configuration
+
+    config - configuration information, as for bfconvert. Must be picklable
+    entbase - base IRI used for IDs of generated entity resources
+    vocabbase - base IRI for vocabulary items
+    loggername - name of the logger to use for messages
+    profile - if True collect timings of transforms, plug-ins etc., to be sent back with each result
+    '''
+    import importlib
+    def resolve_class(fullname):
+        modpath, name = fullname.rsplit('.', 1)
+        return getattr(importlib.import_module(modpath), name)
+    attr_cls = resolve_class(config.get('versa-attr-cls', 'builtins.dict'))
+    model_cls = resolve_class(config.get('versa-model-cls', DEFAULT_MODEL_CLS))
+
+    plugins = []
+    for pc in config.get('plugins', []):
+        try:
+            pinfo = g_services[pc['id']]
+            plugins.append(pinfo)
+            pinfo[BF_INIT_TASK](pinfo, config=pc)
+        except KeyError:
+            raise Exception('Unknown plugin {0}'.format(pc['id']))
+
+    _worker.update({
+        'model_factory': functools.partial(model_cls, attr_cls=attr_cls),
+        'transforms': transform_set(config.get('transforms', []), config.get('marcspecials-vocab')),
+        'lookups': config.get('lookups', {}),
+        'plugins': plugins,
+        'entbase': entbase,
+        'vocabbase': vocabbase,
+        'ids': cached_idgen(idgen(entbase), config.get('id-cache-size', ID_CACHE_SIZE)),
+        'logger': logging.getLogger(loggername),
+        'loop': asyncio.new_event_loop(),
+        'seed_ids': config.get('record-seeded-ids', False),
+        'profiler': profiler_cls() if profile else None,
+    })
+    return
+
+
+def convert_record(links):
+    '''
+    Run the transform phases for one record in a worker process
+
+    links - list of (origin, rel, target, attributes) links of the MARC record model
+    '''
+    w = _worker
+    model_factory = w['model_factory']
+    loop = w['loop']
+    input_model = model_factory()
+    input_model.add_many(links)
+    model = model_factory()
+    trace = fold_trace()
+    params = record_params(input_model, w['entbase'], w['vocabbase'], w['ids'], trace,
+                            w['plugins'], w['transforms'], w['lookups'], w['logger'], loop,
+                            seed_ids=w['seed_ids'], profiler=w['profiler'])
+    ok = loop.run_until_complete(transform_record(loop, input_model, model, params,
+                                                    model_factory=model_factory))
+    return {
+        'ok': ok,
+        'links': [ link for (lid, link) in model ],
+        'ops': trace.ops,
+        'params': { k: v for (k, v) in params.items() if k not in LOCAL_PARAMS },
+        #Record plug-ins might be interested in the (cross-reference resolved) input model
+        'input_links': [ link for (lid, link) in input_model ] if w['plugins'] else None,
+        'profile': w['profiler'].pop_stats() if w['profiler'] else None,
+    }
+
+
+def run_coroutine(coro):
+    '''
+    Drive to completion a coroutine which doesn't actually need to wait on the event loop, returning its result
+    '''
+    try:
+        while True: next(coro)
+    except StopIteration as e:
+        return e.value
+
+
+@asyncio.coroutine
+def apply_result(loop, model, input_model, result, params, model_factory):
+    '''
+    Apply the result of converting a record in a worker to the output model, with folding as it would have been
+    in serial conversion. Returns False if the record was aborted
+
+    input_model - Versa model representing the MARC record as originally received
+    result - dict returned from convert_record
+    params - per-record processing parameters (see record_params)
+    '''
+    existing_ids = params['existing_ids']
+    if result['profile'] and params['profiler']: params['profiler'].merge(result['profile'])
+    replayed = replay_folds(result['ops'], existing_ids)
+    if replayed is None:
+        #Folding changed the bootstrap phase, and perhaps thus the main resource ID. Convert again right here
+        params['logger'].debug('Converting record again, since folding affects its main resource')
+        ok = yield from transform_record(loop, input_model, model, params, model_factory=model_factory)
+        return ok
+
+    kept, main_events, main_folded = replayed
+    for (o, r, t, a) in result['links']:
+        if FOLD_EVENT_ATTR in a:
+            if not kept[a[FOLD_EVENT_ATTR]]: continue
+            a = a.copy()
+            del a[FOLD_EVENT_ATTR]
+        model.add(o, r, t, a)
+    #Any leftovers of aborted records stay in the model, just as in serial conversion
+    if not result['ok']: return False
+
+    params.update(result['params'])
+    params['output_model'] = model
+    if result['input_links'] is not None:
+        params['input_model'] = model_factory()
+        params['input_model'].add_many(result['input_links'])
+    if 'folded' in params:
+        params['folded'] = [params['default-origin']] if main_folded else []
+    to_keep = [ kept[event] for (event, npostprocess) in main_events for i in range(npostprocess) ]
+    params['to_postprocess'] = [ pp for (pp, keep) in zip(params['to_postprocess'], to_keep) if keep ]
+    return True
+
+
+@asyncio.coroutine
+def record_handler( loop, model, pool, window=None, entbase=None, vocabbase=BL, limiting=None,
+                    plugins=None, ids=None, postprocess=None, out=None,
+                    logger=logging, transforms=None, canonical=False,
+                    model_factory=memory.connection, lookups=None, seed_ids=False, ndjson=False,
+                    profiler=None, existing_ids_factory=set):
+    '''
+    Counterpart to bibframe.reader.marc.record_handler which farms out record conversion to a pool of worker processes
+
+    loop - asyncio event loop
+    model - the Versa model for the record
+    pool - multiprocessing.Pool set up using init_worker
+    window - maximum number of records in flight to the workers at any time
+    entbase - base IRI used for IDs of generated entity resources
+    limiting - mutable pair of [count, limit] used to control the number of records processed
+    profiler - optional bibframe.profiling.profiler to collect timings. Set up the pool with profile=True to include the workers'
+    existing_ids_factory - callable returning the (empty) store for the IDs of resources generated so far
+    '''
+    _final_tasks = set() #Tasks for the event loop contributing to the MARC processing
+
+    plugins = plugins or []
+    if ids is None: ids = cached_idgen(idgen(entbase))
+    window = window or 16
+
+    existing_ids = existing_ids_factory()
+    #Start the process of writing out the JSON representation of the resulting Versa
+    jsonw = versajson_writer(out, ndjson=ndjson) if out and not canonical else None
+    if jsonw: jsonw.start()
+    pending = deque()
+
+    def process_next():
+        '''
+        Wait for the next record in order, then apply it. Coroutine returning True once the record limit is reached
+        '''
+        input_model, async_result = pending.popleft()
+        params = record_params(input_model, entbase, vocabbase, ids, existing_ids,
+                                plugins, transforms, lookups, logger, loop, seed_ids=seed_ids, profiler=profiler)
+        ok = yield from apply_result(loop, model, input_model, async_result.get(), params, model_factory)
+        if not ok: return False #Abort current record if signalled
+        yield from finish_record(loop, model, params)
+
+        if jsonw: jsonw.write_model(model)
+        #FIXME: Postprocessing should probably be a task too
+        if postprocess: postprocess()
+        #limiting--running count of records processed versus the max number, if any
+        limiting[0] += 1
+        return limiting[1] is not None and limiting[0] >= limiting[1]
+
+    try:
+        while True:
+            input_model = yield
+            links = [ link for (lid, link) in input_model ]
+            pending.append((input_model, pool.apply_async(convert_record, (links,))))
+            done = False
+            while len(pending) >= window and not done:
+                done = yield from process_next()
+            if done: break
+    except GeneratorExit:
+        #No more records, so work through the ones still in flight
+        done = False
+        while pending and not done:
+            done = run_coroutine(process_next())
+
+        logger.debug('Completed processing {0} record{1}.'.format(limiting[0], '' if limiting[0] == 1 else 's'))
+        if jsonw: jsonw.close()
+
+        for plugin in plugins:
+            #Each plug-in is a task
+            func = plugin.get(BF_FINAL_TASK)
+            if not func: continue
+            task = asyncio.Task(plugin_task(profiler, BF_FINAL_TASK, func, loop), loop=loop)
+            _final_tasks.add(task)
+            #Once all the plug-in tasks are done, all the work is done
+            task.add_done_callback(_final_tasks.remove)
+
+    return
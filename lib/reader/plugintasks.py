@@ -0,0 +1,172 @@
+'''
+Plug-in record (BF_MARCREC_TASK) and materialized resource (BF_MATRES_TASK) tasks run as concurrent
+asyncio tasks, overlapping with the reading & transforming of the records which follow
+
+The tasks run in an event loop on a thread of its own. Once a record's transforms are done, its
+materialized resource tasks are scheduled, all at once, then its record tasks. The record handler
+keeps a bounded queue of records whose tasks aren't yet done, each with a model of its own, and
+writes out their output in record order as they complete, so output is the same as when the tasks
+are run one after another (provided plug-ins don't depend on the order in which they run).
+
+Tasks of CPU-heavy plug-ins can also be offloaded to an executor, set by "executor" in the plug-in's config:
+"thread" runs them in a thread pool, "process" in a process pool. In a process the task runs on copies of the
+plug-in, model & parameters, so only the links it adds to the model come back. Any other state it keeps
+(e.g. for a final report) stays in the worker process.
+
+Since tasks run alongside the conversion of other records, they mustn't use the ID generator
+or the set of existing IDs in the parameters.
+'''
+
+import asyncio
+import logging
+import threading
+import concurrent.futures
+
+from bibframe import BF_MARCREC_TASK, BF_MATRES_TASK
+from bibframe.model import indexed_connection
+
+from .marc import plugin_task
+from .parallel import LOCAL_PARAMS
+
+#Default maximum number of records whose plug-in tasks may be outstanding
+PLUGIN_QUEUE_SIZE = 16
+
+THREAD_EXECUTOR = 'thread'
+PROCESS_EXECUTOR = 'process'
+
+#Event loop of a worker process, for running offloaded tasks
+_process_loop = None
+
+
+class plugin_tasks(object):
+    '''
+    Runs plug-ins' record & materialized resource tasks concurrently, in an event loop on a thread of its own
+    '''
+    def __init__(self, plugins, queue_size=PLUGIN_QUEUE_SIZE, executors=None, logger=logging, profiler=None):
+        '''
+        plugins - list of plug-in info mappings, as set up from the config
+        queue_size - maximum number of records whose plug-in tasks may be outstanding
+        executors - optional list, in step with plugins, of where to offload each plug-in's tasks:
+                THREAD_EXECUTOR, PROCESS_EXECUTOR or None to run them in the event loop
+        profiler - optional bibframe.profiling.profiler to collect timings of the tasks
+        '''
+        executors = executors or [None] * len(plugins)
+        for kind in executors:
+            if kind not in (None, THREAD_EXECUTOR, PROCESS_EXECUTOR):
+                raise ValueError('Unknown plug-in executor {0}'.format(kind))
+        self.queue_size = queue_size
+        self._logger = logger
+        self._profiler = profiler
+        self._matres_hooks = [ (plugin[BF_MATRES_TASK], kind) for (plugin, kind) in zip(plugins, executors) if BF_MATRES_TASK in plugin ]
+        self._marcrec_hooks = [ (plugin[BF_MARCREC_TASK], kind) for (plugin, kind) in zip(plugins, executors) if BF_MARCREC_TASK in plugin ]
+        self._executors = {}
+        #Materialized resource tasks of the current record, held until its transforms are done
+        self._materialized = []
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        return
+
+    def _executor(self, kind):
+        executor = self._executors.get(kind)
+        if executor is None:
+            if kind == THREAD_EXECUTOR:
+                executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+            else:
+                executor = concurrent.futures.ProcessPoolExecutor()
+            self._executors[kind] = executor
+        return executor
+
+    def materialized(self, model, params):
+        '''
+        Called by materialize_entity for each resource materialized, in place of running the tasks there & then
+
+        model - output model at the time, as passed to the tasks
+        params - materialized resource parameters for the tasks
+        '''
+        if self._matres_hooks: self._materialized.append((model, params))
+        return
+
+    def submit(self, model, params, complete=True):
+        '''
+        Schedule the plug-in tasks of a record whose transforms are done. Returns a concurrent.futures.Future
+        which is done once they all are
+
+        model - the record's output model
+        params - the record's processing parameters (see marc.record_params)
+        complete - if False the record was aborted, so just its materialized resource tasks are run
+        '''
+        materialized, self._materialized = self._materialized, []
+        return asyncio.run_coroutine_threadsafe(self._record_tasks(model, params, materialized, complete), self.loop)
+
+    @asyncio.coroutine
+    def _record_tasks(self, model, params, materialized, complete):
+        tasks = [ self._task(BF_MATRES_TASK, func, kind, mmodel, mparams)
+                    for (mmodel, mparams) in materialized for (func, kind) in self._matres_hooks ]
+        if tasks: yield from asyncio.gather(*tasks, loop=self.loop)
+        if complete:
+            tasks = [ self._task(BF_MARCREC_TASK, func, kind, model, params) for (func, kind) in self._marcrec_hooks ]
+            if tasks: yield from asyncio.gather(*tasks, loop=self.loop)
+        return
+
+    def _task(self, task, func, kind, model, params):
+        if kind is None:
+            return plugin_task(self._profiler, task, func, self.loop, model, params)
+        return self._offload(task, func, kind, model, params)
+
+    @asyncio.coroutine
+    def _offload(self, task, func, kind, model, params):
+        executor = self._executor(kind)
+        if kind == THREAD_EXECUTOR:
+            yield from self.loop.run_in_executor(executor, run_in_thread, self._profiler, task, func, model, params)
+            return
+        #Only what can be pickled goes to the process
+        shipped = { k: v for (k, v) in params.items() if k not in LOCAL_PARAMS }
+        links = [ link for (lid, link) in model ]
+        added = yield from self.loop.run_in_executor(executor, run_in_process, func, links, shipped,
+                                                    getattr(self._logger, 'name', None))
+        if added: model.add_many(added)
+        return
+
+    def close(self):
+        '''
+        Stop the event loop & any executors, once all the tasks submitted are done
+        '''
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        for executor in self._executors.values():
+            executor.shutdown()
+        return
+
+
+def run_in_thread(profiler, task, func, model, params):
+    '''
+    Run a plug-in task coroutine to completion, in an executor thread with its own event loop
+    '''
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(plugin_task(profiler, task, func, loop, model, params))
+    finally:
+        loop.close()
+    return
+
+
+def run_in_process(func, links, params, logger_name):
+    '''
+    Run a plug-in task coroutine to completion in a worker process, on a model with the given links.
+    Returns the links it added
+    '''
+    global _process_loop
+    if _process_loop is None: _process_loop = asyncio.new_event_loop()
+    model = indexed_connection()
+    model.add_many(links)
+    params['logger'] = logging.getLogger(logger_name) if logger_name else logging
+    _process_loop.run_until_complete(func(_process_loop, model, params))
+    #Links are kept in the order added
+    return [ link for (lid, link) in model ][len(links):]
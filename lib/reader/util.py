@@ -68,13 +68,42 @@ class bfcontext(versacontext):
 
 DEFAULT_REL = object()
 
-#SUBFIELDS_CACHE = {}
+#Key under which a field's attributes can carry its subfield index (see index_subfields)
+SUBFIELD_INDEX = '@subfield-index'
+
+_NO_SUBFIELDS = ((), ())
+
+def index_subfields(attrs):
+    '''
+    Parse the subfields from the full structure of attributes, once, into a dict from subfield code
+    (None for all subfields) to a pair of the list of code/value pairs and the list of their ordinal positions,
+    all in the original MARC order
+
+    attrs - A dictionary based on the input XML, including items in the form 'i.c': v where i is a numerical index
+    to preserve the ordering from the original MARC, c is the subfield code and v is the value.
+
+    >>> index_subfields({'tag': '650', 'ind1': '', 'ind2': '0', '2.a': 'Tapestry', '3.z': 'Massachusetts', '10.z': 'Boston'})['z']
+    ([('z', 'Massachusetts'), ('z', 'Boston')], [3, 10])
+    '''
+    index = {None: ([], [])}
+    keyed = []
+    for k, v in attrs.items():
+        ix, sep, this_code = k.partition('.')
+        if sep:
+            #Order numerically, so that e.g. 10.a comes after 2.a
+            keyed.append((int(ix) if ix.isdigit() else sys.maxsize, k, this_code, v))
+    for ix, k, this_code, v in sorted(keyed):
+        for c in (None, this_code):
+            pairs, ixs = index.setdefault(c, ([], []))
+            pairs.append((this_code, v))
+            ixs.append(ix)
+    return index
+
 
-#Can't use functools.lru_cache because of the dict (unhashable) arg
-#@lru_cache()
 def subfields(attrs, code=None, ctx=None):
     '''
     Compute a given subfield from the full structure of attributes. Return a list of code/value pairs.
+    Uses the subfield index if attached to attrs (see index_subfields), otherwise parses the subfields afresh
 
     attrs - A dictionary based on the input XML, including items in the form 'i.c': v where i is a numerical index
     to preserve the ordering from the original MARC, c is the subfield code and v is the value.
@@ -96,17 +125,11 @@ def subfields(attrs, code=None, ctx=None):
     [('z', 'Massachusetts'), ('z', 'Boston')]
 
     '''
-    result = []
-    # If the attributes have their own ordering, use it, otherwise sort
-    attrs_in_order = sorted(attrs.items())
-    for ix, (k, v) in enumerate(attrs_in_order):
-        if '.' in k:
-            this_code = k.rsplit('.')[-1]
-            if code is None or this_code == code:
-                result.append((this_code, v))
-                if ctx and 'current-subfield-ix' in ctx.extras:
-                    ctx.extras['current-subfield-ix'].append(ix)
-    return result
+    index = attrs.get(SUBFIELD_INDEX) or index_subfields(attrs)
+    pairs, ixs = index.get(code, _NO_SUBFIELDS)
+    if ctx and 'current-subfield-ix' in ctx.extras:
+        ctx.extras['current-subfield-ix'].extend(ixs)
+    return list(pairs)
 
 
 class base_transformer(object):
@@ -603,9 +626,13 @@ def materialize(typ, rel=DEFAULT_REL, derive_origin=None, unique=None, links=Non
             ctx.output_model.add(I(origin), I(iri.absolutize(curr_rel, ctx.base)), I(objid), {})
         folded = objid in ctx.existing_ids
         if not folded:
+            #When folding is deferred (e.g. conversion in worker processes, see bibframe.reader.parallel)
+            #the links generated here are tagged so they can be dropped if the resource turns out to be folded
+            enter = getattr(ctx.existing_ids, 'enter', None)
+            fold_attrs = enter(objid, len(_postprocess)) if enter else {}
             for pp in _postprocess:
                 ctx.extras['postprocessing'].append((pp, rels, I(objid)))
-            if _typ: ctx.output_model.add(I(objid), VTYPE_REL, I(iri.absolutize(_typ, ctx.base)), {})
+            if _typ: ctx.output_model.add(I(objid), VTYPE_REL, I(iri.absolutize(_typ, ctx.base)), fold_attrs)
             #FIXME: Should we be using Python Nones to mark blanks, or should Versa define some sort of null resource?
 
             # Create a temporary model to capture attributes generated from this particular materialization, which will later be copied to the real output model in the order preserved from MARC
@@ -665,6 +692,8 @@ def materialize(typ, rel=DEFAULT_REL, derive_origin=None, unique=None, links=Non
             for lid, (tmp_o, tmp_r, tmp_t, tmp_a) in sorted(tmp_omodel, key=lambda l: l[1][ATTRIBUTES].get('source-subfield-ix', sys.maxsize)):
                 #ORIGIN, RELATIONSHIP, TARGET, ATTRIBUTES
                 if 'source-subfield-ix' in tmp_a: del tmp_a['source-subfield-ix']
+                #Links from nested materializations keep their own tag
+                for k, v in fold_attrs.items(): tmp_a.setdefault(k, v)
                 #print("{} moving statement number {} {} to output_model".format(ctx,rids[i], tmp_omodel[rids[i]]))
                 ctx.output_model.add(tmp_o, tmp_r, tmp_t, tmp_a)
                 #rids_to_remove.append(lid)
@@ -675,7 +704,7 @@ def materialize(typ, rel=DEFAULT_REL, derive_origin=None, unique=None, links=Non
 
             #To avoid losing info include subfields which come via Versa attributes
             for k, v in subfields(ctx.current_link[ATTRIBUTES]):
-                ctx.output_model.add(I(objid), I(iri.absolutize('../marcext/sf-' + k, ctx.base)), v, {})
+                ctx.output_model.add(I(objid), I(iri.absolutize('../marcext/sf-' + k, ctx.base)), v, fold_attrs)
             ctx.existing_ids.add(objid)
 
     return _materialize
@@ -9,6 +9,7 @@ from versa import I, VERSA_BASEIRI, ORIGIN, RELATIONSHIP, TARGET, ATTRIBUTES
 
 from bibframe import BF_INIT_TASK, BF_INPUT_TASK, BF_INPUT_XREF_TASK, BF_MARCREC_TASK, BF_MATRES_TASK, BF_FINAL_TASK
 from bibframe.contrib.datachefids import idgen as default_idgen
+from bibframe.profiling import perf_counter, task_key
 
 BL = 'http://bibfra.me/vocab/lite/'
 TYPE_REL = I(iri.absolutize('type', VERSA_BASEIRI))
@@ -18,6 +19,9 @@ from versa.driver import memory
 from versa.util import jsondump, jsonload
 from collections import OrderedDict
 
+#Default maximum number of resource IDs kept by cached_idgen
+ID_CACHE_SIZE = 100000
+
 def hash_neutral_model(stream):
     '''
     >>> VJSON = """[
@@ -66,6 +70,91 @@ def hash_neutral_model(stream):
     return hashmap, stage3
 
 
+class cached_idgen(object):
+    '''
+    Wraps an ID generator (see bibframe.contrib.datachefids.idgen) with a bounded, least recently used
+    cache of resource IDs by their unique data, so that resources which come up again & again
+    (people, subjects, places, publishers...) skip the JSON encoding & hashing in materialize_entity
+
+    >>> from bibframe.contrib.datachefids import idgen
+    >>> ids = cached_idgen(idgen(None), maxsize=1)
+    >>> ids.lookup(('spam',)) is None
+    True
+    >>> ids.store(('spam',), ids.send('spam'))
+    >>> ids.lookup(('spam',))
+    '6Xs8ixJOnDk'
+    >>> ids.store(('eggs',), ids.send('eggs'))
+    >>> ids.lookup(('spam',)) is None #Evicted
+    True
+    >>> ids.hits, ids.misses
+    (1, 2)
+    '''
+    def __init__(self, ids, maxsize=ID_CACHE_SIZE):
+        '''
+        ids - ID generator coroutine
+        maxsize - maximum number of IDs cached. If 0 nothing is
+        '''
+        self._ids = ids
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def send(self, value):
+        return self._ids.send(value)
+
+    def __next__(self):
+        return next(self._ids)
+
+    def __iter__(self):
+        return self
+
+    def lookup(self, key):
+        '''
+        Return the cached ID for the key (see id_cache_key), or None
+        '''
+        eid = self._cache.get(key)
+        if eid is None:
+            self.misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return eid
+
+    def store(self, key, eid):
+        '''
+        Cache the ID for the key, evicting the least recently used if the cache is full
+        '''
+        if self.maxsize <= 0: return
+        self._cache[key] = eid
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return
+
+
+def id_cache_key(vocabbase, etype, data):
+    '''
+    Key under which the ID for a resource is cached, based on everything which goes into its hash,
+    or None if it shouldn't be cached
+    '''
+    key = [vocabbase, etype]
+    for k, v in data:
+        #Only plain strings. Equal values of other types (e.g. 1 & True) needn't serialize alike
+        if not (isinstance(k, str) and isinstance(v, str)): return None
+        key.append(k)
+        key.append(v)
+    return tuple(key)
+
+
+def id_plaintext(vocabbase, data):
+    '''
+    The text hashed for a resource ID, i.e. the JSON of its unique data
+    '''
+    data_full =  [ ((vocabbase + k if not iri.is_absolute(k) else k), v) for (k, v) in data ]
+    return json.dumps(data_full, separators=(',', ':'), cls=OrderedJsonEncoder)
+
+
 #FIXME: Avoid mangling data arg without too much perf hit
 def materialize_entity(etype, ctx_params=None, model_to_update=None, data=None, addtype=True, loop=None, logger=logging):
     '''
@@ -75,6 +164,8 @@ def materialize_entity(etype, ctx_params=None, model_to_update=None, data=None,
 
     data - list of key/value pairs used to compute the hash. If empty the hash will be a default for the entity type
             WARNING: THIS FUNCTION MANGLES THE data ARG
+
+    If the ID generator is a cached_idgen, IDs are looked up there first
     '''
     ctx_params = ctx_params or {}
     vocabbase = ctx_params.get('vocabbase', BL)
@@ -83,29 +174,50 @@ def materialize_entity(etype, ctx_params=None, model_to_update=None, data=None,
     plugins = ctx_params.get('plugins')
     logger = ctx_params.get('logger', logging)
     output_model = ctx_params.get('output_model')
-    ids = ctx_params.get('ids', default_idgen(entbase))
+    ids = ctx_params.get('ids')
+    if ids is None: ids = default_idgen(entbase)
+    profiler = ctx_params.get('profiler')
+    if profiler: start = perf_counter()
     if vocabbase and not iri.is_absolute(etype):
         etype = vocabbase + etype
     params = {'logger': logger}
 
     data = data or []
     if addtype: data.insert(0, [TYPE_REL, etype])
-    data_full =  [ ((vocabbase + k if not iri.is_absolute(k) else k), v) for (k, v) in data ]
-    plaintext = json.dumps(data_full, separators=(',', ':'), cls=OrderedJsonEncoder)
-
-    eid = ids.send(plaintext)
+    lookup = getattr(ids, 'lookup', None)
+    key = id_cache_key(vocabbase, etype, data) if lookup else None
+    eid = lookup(key) if key is not None else None
+    plaintext = None
+
+    if eid is None:
+        if profiler: hash_start = perf_counter()
+        plaintext = id_plaintext(vocabbase, data)
+        eid = ids.send(plaintext)
+        if profiler: profiler.lap('id-hash', etype, hash_start)
+        if key is not None: ids.store(key, eid)
 
     if model_to_update:
         model_to_update.add(I(eid), TYPE_REL, I(etype))
 
     params['materialized_id'] = eid
     params['first_seen'] = eid in existing_ids
+    if plaintext is None and plugins and any(( BF_MATRES_TASK in plugin for plugin in plugins )):
+        #Plug-ins get the plaintext, even if the ID was cached
+        plaintext = id_plaintext(vocabbase, data)
     params['plaintext'] = plaintext
+    plugin_tasks = ctx_params.get('plugin-tasks')
+    if plugin_tasks is not None:
+        #Run concurrently along with the record's other plug-in tasks, once its transforms are done
+        plugin_tasks.materialized(output_model, params)
+        plugins = None
     for plugin in plugins or ():
         #Not using yield from
         if BF_MATRES_TASK in plugin:
+            if profiler: plugin_start = perf_counter()
             for p in plugin[BF_MATRES_TASK](loop, output_model, params): pass
+            if profiler: profiler.lap('plugins', task_key(BF_MATRES_TASK, plugin[BF_MATRES_TASK]), plugin_start)
         #logger.debug("Pending tasks: %s" % asyncio.Task.all_tasks(loop))
+    if profiler: profiler.lap('materialize', etype, start)
     return eid
 
 
@@ -0,0 +1,116 @@
+'''
+Versa canonical form output for a whole conversion run, with bounded memory
+
+The canonical form (as generated by repr() of a versa.driver.memory.connection) is a
+JSON array of all the links, sorted by their JSON serialization. Rather than holding
+the whole run in one model, links are collected into sorted runs which are spilled to
+temporary files once they get big enough, and then merged (k-way) at the end.
+'''
+
+import json
+import heapq
+import tempfile
+
+from versa import I
+from versa.util import OrderedJsonEncoder
+
+#Number of links held in memory before a sorted run is spilled to a temporary file
+DEFAULT_RUN_SIZE = 100000
+
+
+def canonical_entry(link):
+    '''
+    Return (sort key, serialized form within the canonical array) for a link,
+    exactly as the memory model's repr would sort & serialize it
+    '''
+    o, r, t, a = link
+    a = dict(a)
+    key = json.dumps((o, r, t, a), cls=OrderedJsonEncoder)
+    # Mark type of target as a pseudo attribute
+    if isinstance(t, I):
+        a['@target-type'] = '@iri-ref'
+    #Serialize as the sole item of an indented array, then trim the brackets
+    item = json.dumps([(o, r, t, a)], indent=4, cls=OrderedJsonEncoder)[2:-2]
+    return key, item
+
+
+def read_run(f, run_no):
+    '''
+    Yield the (key, run number, position, serialized link) entries of a run spilled to a temporary file
+    '''
+    f.seek(0)
+    for pos, line in enumerate(f):
+        key, item = json.loads(line)
+        yield key, run_no, pos, item
+
+
+class canonical_writer(object):
+    '''
+    Accumulates the links from a series of Versa models (e.g. one per MARC record) then writes them out in canonical form
+
+    >>> from io import StringIO
+    >>> from versa.driver import memory
+    >>> m = memory.connection()
+    >>> m.add_many([('w', 'http://example.org/title', 'Spam', {}), ('w', 'http://example.org/title', 'Eggs', {})])
+    >>> s = StringIO()
+    >>> w = canonical_writer(s, run_size=1)
+    >>> w.add_model(m)
+    >>> w.close()
+    >>> s.getvalue() == repr(m)
+    True
+    '''
+    def __init__(self, out, run_size=DEFAULT_RUN_SIZE):
+        '''
+        out - output text stream
+        run_size - number of links to be sorted in memory at a time
+        '''
+        self._out = out
+        self._run_size = run_size
+        self._entries = []
+        self._runs = []
+        return
+
+    def add_model(self, model):
+        '''
+        Add the links in the model, e.g. the output for one record
+        '''
+        for (lid, link) in model:
+            self._entries.append(canonical_entry(link))
+            if len(self._entries) >= self._run_size: self._spill()
+        return
+
+    def _spill(self):
+        #Sort is stable, so links with the same key stay in the order they came in, as with sorted()
+        self._entries.sort(key=lambda e: e[0])
+        f = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        for entry in self._entries:
+            f.write(json.dumps(entry))
+            f.write('\n')
+        self._runs.append(f)
+        self._entries = []
+        return
+
+    def close(self):
+        '''
+        Merge the sorted runs and write out the canonical form. Doesn't close the output stream
+        '''
+        if self._runs and self._entries: self._spill()
+        if self._runs:
+            #Run number & position break ties between equal keys, to keep them in the order they came in
+            merged = heapq.merge(*[ read_run(f, run_no) for (run_no, f) in enumerate(self._runs) ])
+        else:
+            self._entries.sort(key=lambda e: e[0])
+            merged = ( (key, 0, 0, item) for (key, item) in self._entries )
+
+        write = self._out.write
+        first = True
+        for key, run_no, pos, item in merged:
+            write('[\n' if first else ',\n')
+            write(item)
+            first = False
+        write('[]' if first else '\n]')
+
+        for f in self._runs: f.close()
+        self._runs = []
+        self._entries = []
+        return
@@ -0,0 +1,267 @@
+'''
+Streaming RDF output (N-Triples & Turtle) straight from the Versa model, without rdflib
+
+Each batch of resources (e.g. those generated from one MARC record) is written out as it's
+processed, so memory use doesn't grow with the size of the input. Unlike an rdflib graph
+there is no de-duplication of statements across batches, just within each one
+'''
+
+import io
+import re
+import logging
+
+from amara3 import iri
+
+from versa import I, VERSA_BASEIRI, ORIGIN, RELATIONSHIP, TARGET
+
+from bibframe import MARC, MARCEXT
+
+RDF_NS = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+RDFS_NS = 'http://www.w3.org/2000/01/rdf-schema#'
+XSD_NS = 'http://www.w3.org/2001/XMLSchema#'
+
+VTYPE_REL = I(iri.absolutize('type', VERSA_BASEIRI))
+VLABEL_REL = I(iri.absolutize('label', VERSA_BASEIRI))
+
+RDF_TYPE = RDF_NS + 'type'
+
+PROP_MAP = {
+    VTYPE_REL: RDF_TYPE,
+    VLABEL_REL: RDFS_NS + 'label',
+}
+
+#Datatypes for non-string literals, as rdflib would assign them
+LITERAL_TYPES = [
+    (bool, XSD_NS + 'boolean'),
+    (int, XSD_NS + 'integer'),
+    (float, XSD_NS + 'double'),
+]
+
+#Prefixes declared for Turtle output unless overridden
+DEFAULT_PREFIXES = {
+    'rdf': RDF_NS,
+    'rdfs': RDFS_NS,
+    'xsd': XSD_NS,
+    'marc': MARC,
+    'marcext': MARCEXT,
+}
+
+#Characters which must be escaped within an IRI
+IRI_ESCAPE_PAT = re.compile('[\x00-\x20<>"{}|^`\\\\]')
+#Characters which must be escaped within a quoted literal
+LITERAL_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'}
+LITERAL_ESCAPE_PAT = re.compile('[\\\\"\n\r]')
+#Conservative subset of Turtle's PN_LOCAL, for prefixed names
+LOCAL_NAME_PAT = re.compile('^[A-Za-z0-9_]([A-Za-z0-9_.-]*[A-Za-z0-9_-])?$')
+
+
+def iri_term(i):
+    return '<' + IRI_ESCAPE_PAT.sub(lambda m: '\\u{0:04X}'.format(ord(m.group())), i) + '>'
+
+
+def literal_term(val):
+    for pytype, datatype in LITERAL_TYPES:
+        if isinstance(val, pytype):
+            lexical = str(val).lower() if pytype is bool else str(val)
+            return '"' + lexical + '"^^<' + datatype + '>'
+    return '"' + LITERAL_ESCAPE_PAT.sub(lambda m: LITERAL_ESCAPES[m.group()], str(val)) + '"'
+
+
+def prep(stmt):
+    '''
+    Prepare a statement into a triple of (subject IRI, predicate IRI, object),
+    where the object is an IRI only if it's an I instance, and otherwise a literal value
+    '''
+    s, p, o = stmt[:3]
+    #Translate v:type to rdf:type etc.
+    p = PROP_MAP.get(p, p)
+    return s, p, o
+
+
+def resource_statements(source, to_ignore=None):
+    '''
+    Yield (resource ID, list of triples) for each typed resource in the Versa model,
+    in model order, with duplicate triples dropped
+
+    to_ignore - optional collection of resource IDs to skip
+    '''
+    seen = set()
+    #Hoover up everything with a type
+    for stmt in source.match(None, VTYPE_REL, None):
+        rid = stmt[ORIGIN]
+        if rid in seen or (to_ignore and rid in to_ignore): continue
+        seen.add(rid)
+        triples = []
+        #Dedup within the resource, keeping order
+        triples_seen = set()
+        for s in source.match(rid):
+            triple = prep(s)
+            if triple not in triples_seen:
+                triples_seen.add(triple)
+                triples.append(triple)
+        yield rid, triples
+
+
+class ntriples_writer(object):
+    '''
+    Writes N-Triples to a stream, batch by batch
+
+    >>> from io import StringIO
+    >>> from versa.driver import memory
+    >>> m = memory.connection()
+    >>> m.add_many([('http://example.org/w', VTYPE_REL, I('http://bibfra.me/vocab/lite/Work'), {}),
+    ...     ('http://example.org/w', I('http://bibfra.me/vocab/lite/title'), 'Beware of "pity"', {})])
+    >>> s = StringIO()
+    >>> ntriples_writer(s).process(m)
+    >>> print(s.getvalue(), end='')
+    <http://example.org/w> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://bibfra.me/vocab/lite/Work> .
+    <http://example.org/w> <http://bibfra.me/vocab/lite/title> "Beware of \\"pity\\"" .
+    '''
+    def __init__(self, out):
+        '''
+        out - stream to which to write. If it's not a text stream, UTF-8 encoded bytes are written
+        '''
+        self._out = out
+        self._binary = not isinstance(out, io.TextIOBase)
+        return
+
+    def write(self, text):
+        self._out.write(text.encode('utf-8') if self._binary else text)
+        return
+
+    def term(self, val):
+        return iri_term(val) if isinstance(val, I) else literal_term(val)
+
+    def process(self, source, to_ignore=None, logger=logging):
+        '''
+        Write out the typed resources in an in-memory BIBFRAME model
+
+        source - Versa model
+        to_ignore - optional collection of resource IDs to skip
+        '''
+        chunks = []
+        for rid, triples in resource_statements(source, to_ignore):
+            for s, p, o in triples:
+                chunks.append('{0} {1} {2} .\n'.format(iri_term(s), iri_term(p), self.term(o)))
+        if chunks: self.write(''.join(chunks))
+        return
+
+    def state(self):
+        '''
+        Return what's needed to carry on the output elsewhere (see resume)
+        '''
+        return None
+
+    def resume(self, state):
+        '''
+        Carry on output written up to some point by another writer (e.g. in an interrupted run)
+
+        state - from the other writer's state method
+        '''
+        return
+
+    def close(self):
+        '''
+        Finish off the output. Doesn't close the stream
+        '''
+        return
+
+
+class turtle_writer(ntriples_writer):
+    '''
+    Writes Turtle to a stream, batch by batch, grouping statements by subject
+    and abbreviating IRIs in the namespaces of the given prefixes
+
+    >>> from io import StringIO
+    >>> from versa.driver import memory
+    >>> m = memory.connection()
+    >>> m.add_many([('http://example.org/w', VTYPE_REL, I('http://bibfra.me/vocab/lite/Work'), {}),
+    ...     ('http://example.org/w', I('http://bibfra.me/vocab/lite/title'), 'Beware of pity', {})])
+    >>> s = StringIO()
+    >>> w = turtle_writer(s, {'vb': 'http://bibfra.me/vocab/lite/'})
+    >>> w.process(m)
+    >>> print(s.getvalue(), end='')
+    @prefix marc: <http://bibfra.me/vocab/marc/> .
+    @prefix marcext: <http://bibfra.me/vocab/marcext/> .
+    @prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+    @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+    @prefix vb: <http://bibfra.me/vocab/lite/> .
+    @prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+    <BLANKLINE>
+    <http://example.org/w> a vb:Work ;
+        vb:title "Beware of pity" .
+    <BLANKLINE>
+    '''
+    def __init__(self, out, prefixes=None):
+        '''
+        out - stream to which to write. If it's not a text stream, UTF-8 encoded bytes are written
+        prefixes - optional mapping from prefix to namespace IRI, in addition to (or overriding) DEFAULT_PREFIXES
+        '''
+        super().__init__(out)
+        all_prefixes = DEFAULT_PREFIXES.copy()
+        all_prefixes.update(prefixes or {})
+        #Namespace to prefix. Where a namespace is bound more than once the explicitly given prefix wins
+        self._ns_prefix = {}
+        for prefix, ns in sorted(DEFAULT_PREFIXES.items()) + sorted((prefixes or {}).items()):
+            self._ns_prefix[str(ns)] = prefix
+        self._prefixes = sorted(all_prefixes.items())
+        self._started = False
+        return
+
+    def compact(self, i):
+        '''
+        Abbreviate an IRI using the bound prefixes if possible
+        '''
+        cut = max(i.rfind('/'), i.rfind('#')) + 1
+        prefix = self._ns_prefix.get(i[:cut]) if cut else None
+        if prefix is not None and LOCAL_NAME_PAT.match(i[cut:]):
+            return prefix + ':' + i[cut:]
+        return iri_term(i)
+
+    def term(self, val):
+        return self.compact(val) if isinstance(val, I) else literal_term(val)
+
+    def start(self):
+        if self._started: return
+        self._started = True
+        self.write(''.join([ '@prefix {0}: {1} .\n'.format(prefix, iri_term(ns)) for (prefix, ns) in self._prefixes ]) + '\n')
+        return
+
+    def process(self, source, to_ignore=None, logger=logging):
+        '''
+        Write out the typed resources in an in-memory BIBFRAME model
+
+        source - Versa model
+        to_ignore - optional collection of resource IDs to skip
+        '''
+        self.start()
+        chunks = []
+        for rid, triples in resource_statements(source, to_ignore):
+            #Group objects by predicate, keeping the order in which each predicate first appears
+            by_pred = {}
+            preds = []
+            for s, p, o in triples:
+                if p not in by_pred:
+                    by_pred[p] = []
+                    preds.append(p)
+                by_pred[p].append(self.term(o))
+            body = ' ;\n    '.join([ ('a' if p == RDF_TYPE else self.compact(p)) + ' ' + ', '.join(by_pred[p]) for p in preds ])
+            chunks.append('{0} {1} .\n\n'.format(self.compact(rid), body))
+        if chunks: self.write(''.join(chunks))
+        return
+
+    def state(self):
+        return self._started
+
+    def resume(self, state):
+        #Prefixes are only declared if the other writer hadn't already
+        self._started = state
+        return
+
+    def close(self):
+        '''
+        Finish off the output. Doesn't close the stream
+        '''
+        #Make sure there are prefix declarations even if there were no resources
+        self.start()
+        return
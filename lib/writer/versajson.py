@@ -0,0 +1,90 @@
+'''
+Streaming Versa JSON output, record by record
+
+Links are serialized one at a time straight from the model iterator, so there's no
+list of links or big JSON string built up per record. The default is a single JSON array
+of the [link ID, [origin, rel, target, attributes]] pairs from each record's model,
+as read by versa.util.jsonload. In NDJSON mode each of those pairs goes on a line of its own,
+so the output can be split & loaded in parallel without parsing one giant array.
+'''
+
+import json
+
+
+class versajson_writer(object):
+    '''
+    Writes the links from a series of Versa models (e.g. one per MARC record) to a text stream
+
+    >>> from io import StringIO
+    >>> from versa.driver import memory
+    >>> m = memory.connection()
+    >>> m.add_many([('w', 'http://example.org/title', 'Spam', {}), ('w', 'http://example.org/title', 'Eggs', {})])
+    >>> s = StringIO()
+    >>> w = versajson_writer(s, ndjson=True)
+    >>> w.start()
+    >>> w.write_model(m)
+    >>> w.close()
+    >>> print(s.getvalue(), end='')
+    [0, ["w", "http://example.org/title", "Spam", {}]]
+    [1, ["w", "http://example.org/title", "Eggs", {}]]
+    '''
+    def __init__(self, out, ndjson=False):
+        '''
+        out - output text stream
+        ndjson - if True write one link per line rather than a JSON array
+        '''
+        self._out = out
+        self._ndjson = ndjson
+        self._encode = json.JSONEncoder().encode
+        self._first_link = True
+        return
+
+    def start(self):
+        '''
+        Start off the output, before any models are written
+        '''
+        if not self._ndjson: self._out.write('[')
+        return
+
+    def state(self):
+        '''
+        Return what's needed to carry on the output elsewhere (see resume)
+        '''
+        return not self._first_link
+
+    def resume(self, state):
+        '''
+        Carry on output which was started & written up to some point by another writer
+        (e.g. in an interrupted run), rather than calling start
+
+        state - from the other writer's state method
+        '''
+        self._first_link = not state
+        return
+
+    def write_model(self, model):
+        '''
+        Write out the links in the model, e.g. the output for one record
+        '''
+        write, encode = self._out.write, self._encode
+        if self._ndjson:
+            for link in model:
+                write(encode(link))
+                write('\n')
+            return
+
+        #Within the array, a record's links go on one line
+        sep = ', ' if self._first_link else ',\n'
+        for link in model:
+            if not self._first_link: write(sep)
+            write(encode(link))
+            self._first_link = False
+            sep = ', '
+        return
+
+    def close(self):
+        '''
+        Finish off the output, after all models are written. Doesn't close the stream
+        '''
+        if not self._ndjson: self._out.write(']')
+        return
@@ -0,0 +1,69 @@
+'''
+Test reading selected records from MARC/XML via the record index against reading the whole file
+
+Requires http://pytest.org/ e.g.:
+
+pip install pytest
+
+----
+'''
+
+import os
+import logging
+from io import BytesIO
+
+from versa.driver import memory
+from amara3.inputsource import inputsource
+
+from bibframe.reader.marcxml import handle_marcxml_source
+from bibframe.reader.marcxmlindex import record_index
+
+RESOURCEPATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource'))
+
+
+def read_records(stream):
+    '''
+    Return the links of each record read from the MARC/XML, without the record IDs (which depend on position)
+    '''
+    records = []
+    def sink():
+        while True:
+            model = yield
+            records.append([ (r, t, a) for (lid, (o, r, t, a)) in model ])
+    handle_marcxml_source(inputsource(stream), sink(), {'lax': False}, logging, memory.connection)
+    return records
+
+
+def test_selected_records_as_in_full():
+    with open(os.path.join(RESOURCEPATH, 'GW_bf_test10.mrx'), 'rb') as f:
+        data = f.read()
+    full = read_records(BytesIO(data))
+    index = record_index.build(BytesIO(data), chunk_size=100)
+    assert len(index.records) == len(full) == 11
+
+    #Each record on its own
+    for ix, entry in enumerate(index.records):
+        assert read_records(index.source(BytesIO(data), [entry])) == [full[ix]]
+    [(start, end, control_number)] = index.lookup('11370073')
+    assert data[start:end].startswith(b'<record>') and data[start:end].endswith(b'</record>')
+
+    #Shards split the records between them, in order
+    from_shards = []
+    for start, end in index.shards(3):
+        from_shards.extend(read_records(index.source(BytesIO(data), index.in_range(start, end))))
+    assert from_shards == full
+
+
+def test_sidecar_roundtrip():
+    with open(os.path.join(RESOURCEPATH, 'GW_bf_test10.mrx'), 'rb') as f:
+        index = record_index.build(f)
+    s = BytesIO()
+    index.write(s)
+    s.seek(0)
+    reread = record_index.read(s)
+    assert reread.records == index.records
+    assert reread.namespaces == {'': 'http://www.loc.gov/MARC21/slim'}
+
+
+if __name__ == '__main__':
+    raise SystemExit("use py.test")
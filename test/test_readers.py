@@ -0,0 +1,318 @@
+'''
+Test the binary MARC (ISO 2709), MARC-in-JSON and lxml based MARC/XML readers against the (expat based) MARC/XML reader
+
+Requires http://pytest.org/ e.g.:
+
+pip install pytest
+
+----
+'''
+
+import os
+import bz2
+import gzip
+import lzma
+import json
+import asyncio
+import zipfile
+from io import StringIO, BytesIO
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from versa import I
+from versa.driver import memory
+from amara3.inputsource import inputsource
+
+from bibframe.reader import bfconvert, VTYPE_REL
+
+RESOURCEPATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource'))
+
+MARCXML_NS = '{http://www.loc.gov/MARC21/slim}'
+ISO2709_HANDLER = 'http://bibfra.me/tool/pybibframe/marchandler#iso2709'
+MARCJSON_HANDLER = 'http://bibfra.me/tool/pybibframe/marchandler#marcjson'
+LXML_HANDLER = 'http://bibfra.me/tool/pybibframe/marchandler#marcxml-lxml'
+
+
+def marcxml_to_iso2709(fname):
+    '''
+    Bare bones MARC/XML to binary MARC conversion, for the sake of test data
+    '''
+    out = BytesIO()
+    for rec in ET.parse(fname).getroot().iter(MARCXML_NS + 'record'):
+        directory, data = b'', b''
+        for field in rec:
+            if field.tag == MARCXML_NS + 'controlfield':
+                fdata = (field.text or '').encode('utf-8')
+            elif field.tag == MARCXML_NS + 'datafield':
+                fdata = (field.get('ind1', ' ') + field.get('ind2', ' ')).encode('utf-8')
+                for sf in field:
+                    fdata += b'\x1f' + (sf.get('code') + (sf.text or '')).encode('utf-8')
+            else:
+                continue
+            fdata += b'\x1e'
+            directory += '{0}{1:04}{2:05}'.format(field.get('tag'), len(fdata), len(data)).encode('ascii')
+            data += fdata
+        base = 24 + len(directory) + 1
+        reclen = base + len(data) + 1
+        leader = rec.find(MARCXML_NS + 'leader').text.ljust(24)
+        leader = '{0:05}{1}a{2}{3:05}{4}'.format(reclen, leader[5:9], leader[10:12], base, leader[17:])
+        out.write(leader.encode('ascii') + directory + b'\x1e' + data + b'\x1d')
+    return out.getvalue()
+
+
+def marcxml_to_marcjson(fname):
+    '''
+    MARC/XML to newline-delimited MARC-in-JSON
+    '''
+    lines = []
+    for rec in ET.parse(fname).getroot().iter(MARCXML_NS + 'record'):
+        fields = []
+        for field in rec:
+            if field.tag == MARCXML_NS + 'controlfield':
+                fields.append({field.get('tag'): field.text or ''})
+            elif field.tag == MARCXML_NS + 'datafield':
+                subfields = [ {sf.get('code'): sf.text or ''} for sf in field ]
+                fields.append({field.get('tag'): {'ind1': field.get('ind1', ' '), 'ind2': field.get('ind2', ' '), 'subfields': subfields}})
+        lines.append(json.dumps({'leader': rec.find(MARCXML_NS + 'leader').text, 'fields': fields}))
+    return '\n'.join(lines).encode('utf-8')
+
+
+def marcxml_as_is(fname):
+    with open(fname, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('name', ['zweig', 'gunslinger', 'pervomu'])
+@pytest.mark.parametrize('convert,handler', [(marcxml_to_iso2709, ISO2709_HANDLER), (marcxml_to_marcjson, MARCJSON_HANDLER),
+                                            (marcxml_as_is, LXML_HANDLER)])
+def test_same_as_marcxml(name, convert, handler):
+    fname = os.path.join(RESOURCEPATH, name+'.mrx')
+    outputs = []
+    for inp, config in ((open(fname, 'rb'), None),
+                        (BytesIO(convert(fname)), {'marc_record_handler': handler})):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        s = StringIO()
+        bfconvert([inp], entbase='http://example.org/', model=memory.connection(), out=s, config=config, canonical=True, loop=loop)
+        outputs.append(s.getvalue())
+
+    assert outputs[0] == outputs[1]
+
+
+def convert_canonical(inputs, config=None):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(None)
+    s = StringIO()
+    bfconvert(inputs, entbase='http://example.org/', model=memory.connection(), out=s, canonical=True, loop=loop, config=config)
+    return s.getvalue()
+
+
+@pytest.mark.parametrize('compress', [gzip.compress, bz2.compress, lzma.compress])
+def test_compressed_source(compress):
+    fname = os.path.join(RESOURCEPATH, 'zweig.mrx')
+    with open(fname, 'rb') as f:
+        data = f.read()
+    assert convert_canonical([BytesIO(compress(data))]) == convert_canonical([BytesIO(data)])
+
+
+def test_zip_members_as_sources():
+    #Each member is a separate source, just as if the files had been given one by one
+    with zipfile.ZipFile(os.path.join(RESOURCEPATH, 'std-examples.zip')) as zf:
+        members = [ BytesIO(zf.read(name)) for name in zf.namelist() ]
+    with open(os.path.join(RESOURCEPATH, 'std-examples.zip'), 'rb') as f:
+        assert convert_canonical([f]) == convert_canonical(members)
+
+
+def test_converter_session():
+    from bibframe.reader import converter
+    from bibframe.writer.canonical import canonical_writer
+    fname = os.path.join(RESOURCEPATH, 'zweig.mrx')
+    #Made up IDs follow on throughout the session, unless seeded per record
+    with converter(entbase='http://example.org/', config={'record-seeded-ids': True}) as conv:
+        assert conv.convert(open(fname, 'rb')) is not None
+        model = conv.convert(open(fname, 'rb'))
+        records = []
+        def sink():
+            while True:
+                records.append((yield))
+        conv.handle_marc_source(inputsource(open(fname, 'rb')), sink(), {'lax': False}, None, conv.model_factory)
+        existing_ids = set()
+        one_by_one = [ conv.convert_record(rec, existing_ids=existing_ids) for rec in records ]
+
+    def canonical(models):
+        s = StringIO()
+        w = canonical_writer(s)
+        for m in models: w.add_model(m)
+        w.close()
+        return s.getvalue()
+    assert canonical([model]) == canonical(one_by_one)
+    assert canonical([model]) == convert_canonical([open(fname, 'rb')], config={'record-seeded-ids': True})
+
+
+def test_iterconvert():
+    import threading
+    from bibframe.reader import converter
+    fname = os.path.join(RESOURCEPATH, 'GW_bf_test10.mrx')
+    config = {'record-seeded-ids': True}
+    with converter(entbase='http://example.org/', config=config) as conv:
+        model = conv.convert(open(fname, 'rb'))
+        results = list(conv.iterconvert(open(fname, 'rb'), read_ahead=2))
+        assert len(results) == 11
+        assert [ link for r in results for link in r.links ] == [ link for (lid, link) in model ]
+        for r in results:
+            assert r.work_id and r.instance_ids
+            assert (r.work_id, VTYPE_REL, I('http://bibfra.me/vocab/lite/Work'), {}) in r.links
+
+        #Stopping early stops the reading too
+        threads = threading.active_count()
+        for r in conv.iterconvert(open(fname, 'rb'), read_ahead=1):
+            break
+        assert threading.active_count() == threads
+
+
+def test_profile():
+    import bibframe.plugin
+    fname = os.path.join(RESOURCEPATH, 'zweig.mrx')
+    config = {'plugins': [{'id': 'http://bibfra.me/tool/pybibframe#labelizer',
+                            'lookup': {'http://bibfra.me/vocab/lite/Work': {'properties': ['http://bibfra.me/vocab/lite/title']}}}]}
+    expected = convert_canonical([open(fname, 'rb')], config=config)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(None)
+    s, profile = StringIO(), StringIO()
+    bfconvert([open(fname, 'rb')], entbase='http://example.org/', model=memory.connection(), out=s, canonical=True, loop=loop,
+                config=config, profile=profile)
+    #Profiling doesn't change the output
+    assert s.getvalue() == expected
+    report = json.loads(profile.getvalue())
+    assert report['transforms']['245$a']['calls'] >= 1
+    assert set(report['specials']) == {'leader', '006', '007', '008'}
+    #Two records
+    assert report['phases']['bootstrap']['calls'] == report['phases']['main']['calls'] == 2
+    assert report['plugins']['marcrec labelizer.handle_record_links']['calls'] == 2
+    assert report['materialize']['http://bibfra.me/vocab/lite/Work']['calls'] >= 2
+    assert report['id-hash']['http://bibfra.me/vocab/lite/Work']['calls'] >= 2
+
+
+def test_id_cache():
+    from bibframe.reader import converter
+    fname = os.path.join(RESOURCEPATH, 'GW_bf_test10.mrx')
+    #Same IDs whether they're cached or not, however small the cache
+    expected = convert_canonical([open(fname, 'rb')], config={'id-cache-size': 0})
+    assert convert_canonical([open(fname, 'rb')], config={'id-cache-size': 3}) == expected
+    with converter(entbase='http://example.org/') as conv:
+        conv.convert(open(fname, 'rb'))
+        misses = conv.ids.misses
+        assert conv.ids.hits > 0
+        #All the resources have been seen before
+        conv.convert(open(fname, 'rb'))
+        assert conv.ids.misses == misses
+
+
+def test_packed_existing_ids():
+    fname = os.path.join(RESOURCEPATH, 'GW_bf_test10.mrx')
+    expected = convert_canonical([open(fname, 'rb')])
+    #Small enough to grow, on disk, during the run
+    config = {'existing-ids-cls': 'bibframe.idstore.packed_id_set',
+                'existing-ids-args': {'capacity': 4, 'bloom': True, 'spill_bytes': 64}}
+    assert convert_canonical([open(fname, 'rb')], config=config) == expected
+
+
+def test_incremental(tmpdir):
+    import re
+    store = str(tmpdir.join('fingerprints'))
+    config = {'record-seeded-ids': True}
+    with open(os.path.join(RESOURCEPATH, 'GW_bf_test10.mrx'), 'rb') as f:
+        data = f.read()
+
+    def convert(data, **kwargs):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        s = StringIO()
+        bfconvert([BytesIO(data)], entbase='http://example.org/', model=memory.connection(), out=s,
+                    canonical=True, loop=loop, config=config, fingerprints=store, **kwargs)
+        return json.loads(s.getvalue())
+
+    assert convert(data) == json.loads(convert_canonical([BytesIO(data)], config=config))
+    #Nothing's changed
+    assert convert(data) == []
+
+    #Change one record & drop another
+    starts = [ m.start() for m in re.finditer(b'<record', data) ]
+    changed = data[:starts[1]] + data[starts[2]:]
+    changed = changed.replace(b'The Medieval mind', b'The Mediaeval mind')
+    deleted = StringIO()
+    links = convert(changed, deleted=deleted)
+    #Just the changed record is converted
+    just_changed = changed[:starts[1]] + b'</collection>'
+    assert b'The Mediaeval mind' in just_changed
+    assert links == json.loads(convert_canonical([BytesIO(just_changed)], config=config))
+    assert deleted.getvalue() == '11370073\n'
+
+
+class failing_stream(BytesIO):
+    '''
+    Stream which fails once reading gets past a given point, as if the run had been interrupted
+    '''
+    def __init__(self, data, fail_at):
+        super().__init__(data)
+        self.fail_at = fail_at
+
+    def read(self, size=-1):
+        if self.tell() >= self.fail_at: raise IOError('Interrupted')
+        return super().read(min(size, 1024) if size > 0 else 1024)
+
+
+def test_checkpoint_resume(tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint'))
+    with open(os.path.join(RESOURCEPATH, 'GW_bf_test10.mrx'), 'rb') as f:
+        data = f.read()
+
+    def convert(stream, prefix, **kwargs):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        with open(str(tmpdir.join(prefix + '.json')), 'a', encoding='utf-8') as out, \
+                open(str(tmpdir.join(prefix + '.nt')), 'ab') as rdfnt:
+            bfconvert([stream], entbase='http://example.org/', model=memory.connection(), out=out, rdfnt=rdfnt,
+                        loop=loop, **kwargs)
+        return [ tmpdir.join(prefix + ext).read_binary() for ext in ('.json', '.nt') ]
+
+    full = convert(BytesIO(data), 'full')
+    with pytest.raises(IOError):
+        convert(failing_stream(data, len(data) * 2 // 3), 'resumed', checkpoint=checkpoint, checkpoint_every=2)
+    assert os.path.exists(checkpoint)
+    assert convert(BytesIO(data), 'resumed', checkpoint=checkpoint, checkpoint_every=2, resume=True) == full
+    assert not os.path.exists(checkpoint)
+
+
+@pytest.mark.parametrize('executor', [None, 'thread', 'process'])
+def test_concurrent_plugin_tasks(executor):
+    import bibframe.plugin
+    fname = os.path.join(RESOURCEPATH, 'GW_bf_test10.mrx')
+    labelizer = {'id': 'http://bibfra.me/tool/pybibframe#labelizer',
+                    'lookup': {'http://bibfra.me/vocab/lite/Work': {'properties': ['http://bibfra.me/vocab/lite/title']},
+                                'http://bibfra.me/vocab/lite/Person': {'properties': ['http://bibfra.me/vocab/lite/name']}}}
+    expected = convert_canonical([open(fname, 'rb')], config={'plugins': [labelizer]})
+    assert 'http://www.w3.org/2000/01/rdf-schema#label' in expected
+    labelizer = dict(labelizer, executor=executor)
+    #Same output, with tasks of up to 3 records outstanding at once
+    assert convert_canonical([open(fname, 'rb')], config={'plugins': [labelizer], 'plugin-queue-size': 3}) == expected
+
+
+def test_chunked_text_normalized():
+    #Long text comes from expat in several chunks, which can split a character from a following combining accent
+    from bibframe.reader.marcxml import handle_marcxml_source
+    doc = ('''<collection xmlns="http://www.loc.gov/MARC21/slim"><record>
+<datafield tag="500" ind1=" " ind2=" "><subfield code="a">{0}</subfield></datafield>
+</record></collection>'''.format('Cafe\u0301 ' * 5000)).encode('utf-8')
+    models = []
+    def sink():
+        while True:
+            models.append((yield))
+    handle_marcxml_source(inputsource(BytesIO(doc)), sink(), {'lax': False}, None, memory.connection)
+    [(lid, (o, r, t, a))] = list(models[0])
+    assert a['2.a'] == 'Caf\xe9 ' * 5000
+
+
+if __name__ == '__main__':
+    raise SystemExit("use py.test")
@@ -94,5 +94,104 @@ def test_model_consumed():
     assert m.size() == 0, 'Model not consumed:\n'+repr(m)
 
 
+def test_limit_stops_parse():
+    #Once the record limit is reached the rest of the input shouldn't even be read
+    with open(os.path.join(RESOURCEPATH, 'zweig.mrx'), 'rb') as f:
+        doc = f.read()
+    start, end = doc.index(b'<marc:record>'), doc.rindex(b'</marc:collection>')
+    doc = doc[:start] + doc[start:end]*200 + doc[end:]
+    stream = BytesIO(doc)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(None)
+    bfconvert([stream], entbase='http://example.org/', out=StringIO(), limit=1, loop=loop)
+    assert stream.tell() < len(doc)//10
+
+
+@pytest.mark.parametrize('name', ['zweig', 'princeton-holdings1'])
+def test_parallel_same_output(name):
+    #Conversion across worker processes should give the same output, folding included
+    fname = os.path.join(RESOURCEPATH, name+'.mrx')
+    outputs = []
+    for workers in (None, 2):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        s = StringIO()
+        bfconvert([open(fname, 'rb')], entbase='http://example.org/', model=memory.connection(), out=s, loop=loop, workers=workers)
+        outputs.append(s.getvalue())
+
+    assert outputs[0] == outputs[1], "Discrepancies found for {0}:\n{1}".format(name, file_diff(*outputs))
+
+
+@pytest.mark.parametrize('name', ['zweig', 'princeton-holdings1'])
+def test_indexed_model_same_output(name):
+    #The default, indexed model should give the same output as the plain Versa memory model
+    fname = os.path.join(RESOURCEPATH, name+'.mrx')
+    outputs = []
+    for config in (None, {'versa-model-cls': 'versa.driver.memory.connection'}):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        s = StringIO()
+        bfconvert([open(fname, 'rb')], entbase='http://example.org/', out=s, config=config, loop=loop)
+        outputs.append(s.getvalue())
+
+    assert outputs[0] == outputs[1], "Discrepancies found for {0}:\n{1}".format(name, file_diff(*outputs))
+
+
+def test_ndjson_output():
+    #NDJSON output has the same links as the JSON array, one per line
+    import json
+    fname = os.path.join(RESOURCEPATH, 'zweig.mrx')
+    outputs = []
+    for ndjson in (False, True):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        s = StringIO()
+        bfconvert([open(fname, 'rb')], entbase='http://example.org/', out=s, loop=loop, ndjson=ndjson)
+        outputs.append(s.getvalue())
+
+    assert [ json.loads(line) for line in outputs[1].splitlines() ] == json.loads(outputs[0])
+
+
+def test_canonical_external_sort():
+    #Canonical form merged from many small sorted runs should match the memory model's canonical form
+    from versa import I
+    from bibframe.writer.canonical import canonical_writer
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(None)
+    fname = os.path.join(RESOURCEPATH, 'zweig.mrx')
+    s = StringIO()
+    bfconvert([open(fname, 'rb')], entbase='http://example.org/', out=s, loop=loop)
+    s.seek(0)
+    m = memory.connection()
+    jsonload(m, s)
+    #Raw Versa JSON doesn't mark IRI targets
+    links = [ (o, r, I(t) if t.startswith('http') else t, a) for (lid, (o, r, t, a)) in m ]
+    m = memory.connection()
+    m.add_many(links)
+
+    out = StringIO()
+    w = canonical_writer(out, run_size=7)
+    w.add_model(m)
+    w.close()
+    assert out.getvalue() == repr(m)
+
+
+@pytest.mark.parametrize('name', ['zweig', 'princeton-holdings1'])
+def test_streaming_rdf(name):
+    #Streamed Turtle & N-Triples should amount to the same graph as rdflib generates for RDF/XML
+    rdflib = pytest.importorskip('rdflib')
+    from rdflib.compare import isomorphic
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(None)
+    fname = os.path.join(RESOURCEPATH, name+'.mrx')
+    ttl, nt, rdfxml = BytesIO(), BytesIO(), BytesIO()
+    bfconvert([open(fname, 'rb')], entbase='http://example.org/', model=memory.connection(), out=StringIO(),
+                rdfttl=ttl, rdfnt=nt, rdfxml=rdfxml, loop=loop)
+
+    expected = rdflib.Graph().parse(data=rdfxml.getvalue(), format='xml')
+    assert isomorphic(rdflib.Graph().parse(data=ttl.getvalue(), format='turtle'), expected)
+    assert isomorphic(rdflib.Graph().parse(data=nt.getvalue(), format='nt'), expected)
+
+
 if __name__ == '__main__':
     raise SystemExit("use py.test")